@@ -0,0 +1,338 @@
+import hmac
+import io
+import ipaddress
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+AGENT_HOST: str = "127.0.0.1"
+AGENT_PORT: int = 8765
+AGENT_TOKEN_ENV: str = "FRANZ_AGENT_TOKEN"
+MESSAGE_HEADER: struct.Struct = struct.Struct(">BBIiI")
+KIND_HELLO: int = 1
+KIND_REQUEST: int = 2
+KIND_REPLY: int = 3
+KIND_PING: int = 4
+KIND_PONG: int = 5
+FLAG_ZLIB: int = 1
+COMPRESS_MIN_BYTES: int = 4096
+COMPRESS_LEVEL: int = 1
+MAX_MESSAGE_BYTES: int = 512 * 1024 * 1024
+HEARTBEAT_INTERVAL: float = 1.0
+HEARTBEAT_TIMEOUT: float = 5.0
+CONNECT_TIMEOUT: float = 5.0
+REQUEST_TIMEOUT: float = 30.0
+REPLY_TIMEOUT: float = 5.0
+REPLY_MIN_BYTES_PER_SECOND: int = 1024 * 1024
+EXIT_FAILURE: int = 1
+LISTEN_BACKLOG: int = 4
+
+
+Backend = Callable[[list[str]], tuple[int, bytes]]
+
+
+def _recv_exact(sock: socket.socket, size: int, progress: Callable[[], None] | None = None) -> bytes:
+    buffer: bytearray = bytearray(size)
+    view: memoryview = memoryview(buffer)
+    received: int = 0
+    while received < size:
+        count: int = sock.recv_into(view[received:])
+        if count == 0:
+            raise EOFError("connection closed")
+        received += count
+        if progress is not None:
+            progress()
+    return bytes(buffer)
+
+
+def send_message(
+    sock: socket.socket, lock: threading.Lock, kind: int, request_id: int,
+    code: int = 0, payload: bytes = b"", compress: bool = False, timeout: float | None = None,
+) -> None:
+    flags: int = 0
+    if compress and len(payload) >= COMPRESS_MIN_BYTES:
+        packed: bytes = zlib.compress(payload, COMPRESS_LEVEL)
+        if len(packed) < len(payload):
+            payload = packed
+            flags = FLAG_ZLIB
+    header: bytes = MESSAGE_HEADER.pack(kind, flags, request_id, code, len(payload))
+    with lock:
+        if timeout is not None:
+            sock.settimeout(timeout)
+        sock.sendall(header)
+        if payload:
+            sock.sendall(payload)
+
+
+def recv_message(sock: socket.socket, progress: Callable[[], None] | None = None) -> tuple[int, int, int, bytes]:
+    kind, flags, request_id, code, length = MESSAGE_HEADER.unpack(_recv_exact(sock, MESSAGE_HEADER.size))
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"message too large: {length} bytes")
+    payload: bytes = _recv_exact(sock, length, progress) if length else b""
+    if flags & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return kind, request_id, code, payload
+
+
+def _tune(sock: socket.socket) -> None:
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def _is_loopback(host: str) -> bool:
+    try:
+        return all(ipaddress.ip_address(info[4][0]).is_loopback for info in socket.getaddrinfo(host, None))
+    except (OSError, ValueError):
+        return False
+
+
+class AgentServer:
+    def __init__(self, backend: Backend, host: str, port: int, token: str = "") -> None:
+        if not token and not _is_loopback(host):
+            raise ValueError(f"refusing to listen on {host} without a token")
+        self.backend: Backend = backend
+        self.token: bytes = token.encode("utf-8")
+        self._listener: socket.socket = socket.create_server((host, port), backlog=LISTEN_BACKLOG)
+        self._input: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-input")
+        self._closed: bool = False
+
+    @property
+    def address(self) -> tuple[str, int]:
+        host, port = self._listener.getsockname()[:2]
+        return str(host), int(port)
+
+    def serve_forever(self) -> None:
+        while not self._closed:
+            try:
+                conn, _ = self._listener.accept()
+            except OSError:
+                if self._closed:
+                    return
+                raise
+            threading.Thread(target=self._serve_connection, args=(conn,), daemon=True).start()
+
+    def close(self) -> None:
+        self._closed = True
+        self._listener.close()
+        self._input.shutdown(wait=False)
+
+    def _serve_connection(self, conn: socket.socket) -> None:
+        _tune(conn)
+        conn.settimeout(HEARTBEAT_TIMEOUT)
+        send_lock: threading.Lock = threading.Lock()
+        try:
+            kind, _, _, payload = recv_message(conn)
+            if kind != KIND_HELLO or not hmac.compare_digest(payload, self.token):
+                return
+            send_message(conn, send_lock, KIND_HELLO, 0)
+            while True:
+                if not select.select([conn], [], [], HEARTBEAT_TIMEOUT)[0]:
+                    return
+                kind, request_id, _, payload = recv_message(conn)
+                if kind == KIND_PING:
+                    send_message(conn, send_lock, KIND_PONG, request_id, timeout=HEARTBEAT_TIMEOUT)
+                elif kind == KIND_REQUEST:
+                    args: object = json.loads(payload.decode("utf-8"))
+                    if not isinstance(args, list) or not args:
+                        send_message(conn, send_lock, KIND_REPLY, request_id, EXIT_FAILURE, timeout=REPLY_TIMEOUT)
+                        continue
+                    self._input.submit(self._reply, conn, send_lock, request_id, [str(arg) for arg in args])
+        except (OSError, EOFError, ValueError, RuntimeError, zlib.error, struct.error):
+            pass
+        finally:
+            conn.close()
+
+    def _reply(self, conn: socket.socket, send_lock: threading.Lock, request_id: int, args: list[str]) -> None:
+        try:
+            code, output = self.backend(args)
+        except Exception as exc:
+            sys.stderr.write(f"agent command {args[0]} failed: {exc}\n")
+            code, output = EXIT_FAILURE, b""
+        try:
+            send_message(
+                conn, send_lock, KIND_REPLY, request_id, code, output, compress=True,
+                timeout=REPLY_TIMEOUT + len(output) / REPLY_MIN_BYTES_PER_SECOND,
+            )
+        except OSError:
+            conn.close()
+
+
+class AgentClient:
+    def __init__(self, host: str, port: int, token: str = "") -> None:
+        self.host: str = host
+        self.port: int = port
+        self.token: bytes = token.encode("utf-8")
+        self.last_rtt: float = 0.0
+        self._sock: socket.socket | None = None
+        self._send_lock: threading.Lock = threading.Lock()
+        self._pending: dict[int, Future] = {}
+        self._ping_sent: dict[int, float] = {}
+        self._next_id: int = 0
+        self._last_seen: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+        self._heartbeat: threading.Thread | None = None
+
+    @staticmethod
+    def parse(address: str, token: str = "") -> "AgentClient":
+        host, _, port = address.rpartition(":")
+        return AgentClient(host or AGENT_HOST, int(port or AGENT_PORT), token)
+
+    def _ensure(self) -> socket.socket:
+        if self._sock is not None:
+            return self._sock
+        sock: socket.socket = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        try:
+            _tune(sock)
+            send_message(sock, self._send_lock, KIND_HELLO, 0, payload=self.token)
+            kind, _, _, _ = recv_message(sock)
+        except (OSError, EOFError, ValueError, struct.error):
+            sock.close()
+            raise
+        if kind != KIND_HELLO:
+            sock.close()
+            raise ConnectionError("agent rejected the handshake")
+        sock.settimeout(None)
+        self._sock = sock
+        self._last_seen = time.monotonic()
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._heartbeat_loop, daemon=True)
+            self._heartbeat.start()
+        return sock
+
+    def start(self) -> None:
+        try:
+            with self._lock:
+                self._ensure()
+        except (OSError, EOFError) as exc:
+            print(f"Desktop agent {self.host}:{self.port} unreachable: {exc}", file=sys.stderr)
+
+    def run(self, args: list[str], timeout: float | None = REQUEST_TIMEOUT) -> tuple[int, bytes]:
+        future: Future = Future()
+        request_id: int = 0
+        try:
+            with self._lock:
+                sock: socket.socket = self._ensure()
+                self._next_id += 1
+                request_id = self._next_id
+                self._pending[request_id] = future
+            send_message(sock, self._send_lock, KIND_REQUEST, request_id, payload=json.dumps(args).encode("utf-8"))
+            return future.result(timeout)
+        except (OSError, EOFError, ValueError, struct.error) as exc:
+            print(f"Desktop agent {args[0]} failed: {exc or type(exc).__name__}", file=sys.stderr)
+            return EXIT_FAILURE, b""
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _drop(self, sock: socket.socket, reason: str) -> None:
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            pending: list[Future] = list(self._pending.values())
+            self._pending = {}
+            self._ping_sent = {}
+        sock.close()
+        for future in pending:
+            if not future.done():
+                future.set_exception(ConnectionError(reason))
+
+    def _mark_seen(self) -> None:
+        self._last_seen = time.monotonic()
+
+    def _read_loop(self, sock: socket.socket) -> None:
+        try:
+            while True:
+                kind, request_id, code, payload = recv_message(sock, self._mark_seen)
+                now: float = time.monotonic()
+                with self._lock:
+                    self._last_seen = now
+                    future: Future | None = self._pending.get(request_id) if kind == KIND_REPLY else None
+                    sent: float | None = self._ping_sent.pop(request_id, None) if kind == KIND_PONG else None
+                if sent is not None:
+                    self.last_rtt = now - sent
+                if future is not None and not future.done():
+                    future.set_result((code, payload))
+        except (OSError, EOFError, ValueError, zlib.error, struct.error) as exc:
+            self._drop(sock, str(exc) or type(exc).__name__)
+
+    def _heartbeat_loop(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            with self._lock:
+                sock: socket.socket | None = self._sock
+                silent: float = time.monotonic() - self._last_seen
+                self._next_id += 1
+                ping_id: int = self._next_id
+                if sock is not None:
+                    self._ping_sent[ping_id] = time.monotonic()
+            if sock is None:
+                continue
+            if silent > HEARTBEAT_TIMEOUT:
+                self._drop(sock, f"no heartbeat for {silent:.1f}s")
+                continue
+            try:
+                send_message(sock, self._send_lock, KIND_PING, ping_id)
+            except OSError as exc:
+                self._drop(sock, str(exc) or type(exc).__name__)
+
+
+def _win32_backend() -> Backend:
+    import win32
+
+    def run(args: list[str]) -> tuple[int, bytes]:
+        out: io.BytesIO = io.BytesIO()
+        code: int = win32._run_command(args, out)
+        return code, out.getvalue()
+
+    return run
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    host: str = AGENT_HOST
+    port: int = AGENT_PORT
+    token: str = os.environ.get(AGENT_TOKEN_ENV, "")
+    usage: str = (
+        "usage: python agent.py [--host HOST] [--port PORT] [--token TOKEN]\n"
+        f"A host other than loopback needs --token (or {AGENT_TOKEN_ENV}). The token and all traffic\n"
+        "travel unencrypted: across untrusted networks run the agent behind an SSH tunnel, VPN or TLS proxy.\n"
+    )
+    if len(args) % 2:
+        sys.stderr.write(usage)
+        raise SystemExit(1)
+    for idx in range(0, len(args), 2):
+        match args[idx]:
+            case "--host":
+                host = args[idx + 1]
+            case "--port":
+                port = int(args[idx + 1])
+            case "--token":
+                token = args[idx + 1]
+            case _:
+                sys.stderr.write(usage)
+                raise SystemExit(1)
+    try:
+        server: AgentServer = AgentServer(_win32_backend(), host, port, token)
+    except ValueError as exc:
+        sys.stderr.write(f"{exc}\n{usage}")
+        raise SystemExit(1)
+    print(f"Desktop agent listening on {server.address[0]}:{server.address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
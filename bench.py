@@ -0,0 +1,370 @@
+import json
+import tempfile
+import random
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+import types
+import zlib
+from pathlib import Path
+
+import agent
+import franz
+import imaging
+import recorder
+import router
+import screens
+
+
+PARSE_ROUNDS: int = 50
+FUZZ_SEED: int = 1234
+FUZZ_DOCS: int = 200
+FUZZ_LINES: int = 400
+NOISE_ALPHABET: str = "abcdefghijklmnopqrstuvwxyz0123456789 ()[]{},.:;\"'`-_=+*#\n\t"
+PROSE: tuple[str, ...] = (
+    "I see the desktop with a taskbar at the bottom.",
+    "The button (OK) is near the center of the dialog.",
+    "Next I will open the Start menu (bottom left) and search.",
+    "```",
+    "Here are the tool calls:",
+    "- step one",
+)
+VALID_CALLS: tuple[str, ...] = (
+    "click({x}, {y})",
+    "double_click({x},{y})",
+    "right_click( {x} , {y} )",
+    "scroll_up(x={x}, y={y})",
+    "scroll_down([{x}, {y}])",
+    "drag_start({x}, {y})",
+    "drag_end({x}, {y})",
+    "type_text(\"hello world\")",
+    "press_key(enter)",
+    "hotkey(ctrl+shift+s)",
+    "{{\"bbox_2d\": [{x}, {y}, {x}, {y}], \"label\": \"icon\"}}",
+    "{{\"action\": \"double_click\", \"point_2d\": [{x}, {y}]}}",
+)
+PNG_SIZES: tuple[tuple[int, int], ...] = ((1920, 1080), (3840, 2160))
+PNG_THREAD_COUNTS: tuple[int, ...] = (1, 2, 4, 8)
+PNG_STRIPE_ROWS: tuple[int, ...] = (32, 64, 128)
+PNG_ROUNDS: int = 3
+PNG_IDAT_LENGTH: slice = slice(33, 37)
+PNG_IDAT_START: int = 41
+FRZ_PHOTO_BAND: int = 100
+FRZ_PHOTO_MASK: int = 0xF0
+BODY_SIZES: tuple[tuple[int, int], ...] = ((640, 640), (3840, 2160))
+BODY_ROUNDS: int = 20
+BODY_TEXT: str = "Previous: I clicked the Start button and the menu opened."
+BODY_SYSTEM: str = "You are looking at a computer screen. Describe it, then act."
+AGENT_PING_ROUNDS: int = 200
+AGENT_CAPTURE_ROUNDS: int = 10
+AGENT_CURSOR_REPLY: bytes = b"500,500"
+SCREEN_FRAMES: int = 100_000
+SCREEN_PLACES: int = 2000
+SCREEN_NOISE_BITS: int = 3
+SCREEN_QUERIES: int = 1000
+SCREEN_DISTANCES: tuple[int, ...] = (4, 10)
+HASH_BITS: int = 64
+RECORD_TURNS: int = 60
+RECORD_EDIT_SIZE: tuple[int, int] = (300, 40)
+BROKEN_CALLS: tuple[str, ...] = (
+    "click(abc, 5)",
+    "drag_end(1, 2, 3)",
+    "type_text()",
+    "{\"bbox_2d\": \"oops\"}",
+)
+
+
+def _noise(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(NOISE_ALPHABET) for _ in range(length))
+
+
+def _make_document(rng: random.Random, lines: int) -> tuple[str, int, int]:
+    parts: list[str] = []
+    expected_valid: int = 0
+    expected_broken: int = 0
+    for _ in range(lines):
+        roll: float = rng.random()
+        if roll < 0.35:
+            template: str = rng.choice(VALID_CALLS)
+            parts.append(template.format(x=rng.randint(0, 1000), y=rng.randint(0, 1000)))
+            expected_valid += 1
+        elif roll < 0.45:
+            parts.append(rng.choice(BROKEN_CALLS))
+            expected_broken += 1
+        elif roll < 0.75:
+            parts.append(rng.choice(PROSE))
+        else:
+            parts.append(_noise(rng, rng.randint(0, 80)).replace("(", "").replace("{", ""))
+    return "\n".join(parts), expected_valid, expected_broken
+
+
+def bench_parse() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    document, expected_valid, expected_broken = _make_document(rng, FUZZ_LINES * 10)
+    started: float = time.perf_counter()
+    for _ in range(PARSE_ROUNDS):
+        found, errors = franz.parse_tool_calls(document)
+    elapsed: float = (time.perf_counter() - started) / PARSE_ROUNDS
+    print(f"parse: {len(document)} chars, {len(found)} actions, {len(errors)} errors")
+    print(f"parse: {elapsed * 1000:.2f} ms/doc, {len(document) / elapsed / 1e6:.1f} MB/s")
+    if len(found) != expected_valid or len(errors) != expected_broken:
+        raise SystemExit(f"parse: expected {expected_valid}/{expected_broken}, got {len(found)}/{len(errors)}")
+
+
+def fuzz_parse() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    for doc_idx in range(FUZZ_DOCS):
+        document, expected_valid, expected_broken = _make_document(rng, FUZZ_LINES)
+        found, errors = franz.parse_tool_calls(document)
+        if len(found) != expected_valid or len(errors) != expected_broken:
+            raise SystemExit(f"fuzz doc {doc_idx}: expected {expected_valid}/{expected_broken}, got {len(found)}/{len(errors)}")
+        for action in found:
+            for key in ("x", "y"):
+                if key in action and not franz.NORM_MIN <= int(action[key]) <= franz.NORM_MAX:
+                    raise SystemExit(f"fuzz doc {doc_idx}: {key} out of range in {action}")
+        franz.parse_tool_calls(_noise(rng, FUZZ_LINES * 20))
+    print(f"fuzz: {FUZZ_DOCS} documents ok")
+
+
+def _desktop_bgra(rng: random.Random, width: int, height: int) -> bytes:
+    palette: list[bytes] = [bytes((rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)) for _ in range(16)]
+    rows: list[bytes] = []
+    for yidx in range(height):
+        band: bytes = palette[(yidx // 40) % len(palette)]
+        row: bytearray = bytearray(band * width)
+        if yidx % 40 < 20:
+            for _ in range(width // 64):
+                xidx: int = rng.randrange(width)
+                row[xidx * 4:xidx * 4 + 4] = rng.choice(palette)
+        rows.append(bytes(row))
+    return b"".join(rows)
+
+
+def _idat(png: bytes) -> bytes:
+    length: int = struct.unpack(">I", png[PNG_IDAT_LENGTH])[0]
+    return png[PNG_IDAT_START:PNG_IDAT_START + length]
+
+
+def bench_png() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    for width, height in PNG_SIZES:
+        bgra: bytes = _desktop_bgra(rng, width, height)
+        scanlines: bytes = imaging.png_scanlines(imaging.bgra_to_rgba(bgra), width, height)
+        row_bytes: int = width * imaging.BYTES_PER_PIXEL + 1
+        for threads in PNG_THREAD_COUNTS:
+            for stripe_rows in PNG_STRIPE_ROWS if threads > 1 else PNG_STRIPE_ROWS[:1]:
+                imaging.PNG_STRIPES.configure(threads, stripe_rows)
+                started: float = time.perf_counter()
+                for _ in range(PNG_ROUNDS):
+                    stream: bytes = imaging.PNG_STRIPES.compress(scanlines, row_bytes, imaging.PNG_COMPRESS_LEVEL)
+                elapsed: float = (time.perf_counter() - started) / PNG_ROUNDS
+                if zlib.decompress(stream) != scanlines:
+                    raise SystemExit(f"png {width}x{height}: threads={threads} rows={stripe_rows} decodes differently")
+                print(f"png {width}x{height} threads={threads} rows={stripe_rows}: {elapsed * 1000:.1f} ms, {len(stream)} bytes")
+        png: bytes = imaging.bgra_to_png(bgra, width, height)
+        if zlib.decompress(_idat(png)) != scanlines:
+            raise SystemExit(f"png {width}x{height}: IDAT does not round-trip")
+    imaging.PNG_STRIPES.configure(imaging.PNG_THREADS, imaging.PNG_STRIPE_ROWS)
+
+
+def _mixed_bgra(rng: random.Random, width: int, height: int) -> bytes:
+    flat: bytes = _desktop_bgra(rng, width, height)
+    stride: int = width * imaging.BYTES_PER_PIXEL
+    rows: list[bytes] = []
+    for yidx in range(height):
+        if (yidx // FRZ_PHOTO_BAND) % 3 == 0:
+            rows.append(bytes(rng.getrandbits(8) & FRZ_PHOTO_MASK for _ in range(stride)))
+        else:
+            rows.append(flat[yidx * stride:(yidx + 1) * stride])
+    return b"".join(rows)
+
+
+def bench_frz() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    for width, height in PNG_SIZES:
+        for name, bgra in (("desktop", _desktop_bgra(rng, width, height)), ("mixed", _mixed_bgra(rng, width, height))):
+            started: float = time.perf_counter()
+            frz: bytes = imaging.bgra_to_frz(bgra, width, height)
+            frz_time: float = time.perf_counter() - started
+            started = time.perf_counter()
+            png: bytes = imaging.bgra_to_png(bgra, width, height)
+            png_time: float = time.perf_counter() - started
+            if imaging.frz_to_bgra(frz) != (bgra, width, height):
+                raise SystemExit(f"frz {width}x{height} {name}: round trip failed")
+            print(
+                f"frz {width}x{height} {name}: frz {frz_time * 1000:.1f} ms {len(frz)} bytes, "
+                f"png {png_time * 1000:.1f} ms {len(png)} bytes, "
+                f"preview uses {imaging.Frame(0, '', width, height, bgra=bgra).preferred_format()}"
+            )
+
+
+def _legacy_body(frame: imaging.Frame) -> bytes:
+    return json.dumps({
+        "model": "", "temperature": 0.6, "top_p": 0.85, "max_tokens": 800,
+        "messages": [
+            {"role": "system", "content": BODY_SYSTEM},
+            {"role": "user", "content": [
+                {"type": "image_url", "image_url": {"url": frame.data_url()}},
+                {"type": "text", "text": BODY_TEXT},
+            ]},
+        ],
+    }).encode("utf-8")
+
+
+def _buffered_body(frame: imaging.Frame) -> list[bytes]:
+    return router._chat_body(types.SimpleNamespace(), {"text": BODY_TEXT, "image": frame, "system": BODY_SYSTEM})
+
+
+def _measure_body(build: object, frame: imaging.Frame) -> tuple[float, int, int]:
+    build(frame)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    started: float = time.perf_counter()
+    for _ in range(BODY_ROUNDS):
+        body: object = build(frame)
+    elapsed: float = (time.perf_counter() - started) / BODY_ROUNDS
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    size: int = len(body) if isinstance(body, bytes) else sum(len(buffer) for buffer in body)
+    return elapsed, peak, size
+
+
+def bench_body() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    for width, height in BODY_SIZES:
+        frame: imaging.Frame = imaging.Frame(0, "", width, height, bgra=_mixed_bgra(rng, width, height))
+        frame.png()
+        legacy: tuple[float, int, int] = _measure_body(_legacy_body, frame)
+        buffered: tuple[float, int, int] = _measure_body(_buffered_body, frame)
+        if b"".join(_buffered_body(frame)).count(frame.b64_ascii()) != 1:
+            raise SystemExit(f"body {width}x{height}: image missing from buffered body")
+        for name, (elapsed, peak, size) in (("json.dumps", legacy), ("buffers", buffered)):
+            print(f"body {width}x{height} {name}: {elapsed * 1000:.2f} ms, peak {peak / 1e6:.1f} MB, {size} bytes")
+
+
+def bench_agent() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    width, height = PNG_SIZES[0]
+    capture: bytes = imaging.pack_raw(_desktop_bgra(rng, width, height), width, height)
+
+    def backend(args: list[str]) -> tuple[int, bytes]:
+        match args[0]:
+            case "capture":
+                return 0, capture
+            case "cursor_pos":
+                return 0, AGENT_CURSOR_REPLY
+        return 0, b""
+
+    server: agent.AgentServer = agent.AgentServer(backend, agent.AGENT_HOST, 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client: agent.AgentClient = agent.AgentClient(*server.address)
+    client.start()
+    started: float = time.perf_counter()
+    for _ in range(AGENT_PING_ROUNDS):
+        if client.run(["cursor_pos"]) != (0, AGENT_CURSOR_REPLY):
+            raise SystemExit("agent: cursor_pos reply differs")
+    rtt: float = (time.perf_counter() - started) / AGENT_PING_ROUNDS
+    started = time.perf_counter()
+    for _ in range(AGENT_CAPTURE_ROUNDS):
+        if client.run(["capture", "--format", "raw"]) != (0, capture):
+            raise SystemExit("agent: capture reply differs")
+    per_frame: float = (time.perf_counter() - started) / AGENT_CAPTURE_ROUNDS
+    print(f"agent: cursor_pos round trip {rtt * 1000:.3f} ms")
+    print(
+        f"agent: capture {width}x{height} {per_frame * 1000:.1f} ms/frame, "
+        f"{1 / per_frame:.1f} frames/s, {len(capture) / per_frame / 1e6:.0f} MB/s raw"
+    )
+    server.close()
+
+
+def bench_screens() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    width, height = PNG_SIZES[0]
+    frame: imaging.Frame = imaging.Frame(0, "", width, height, bgra=_desktop_bgra(rng, width, height))
+    started: float = time.perf_counter()
+    frame.dhash()
+    print(f"screens: dhash {width}x{height} {(time.perf_counter() - started) * 1000:.2f} ms")
+    places: list[int] = [rng.getrandbits(HASH_BITS) for _ in range(SCREEN_PLACES)]
+    index: screens.ScreenIndex = screens.ScreenIndex()
+    started = time.perf_counter()
+    for turn in range(SCREEN_FRAMES):
+        screen_hash: int = rng.choice(places)
+        for _ in range(rng.randint(0, SCREEN_NOISE_BITS)):
+            screen_hash ^= 1 << rng.randrange(HASH_BITS)
+        index.add(screens.ScreenRecord("bench", turn, screen_hash, screen_hash, b"[]", ""))
+    print(f"screens: indexed {SCREEN_FRAMES} frames in {time.perf_counter() - started:.2f} s")
+    queries: list[int] = [rng.choice(places) ^ (1 << rng.randrange(HASH_BITS)) for _ in range(SCREEN_QUERIES)]
+    for max_distance in SCREEN_DISTANCES:
+        started = time.perf_counter()
+        hits: int = sum(len(index.nearest(query, franz.SIMILAR_K, max_distance)) for query in queries)
+        elapsed: float = (time.perf_counter() - started) / SCREEN_QUERIES
+        if hits < SCREEN_QUERIES:
+            raise SystemExit(f"screens: distance {max_distance} missed a revisited screen")
+        print(f"screens: similar_frames(k={franz.SIMILAR_K}, max_distance={max_distance}) {elapsed * 1000:.3f} ms")
+
+
+def bench_record() -> None:
+    rng: random.Random = random.Random(FUZZ_SEED)
+    width, height = PNG_SIZES[0]
+    edit_w, edit_h = RECORD_EDIT_SIZE
+    screen: bytearray = bytearray(_desktop_bgra(rng, width, height))
+    patch: bytes = _desktop_bgra(rng, edit_w, edit_h)
+    frames: list[imaging.Frame] = []
+    for turn in range(RECORD_TURNS):
+        left: int = rng.randrange(width - edit_w)
+        top: int = rng.randrange(height - edit_h)
+        for row in range(edit_h):
+            start: int = ((top + row) * width + left) * imaging.BYTES_PER_PIXEL
+            screen[start:start + edit_w * imaging.BYTES_PER_PIXEL] = patch[
+                row * edit_w * imaging.BYTES_PER_PIXEL:(row + 1) * edit_w * imaging.BYTES_PER_PIXEL
+            ]
+        frames.append(imaging.Frame(turn, "", width, height, bgra=bytes(screen)))
+    started: float = time.perf_counter()
+    per_turn: int = sum(len(imaging.bgra_to_png(frame.bgra, width, height)) for frame in frames)
+    per_turn_time: float = time.perf_counter() - started
+    with tempfile.TemporaryDirectory() as folder:
+        session_recorder: recorder.SessionRecorder = recorder.SessionRecorder(
+            Path(folder), recorder.RECORD_KEYFRAME_INTERVAL, recorder.RECORD_SEGMENT_BYTES,
+            recorder.RECORD_SEGMENT_SECONDS,
+        )
+        started = time.perf_counter()
+        for turn, frame in enumerate(frames):
+            session_recorder.record(turn, "pre", frame)
+        session_recorder.close()
+        recorded_time: float = time.perf_counter() - started
+        recorded: int = sum(path.stat().st_size for path in Path(folder).iterdir())
+    print(f"record {RECORD_TURNS} turns {width}x{height} png per turn: {per_turn / 1e6:.1f} MB, {per_turn_time:.2f} s")
+    print(f"record {RECORD_TURNS} turns {width}x{height} apng deltas: {recorded / 1e6:.1f} MB, {recorded_time:.2f} s")
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    if not args:
+        sys.stderr.write("usage: python bench.py <parse|fuzz|png|frz|body|agent|screens|record>\n")
+        raise SystemExit(1)
+    match args[0]:
+        case "parse":
+            bench_parse()
+        case "fuzz":
+            fuzz_parse()
+        case "png":
+            bench_png()
+        case "frz":
+            bench_frz()
+        case "body":
+            bench_body()
+        case "agent":
+            bench_agent()
+        case "screens":
+            bench_screens()
+        case "record":
+            bench_record()
+        case _:
+            sys.stderr.write(f"unknown benchmark: {args[0]}\n")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
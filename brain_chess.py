@@ -9,8 +9,8 @@ The entity uses two personas:
   2. Move Executor: receives the move description + screenshot with grid,
      produces drag_start and drag_end to physically move the piece.
 
-A coordinate grid is drawn EVERY turn so the VLM always thinks
-in normalized 0-1000 space, not chess notation.
+A coordinate grid layer is drawn once in on_start and shown on EVERY
+turn so the VLM always thinks in normalized 0-1000 space, not chess notation.
 
 Run with: python router.py
   - Crop EXACTLY to the chessboard borders (no side panels, no chat).
@@ -18,14 +18,13 @@ Run with: python router.py
 
 """
 
-import base64
-import json
-import re
-import subprocess
-import sys
-import urllib.request
 from franz import actions
+from franz import current_frame
+from franz import vlm
+from franz import VlmError
+from franz import parse_tool_calls
 from franz import overlays
+from franz import layer
 from franz import click
 from franz import drag_start
 from franz import drag_end
@@ -109,21 +108,24 @@ COLUMN_LETTERS = ["a", "b", "c", "d", "e", "f", "g", "h"]
 ROW_NUMBERS = ["8", "7", "6", "5", "4", "3", "2", "1"]
 
 
-def on_vlm_response(text: str) -> str:
+def on_start() -> None:
 
     # ==========================================
     # STEP 1: Draw the coordinate grid overlay
     # ==========================================
-    # This grid is drawn EVERY turn so the VLM always sees
-    # normalized coordinates on the board, not chess squares.
+    # The grid goes into a persistent layer, drawn ONCE at startup.
+    # The engine and the panel keep it on EVERY turn's screenshot, so
+    # the VLM always sees normalized coordinates on the board, not
+    # chess squares, and the grid is only re-sent if it changes.
+    grid = layer("grid")
 
     # Vertical grid lines (columns)
     for gx in GRID_POSITIONS:
-        overlays(line([[gx, 0], [gx, 1000]], str(gx), "#00ffff"))
+        grid.add(line([[gx, 0], [gx, 1000]], str(gx), "#00ffff"))
 
     # Horizontal grid lines (rows)
     for gy in GRID_POSITIONS:
-        overlays(line([[0, gy], [1000, gy]], str(gy), "#00ffff"))
+        grid.add(line([[0, gy], [1000, gy]], str(gy), "#00ffff"))
 
     # Labeled dots at square centers (every other square to avoid clutter)
     for col_idx in range(8):
@@ -133,16 +135,19 @@ def on_vlm_response(text: str) -> str:
                 cx = SQUARE_CENTERS_X[col_idx]
                 cy = SQUARE_CENTERS_Y[row_idx]
                 label = str(cx) + "," + str(cy)
-                overlays(dot(cx, cy, label, "#ffff00"))
+                grid.add(dot(cx, cy, label, "#ffff00"))
 
     # Corner markers with big labels so model never forgets coordinate system
-    overlays(dot(0, 0, "0,0 TOP-LEFT", "#ff0000"))
-    overlays(dot(1000, 0, "1000,0 TOP-RIGHT", "#ff0000"))
-    overlays(dot(0, 1000, "0,1000 BOT-LEFT", "#ff0000"))
-    overlays(dot(1000, 1000, "1000,1000 BOT-RIGHT", "#ff0000"))
+    grid.add(dot(0, 0, "0,0 TOP-LEFT", "#ff0000"))
+    grid.add(dot(1000, 0, "1000,0 TOP-RIGHT", "#ff0000"))
+    grid.add(dot(0, 1000, "0,1000 BOT-LEFT", "#ff0000"))
+    grid.add(dot(1000, 1000, "1000,1000 BOT-RIGHT", "#ff0000"))
 
     # White side indicator
-    overlays(line([[0, 950], [1000, 950]], "=== WHITE SIDE ===", "#ffffff"))
+    grid.add(line([[0, 950], [1000, 950]], "=== WHITE SIDE ===", "#ffffff"))
+
+
+def on_vlm_response(text: str) -> str:
 
     # ==========================================
     # STEP 2: Check if entity is just observing
@@ -156,47 +161,25 @@ def on_vlm_response(text: str) -> str:
         return text
 
     # ==========================================
-    # STEP 3: Take fresh screenshot for executor
+    # STEP 3: Reuse the engine's screenshot for executor
     # ==========================================
-    screenshot_proc = subprocess.run(
-        [sys.executable, "win32.py", "capture", "--width", "0", "--height", "0"],
-        capture_output=True,
-    )
-    if not screenshot_proc.stdout:
+    screenshot = current_frame()
+    if screenshot is None:
         return text
 
-    screenshot_b64 = base64.b64encode(screenshot_proc.stdout).decode("ascii")
-
     # ==========================================
     # STEP 4: Ask executor to produce the drag
     # ==========================================
-    request_body = json.dumps({
-        "model": VLM_MODEL_NAME,
-        "temperature": 0.05,
-        "max_tokens": 60,
-        "messages": [
-            {"role": "system", "content": EXECUTOR_SYSTEM},
-            {"role": "user", "content": [
-                {"type": "text", "text": text},
-                {"type": "image_url", "image_url": {
-                    "url": "data:image/png;base64," + screenshot_b64,
-                }},
-            ]},
-        ],
-    }).encode("utf-8")
-
-    request = urllib.request.Request(
-        VLM_ENDPOINT_URL,
-        data=request_body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-
     try:
-        with urllib.request.urlopen(request, timeout=60) as response:
-            response_data = json.loads(response.read().decode("utf-8"))
-        executor_text = response_data["choices"][0]["message"]["content"]
-    except Exception:
+        executor_text = vlm(
+            text,
+            image=screenshot,
+            system=EXECUTOR_SYSTEM,
+            temperature=0.05,
+            max_tokens=60,
+            timeout=60,
+        )
+    except VlmError:
         overlays(dot(500, 500, "executor failed", "#ff0000"))
         return text
 
@@ -208,18 +191,16 @@ def on_vlm_response(text: str) -> str:
     end_x = -1
     end_y = -1
 
-    for found in re.finditer(r"(\w+)$([^)]*)$", executor_text):
-        name = found.group(1).strip().lower()
-        args = found.group(2).strip()
-        parts = args.split(",")
+    tool_calls, parse_errors = parse_tool_calls(executor_text)
 
-        if name == "drag_start" and len(parts) >= 2:
-            start_x = int(parts[0].strip())
-            start_y = int(parts[1].strip())
+    for action in tool_calls:
+        if action["type"] == "drag_start":
+            start_x = action["x"]
+            start_y = action["y"]
 
-        elif name == "drag_end" and len(parts) >= 2:
-            end_x = int(parts[0].strip())
-            end_y = int(parts[1].strip())
+        elif action["type"] == "drag_end":
+            end_x = action["x"]
+            end_y = action["y"]
 
     # Only push if we got both start and end
     if start_x >= 0 and start_y >= 0 and end_x >= 0 and end_y >= 0:
@@ -7,13 +7,11 @@ and collects findings back into Notepad.
 Run with: python router.py
 """
 
-import base64
-import json
-import re
-import subprocess
-import sys
-import urllib.request
 from franz import actions
+from franz import current_frame
+from franz import vlm
+from franz import VlmError
+from franz import parse_tool_calls
 from franz import overlays
 from franz import click
 from franz import double_click
@@ -134,16 +132,11 @@ press_key(enter)"""
 
 def on_vlm_response(text: str) -> str:
 
-    # Take a fresh screenshot for the executor
-    screenshot_proc = subprocess.run(
-        [sys.executable, "win32.py", "capture", "--width", "0", "--height", "0"],
-        capture_output=True,
-    )
-    if not screenshot_proc.stdout:
+    # Reuse the engine's screenshot for the executor
+    screenshot = current_frame()
+    if screenshot is None:
         return text
 
-    screenshot_b64 = base64.b64encode(screenshot_proc.stdout).decode("ascii")
-
     # Check if the VLM is just observing (waiting for user)
     text_lower = text.lower()
     is_waiting = False
@@ -161,116 +154,49 @@ def on_vlm_response(text: str) -> str:
         return text
 
     # Send to executor: the VLM's intent + the screenshot
-    request_body = json.dumps({
-        "model": VLM_MODEL_NAME,
-        "temperature": 0.1,
-        "max_tokens": 150,
-        "messages": [
-            {"role": "system", "content": EXECUTOR_SYSTEM},
-            {"role": "user", "content": [
-                {"type": "text", "text": text},
-                {"type": "image_url", "image_url": {
-                    "url": "data:image/png;base64," + screenshot_b64,
-                }},
-            ]},
-        ],
-    }).encode("utf-8")
-
-    request = urllib.request.Request(
-        VLM_ENDPOINT_URL,
-        data=request_body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-
     try:
-        with urllib.request.urlopen(request, timeout=60) as response:
-            response_data = json.loads(response.read().decode("utf-8"))
-        executor_text = response_data["choices"][0]["message"]["content"]
-    except Exception:
+        executor_text = vlm(
+            text,
+            image=screenshot,
+            system=EXECUTOR_SYSTEM,
+            temperature=0.1,
+            max_tokens=150,
+            timeout=60,
+        )
+    except VlmError:
         overlays(dot(500, 500, "executor call failed", "#ff0000"))
         return text
 
     # Parse tool calls and push into pipes
     action_count = 0
 
-    for found in re.finditer(r"(\w+)$([^)]*)$", executor_text):
-        name = found.group(1).strip().lower()
-        args = found.group(2).strip()
-
-        if name == "click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(click(x, y))
-                overlays(dot(x, y, "click " + str(action_count + 1), "#ff4444"))
-                action_count = action_count + 1
-
-        elif name == "double_click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(double_click(x, y))
-                overlays(dot(x, y, "dblclick " + str(action_count + 1), "#ff8800"))
-                action_count = action_count + 1
-
-        elif name == "right_click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(right_click(x, y))
-                overlays(dot(x, y, "rightclick " + str(action_count + 1), "#ff00ff"))
-                action_count = action_count + 1
-
-        elif name == "type_text":
-            actions(type_text(args))
-            overlays(dot(50, 50, "typing: " + args[:30], "#44aaff"))
-            action_count = action_count + 1
-
-        elif name == "press_key":
-            actions(press_key(args))
-            overlays(dot(50, 80, "key: " + args, "#44ff44"))
-            action_count = action_count + 1
-
-        elif name == "hotkey":
-            actions(hotkey(args))
-            overlays(dot(50, 80, "hotkey: " + args, "#ffff44"))
-            action_count = action_count + 1
-
-        elif name == "scroll_up":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(scroll_up(x, y))
-                action_count = action_count + 1
-
-        elif name == "scroll_down":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(scroll_down(x, y))
-                action_count = action_count + 1
-
-        elif name == "drag_start":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(drag_start(x, y))
-                action_count = action_count + 1
-
-        elif name == "drag_end":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                x = int(parts[0].strip())
-                y = int(parts[1].strip())
-                actions(drag_end(x, y))
-                action_count = action_count + 1
+    tool_calls, parse_errors = parse_tool_calls(executor_text)
+
+    for action in tool_calls:
+        actions(action)
+        action_count = action_count + 1
+        kind = action["type"]
+
+        if kind == "click":
+            overlays(dot(action["x"], action["y"], "click " + str(action_count), "#ff4444"))
+
+        elif kind == "double_click":
+            overlays(dot(action["x"], action["y"], "dblclick " + str(action_count), "#ff8800"))
+
+        elif kind == "right_click":
+            overlays(dot(action["x"], action["y"], "rightclick " + str(action_count), "#ff00ff"))
+
+        elif kind == "type_text":
+            overlays(dot(50, 50, "typing: " + action["params"][:30], "#44aaff"))
+
+        elif kind == "press_key":
+            overlays(dot(50, 80, "key: " + action["params"], "#44ff44"))
+
+        elif kind == "hotkey":
+            overlays(dot(50, 80, "hotkey: " + action["params"], "#ffff44"))
+
+    for problem in parse_errors:
+        overlays(dot(50, 110, "bad line " + str(problem["line"]) + ": " + problem["text"], "#888888"))
 
     if action_count == 0:
         overlays(dot(500, 500, "no actions parsed", "#888888"))
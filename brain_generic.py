@@ -42,27 +42,36 @@ Return a string -- it becomes context for the next VLM turn.
     line(points, label, color)
 
     All produce a 2D polygon drawn on the HTML5 canvas.
+    overlays() also accepts a hand-built dict with the same keys.
+
+    Overlays that never change go into a persistent layer instead:
+        layer("grid").add(line([[0, 500], [1000, 500]]))
+    Define an optional on_start() to fill layers once before turn 1.
 
 == FREEDOM ==
 
 Inside on_vlm_response you can do ANYTHING with Python stdlib:
   - Parse text with regex or json
   - Make HTTP calls to any API with urllib.request
-  - Capture a fresh screenshot yourself:
-        subprocess.run([sys.executable, "win32.py", "capture"], ...)
+  - Get the screenshot the engine just took (full resolution by default):
+        current_frame()                  -- native pixels of the capture region
+        current_frame(640, 640)          -- resized copy, cached for this turn
+        current_frame(max_age=0.5)       -- re-capture if older than 0.5 s
+  - Ask the model again through the engine's endpoint and connections:
+        vlm(text, image=current_frame(), system=PROMPT)   -- raises VlmError
+        vlm_many([{"text": t, "image": f}, ...])         -- concurrent, in order
+    vlm_many results are dicts: {"text", "error", "kind", "seconds"}.
   - Run subprocesses, read files, import any stdlib module
   - Call multiple AI models, chain them, compare results
 
 The function is your program. The pipes are your output interface.
 """
 
-import base64
-import json
-import re
-import subprocess
-import sys
-import urllib.request
 from franz import actions
+from franz import current_frame
+from franz import vlm
+from franz import VlmError
+from franz import parse_tool_calls
 from franz import overlays
 from franz import click
 from franz import double_click
@@ -135,89 +144,30 @@ press_key(enter)"""
 
 def on_vlm_response(text: str) -> str:
 
-    screenshot_proc = subprocess.run(
-        [sys.executable, "win32.py", "capture", "--width", "0", "--height", "0"],
-        capture_output=True,
-    )
-    if not screenshot_proc.stdout:
+    screenshot = current_frame()
+    if screenshot is None:
         return text
-    screenshot_b64 = base64.b64encode(screenshot_proc.stdout).decode("ascii")
-
-    request_body = json.dumps({
-        "model": VLM_MODEL_NAME,
-        "temperature": 0.1,
-        "max_tokens": 200,
-        "messages": [
-            {"role": "system", "content": EXECUTOR_SYSTEM},
-            {"role": "user", "content": [
-                {"type": "text", "text": text},
-                {"type": "image_url", "image_url": {
-                    "url": "data:image/png;base64," + screenshot_b64,
-                }},
-            ]},
-        ],
-    }).encode("utf-8")
-
-    request = urllib.request.Request(
-        VLM_ENDPOINT_URL,
-        data=request_body,
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
 
     try:
-        with urllib.request.urlopen(request, timeout=60) as response:
-            response_data = json.loads(response.read().decode("utf-8"))
-        executor_text = response_data["choices"][0]["message"]["content"]
-    except Exception:
+        executor_text = vlm(
+            text,
+            image=screenshot,
+            system=EXECUTOR_SYSTEM,
+            temperature=0.1,
+            max_tokens=200,
+            timeout=60,
+        )
+    except VlmError:
         return text
 
-    for found in re.finditer(r"(\w+)$([^)]*)$", executor_text):
-        name = found.group(1).strip().lower()
-        args = found.group(2).strip()
-
-        if name == "click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(click(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "double_click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(double_click(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "right_click":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(right_click(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "type_text":
-            actions(type_text(args))
-
-        elif name == "press_key":
-            actions(press_key(args))
-
-        elif name == "hotkey":
-            actions(hotkey(args))
-
-        elif name == "scroll_up":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(scroll_up(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "scroll_down":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(scroll_down(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "drag_start":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(drag_start(int(parts[0].strip()), int(parts[1].strip())))
-
-        elif name == "drag_end":
-            parts = args.split(",")
-            if len(parts) >= 2:
-                actions(drag_end(int(parts[0].strip()), int(parts[1].strip())))
+    # One call parses every tool call line. Lines that look like a tool
+    # call but cannot be read come back in parse_errors.
+    tool_calls, parse_errors = parse_tool_calls(executor_text)
+
+    for action in tool_calls:
+        actions(action)
+
+    for problem in parse_errors:
+        overlays(dot(500, 500, "bad line " + str(problem["line"]) + ": " + problem["error"], "#888888"))
 
     return text
@@ -0,0 +1,339 @@
+import json
+import queue
+import re
+import sqlite3
+import sys
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+
+CATALOG_FILE: str = "catalog.sqlite3"
+CATALOG_BATCH: int = 64
+CATALOG_FLUSH_SECONDS: float = 0.5
+CATALOG_QUEUE_TURNS: int = 4096
+BUSY_TIMEOUT_SECONDS: float = 5.0
+PAGE_LIMIT: int = 50
+PAGE_LIMIT_MAX: int = 500
+SNIPPET_TOKENS: int = 16
+FTS_QUERY_ERRORS: tuple[str, ...] = ("fts5: ", "unterminated string", "no such column", "unknown special query")
+BUSY_ERRORS: frozenset[str] = frozenset({"SQLITE_BUSY", "SQLITE_LOCKED"})
+STAMP_FORMAT: str = "%Y%m%d_%H%M%S_%f"
+TURN_HEADER_RE: re.Pattern[str] = re.compile(r"^--- TURN (\d+) \| (\S+) \| (\w+) ---$")
+TURN_COLUMNS: tuple[str, ...] = (
+    "session", "turn", "started_at", "ended_at",
+    "capture_seconds", "vlm_seconds", "brain_seconds", "execute_seconds", "annotate_seconds",
+    "input", "output", "actions", "parse_errors", "parse_error", "frames",
+)
+SUMMARY_COLUMNS: tuple[str, ...] = (
+    "id", "session", "turn", "started_at", "ended_at",
+    "capture_seconds", "vlm_seconds", "brain_seconds", "execute_seconds", "annotate_seconds",
+    "actions", "parse_errors", "parse_error", "frames",
+)
+JSON_COLUMNS: tuple[str, ...] = ("actions", "frames")
+TURN_DEFAULTS: dict[str, object] = {"input": "", "output": "", "parse_error": "", "actions": [], "frames": {}}
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY,
+    session TEXT NOT NULL,
+    turn INTEGER NOT NULL,
+    started_at REAL NOT NULL DEFAULT 0,
+    ended_at REAL NOT NULL DEFAULT 0,
+    capture_seconds REAL NOT NULL DEFAULT 0,
+    vlm_seconds REAL NOT NULL DEFAULT 0,
+    brain_seconds REAL NOT NULL DEFAULT 0,
+    execute_seconds REAL NOT NULL DEFAULT 0,
+    annotate_seconds REAL NOT NULL DEFAULT 0,
+    input TEXT NOT NULL DEFAULT '',
+    output TEXT NOT NULL DEFAULT '',
+    actions TEXT NOT NULL DEFAULT '[]',
+    parse_errors INTEGER NOT NULL DEFAULT 0,
+    parse_error TEXT NOT NULL DEFAULT '',
+    frames TEXT NOT NULL DEFAULT '{}',
+    UNIQUE (session, turn)
+);
+CREATE INDEX IF NOT EXISTS turns_errors ON turns (parse_errors) WHERE parse_errors > 0;
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_text USING fts5(
+    input, output, parse_error, content='turns', content_rowid='id'
+);
+"""
+
+
+def _connect(path: Path) -> sqlite3.Connection:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn: sqlite3.Connection = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT_SECONDS)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _connect_readonly(path: Path) -> sqlite3.Connection | None:
+    if not path.exists():
+        return None
+    conn: sqlite3.Connection = sqlite3.connect(
+        f"{path.resolve().as_uri()}?mode=ro", uri=True, timeout=BUSY_TIMEOUT_SECONDS,
+    )
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _insert(conn: sqlite3.Connection, rows: list[dict[str, object]]) -> int:
+    statement: str = (
+        f"INSERT INTO turns ({', '.join(TURN_COLUMNS)}) VALUES ({', '.join('?' for _ in TURN_COLUMNS)}) "
+        "ON CONFLICT (session, turn) DO NOTHING"
+    )
+    inserted: int = 0
+    with conn:
+        for row in rows:
+            values: list[object] = [row.get(name, TURN_DEFAULTS.get(name, 0)) for name in TURN_COLUMNS]
+            for name in JSON_COLUMNS:
+                values[TURN_COLUMNS.index(name)] = json.dumps(values[TURN_COLUMNS.index(name)], ensure_ascii=False)
+            cursor: sqlite3.Cursor = conn.execute(statement, values)
+            if cursor.rowcount != 1:
+                continue
+            conn.execute(
+                "INSERT INTO turns_text (rowid, input, output, parse_error) VALUES (?, ?, ?, ?)",
+                (cursor.lastrowid, row.get("input", ""), row.get("output", ""), row.get("parse_error", "")),
+            )
+            inserted += 1
+    return inserted
+
+
+class SessionCatalog:
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self.dropped: int = 0
+        self._queue: queue.Queue[dict[str, object] | None] = queue.Queue(maxsize=CATALOG_QUEUE_TURNS)
+        self._thread: threading.Thread = threading.Thread(target=self._run, name="catalog", daemon=True)
+        self._thread.start()
+
+    def add_turn(self, row: dict[str, object]) -> None:
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            conn: sqlite3.Connection = _connect(self.path)
+        except sqlite3.Error as exc:
+            print(f"catalog disabled: {exc}", file=sys.stderr)
+            return
+        closing: bool = False
+        while not closing:
+            first: dict[str, object] | None = self._queue.get()
+            if first is None:
+                break
+            batch: list[dict[str, object]] = [first]
+            while len(batch) < CATALOG_BATCH:
+                try:
+                    item: dict[str, object] | None = self._queue.get(timeout=CATALOG_FLUSH_SECONDS)
+                except queue.Empty:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            try:
+                _insert(conn, batch)
+            except sqlite3.Error as exc:
+                print(f"catalog error: {exc}", file=sys.stderr)
+        conn.close()
+
+
+def _page_limit(limit: int) -> int:
+    return max(1, min(limit, PAGE_LIMIT_MAX))
+
+
+def _turn_item(row: sqlite3.Row) -> dict[str, object]:
+    item: dict[str, object] = {name: row[name] for name in row.keys()}
+    for name in JSON_COLUMNS:
+        item[name] = json.loads(item[name])
+    return item
+
+
+def find_turns(
+    path: Path, query: str = "", session: str = "", errors_only: bool = False,
+    before: int = 0, limit: int = PAGE_LIMIT,
+) -> dict[str, object]:
+    conn: sqlite3.Connection | None = _connect_readonly(path)
+    if conn is None:
+        return {"items": [], "next": None}
+    limit = _page_limit(limit)
+    columns: str = ", ".join(f"turns.{name}" for name in SUMMARY_COLUMNS)
+    clauses: list[str] = []
+    params: list[object] = []
+    source: str = "turns"
+    if query:
+        columns += f", snippet(turns_text, -1, '[', ']', '...', {SNIPPET_TOKENS}) AS snippet"
+        source = "turns_text JOIN turns ON turns.id = turns_text.rowid"
+        clauses.append("turns_text MATCH ?")
+        params.append(query)
+    if session:
+        clauses.append("turns.session = ?")
+        params.append(session)
+    if errors_only:
+        clauses.append("turns.parse_errors > 0")
+    if before > 0:
+        clauses.append("turns.id < ?")
+        params.append(before)
+    where: str = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    try:
+        with conn:
+            rows: list[sqlite3.Row] = conn.execute(
+                f"SELECT {columns} FROM {source}{where} ORDER BY turns.id DESC LIMIT ?", (*params, limit),
+            ).fetchall()
+    except sqlite3.OperationalError as exc:
+        if query and str(exc).startswith(FTS_QUERY_ERRORS):
+            raise ValueError(f"bad query: {exc}") from exc
+        raise
+    finally:
+        conn.close()
+    items: list[dict[str, object]] = [_turn_item(row) for row in rows]
+    return {"items": items, "next": items[-1]["id"] if len(items) == limit else None}
+
+
+def list_sessions(path: Path, before: str = "", limit: int = PAGE_LIMIT) -> dict[str, object]:
+    conn: sqlite3.Connection | None = _connect_readonly(path)
+    if conn is None:
+        return {"items": [], "next": None}
+    limit = _page_limit(limit)
+    try:
+        with conn:
+            rows: list[sqlite3.Row] = conn.execute(
+                "SELECT session, COUNT(*) AS turns, MIN(started_at) AS started_at, MAX(ended_at) AS ended_at, "
+                "SUM(parse_errors) AS parse_errors, SUM(vlm_seconds) AS vlm_seconds "
+                "FROM turns WHERE ? = '' OR session < ? GROUP BY session ORDER BY session DESC LIMIT ?",
+                (before, before, limit),
+            ).fetchall()
+    finally:
+        conn.close()
+    items: list[dict[str, object]] = [{name: row[name] for name in row.keys()} for row in rows]
+    return {"items": items, "next": items[-1]["session"] if len(items) == limit else None}
+
+
+def _stamp_seconds(stamp: str) -> float:
+    try:
+        return datetime.strptime(stamp, STAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _read_session(session_dir: Path) -> list[dict[str, object]]:
+    rows: dict[int, dict[str, object]] = {}
+    current: dict[str, object] | None = None
+    label: str = ""
+    lines: list[str] = []
+
+    def finish() -> None:
+        if current is not None and label in ("INPUT", "OUTPUT"):
+            current[label.lower()] = "\n".join(lines)
+
+    with (session_dir / "turns.txt").open("r", encoding="utf-8", errors="replace") as handle:
+        for raw_line in handle:
+            line: str = raw_line.rstrip("\n")
+            header: re.Match[str] | None = TURN_HEADER_RE.match(line)
+            if header is None:
+                lines.append(line)
+                continue
+            finish()
+            turn: int = int(header.group(1))
+            stamp: float = _stamp_seconds(header.group(2))
+            current = rows.setdefault(turn, {"session": session_dir.name, "turn": turn, "started_at": stamp})
+            current["ended_at"] = stamp
+            label = header.group(3)
+            lines = []
+        finish()
+    events_path: Path = session_dir / "events.jsonl"
+    if events_path.exists():
+        with events_path.open("r", encoding="utf-8", errors="replace") as handle:
+            for line in handle:
+                try:
+                    event: dict[str, object] = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                target: dict[str, object] | None = rows.get(int(event.get("turn", 0) or 0))
+                if target is not None and event.get("event") == "vlm":
+                    target["capture_seconds"] = float(event.get("capture_seconds", 0.0))
+                    target["vlm_seconds"] = float(event.get("seconds", 0.0))
+    return [rows[turn] for turn in sorted(rows)]
+
+
+def import_logs(path: Path, logs_root: Path) -> int:
+    conn: sqlite3.Connection = _connect(path)
+    imported: int = 0
+    try:
+        for turns_file in sorted(logs_root.glob("*/turns.txt")):
+            imported += _insert(conn, _read_session(turns_file.parent))
+    finally:
+        conn.close()
+    return imported
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    usage: str = (
+        "usage: python catalog.py sessions [--before SESSION] [--limit N] [--db PATH]\n"
+        "       python catalog.py turns [QUERY] [--session SESSION] [--errors] [--before ID] [--limit N] [--db PATH]\n"
+        "       python catalog.py import [LOGS_DIR] [--db PATH]\n"
+    )
+    if not args or args[0] not in ("sessions", "turns", "import"):
+        sys.stderr.write(usage)
+        raise SystemExit(1)
+    command: str = args[0]
+    positional: list[str] = []
+    options: dict[str, str] = {}
+    idx: int = 1
+    while idx < len(args):
+        match args[idx]:
+            case "--errors":
+                options["errors"] = "1"
+                idx += 1
+            case "--before" | "--limit" | "--session" | "--db" if idx + 1 < len(args):
+                options[args[idx][2:]] = args[idx + 1]
+                idx += 2
+            case _ if not args[idx].startswith("--"):
+                positional.append(args[idx])
+                idx += 1
+            case _:
+                sys.stderr.write(usage)
+                raise SystemExit(1)
+    logs_root: Path = Path(__file__).resolve().parent / "logs"
+    db_path: Path = Path(options.get("db", str(logs_root / CATALOG_FILE)))
+    page: dict[str, object]
+    match command:
+        case "import":
+            source: Path = Path(positional[0]) if positional else logs_root
+            print(f"Imported {import_logs(db_path, source)} turns from {source} into {db_path}")
+            return
+        case "sessions":
+            try:
+                page = list_sessions(db_path, options.get("before", ""), int(options.get("limit", PAGE_LIMIT)))
+            except sqlite3.Error as exc:
+                sys.stderr.write(f"catalog {db_path}: {exc}\n")
+                raise SystemExit(1)
+        case _:
+            try:
+                page = find_turns(
+                    db_path, " ".join(positional), options.get("session", ""), "errors" in options,
+                    int(options.get("before", "0")), int(options.get("limit", PAGE_LIMIT)),
+                )
+            except ValueError as exc:
+                sys.stderr.write(f"{exc}\n")
+                raise SystemExit(1)
+            except sqlite3.Error as exc:
+                sys.stderr.write(f"catalog {db_path}: {exc}\n")
+                raise SystemExit(1)
+    for item in page["items"]:
+        print(json.dumps(item, ensure_ascii=False))
+    if page["next"] is not None:
+        sys.stderr.write(f"more: --before {page['next']}\n")
+
+
+if __name__ == "__main__":
+    main()
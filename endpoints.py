@@ -0,0 +1,323 @@
+import http.client
+import math
+import queue
+import socket
+import threading
+import time
+import urllib.parse
+from collections import deque
+
+
+VLM_TIMEOUT: int = 120
+POOL_MAX_IDLE: int = 8
+HEDGE_PERCENTILE: float = 95.0
+HEDGE_MIN_SECONDS: float = 1.0
+HEDGE_MIN_SAMPLES: int = 8
+LATENCY_WINDOW: int = 64
+BREAKER_FAILURES: int = 3
+BREAKER_COOLDOWN: float = 15.0
+HEALTH_PATH: str = "/v1/models"
+HEALTH_TIMEOUT: float = 5.0
+MIN_ATTEMPT_TIMEOUT: float = 0.1
+HTTP_SERVER_ERROR: int = 500
+HTTP_PORT: int = 80
+HTTPS_PORT: int = 443
+HTTP_OK: int = 200
+
+
+class VlmFailure(Exception):
+    def __init__(self, kind: str, message: str) -> None:
+        super().__init__(f"{kind}: {message}")
+        self.kind: str = kind
+        self.message: str = message
+
+
+class ConnectionPool:
+    def __init__(self, url: str) -> None:
+        parts: urllib.parse.SplitResult = urllib.parse.urlsplit(url)
+        self.secure: bool = parts.scheme == "https"
+        self.host: str = parts.hostname or ""
+        self.port: int = parts.port or (HTTPS_PORT if self.secure else HTTP_PORT)
+        self.path: str = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+        self._idle: list[http.client.HTTPConnection] = []
+        self._lock: threading.Lock = threading.Lock()
+
+    def _acquire(self, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        with self._lock:
+            if self._idle:
+                conn: http.client.HTTPConnection = self._idle.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+        if self.secure:
+            return http.client.HTTPSConnection(self.host, self.port, timeout=timeout), False
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout), False
+
+    def _release(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            if len(self._idle) < POOL_MAX_IDLE:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def post(
+        self, body: list[bytes], timeout: float, ticket: "PostTicket | None" = None,
+        extra_headers: dict[str, str] | None = None,
+    ) -> tuple[int, bytes]:
+        headers: dict[str, str] = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+            "Content-Length": str(sum(len(buffer) for buffer in body)),
+            **(extra_headers or {}),
+        }
+        while True:
+            conn, reused = self._acquire(timeout)
+            try:
+                if conn.sock is None:
+                    conn.connect()
+            except BaseException:
+                conn.close()
+                raise
+            if ticket is not None and not ticket.attach(conn):
+                conn.close()
+                raise VlmFailure("cancelled", "request cancelled")
+            try:
+                conn.request("POST", self.path, body=body, headers=headers)
+                resp: http.client.HTTPResponse = conn.getresponse()
+                payload: bytes = resp.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                conn.close()
+                if reused and (ticket is None or not ticket.cancelled):
+                    continue
+                raise
+            except BaseException:
+                conn.close()
+                raise
+            if resp.will_close or (ticket is not None and ticket.cancelled):
+                conn.close()
+            else:
+                self._release(conn)
+            return resp.status, payload
+
+    def probe(self, path: str, timeout: float) -> bool:
+        conn: http.client.HTTPConnection = (
+            http.client.HTTPSConnection(self.host, self.port, timeout=timeout)
+            if self.secure
+            else http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        )
+        try:
+            conn.request("GET", path)
+            return conn.getresponse().status < HTTP_SERVER_ERROR
+        except (OSError, http.client.HTTPException):
+            return False
+        finally:
+            conn.close()
+
+
+class PostTicket:
+    def __init__(self) -> None:
+        self.conn: http.client.HTTPConnection | None = None
+        self.cancelled: bool = False
+        self._lock: threading.Lock = threading.Lock()
+
+    def attach(self, conn: http.client.HTTPConnection) -> bool:
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.conn = conn
+            return True
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            conn: http.client.HTTPConnection | None = self.conn
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class Endpoint:
+    def __init__(self, url: str) -> None:
+        self.url: str = url
+        self.pool: ConnectionPool = ConnectionPool(url)
+        self.in_flight: int = 0
+        self.failures: int = 0
+        self.opened_at: float = 0.0
+        self.probing: bool = False
+
+
+class EndpointPool:
+    def __init__(
+        self, urls: list[str], hedge_percentile: float, hedge_min_seconds: float,
+        failure_threshold: int, cooldown: float, health_path: str,
+    ) -> None:
+        self.endpoints: list[Endpoint] = [Endpoint(url) for url in urls]
+        self.hedge_percentile: float = hedge_percentile
+        self.hedge_min_seconds: float = hedge_min_seconds
+        self.failure_threshold: int = failure_threshold
+        self.cooldown: float = cooldown
+        self.health_path: str = health_path
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._lock: threading.Lock = threading.Lock()
+
+    def _usable(self, endpoint: Endpoint, now: float) -> bool:
+        if endpoint.failures < self.failure_threshold:
+            return True
+        if not endpoint.probing and now - endpoint.opened_at >= self.cooldown:
+            endpoint.probing = True
+            threading.Thread(target=self._probe, args=(endpoint,), daemon=True).start()
+        return False
+
+    def _probe(self, endpoint: Endpoint) -> None:
+        healthy: bool = endpoint.pool.probe(self.health_path, HEALTH_TIMEOUT)
+        with self._lock:
+            endpoint.probing = False
+            if healthy:
+                endpoint.failures = 0
+            else:
+                endpoint.opened_at = time.monotonic()
+
+    def _acquire(self, exclude: set[str]) -> Endpoint | None:
+        with self._lock:
+            now: float = time.monotonic()
+            candidates: list[Endpoint] = [
+                endpoint for endpoint in self.endpoints
+                if endpoint.url not in exclude and self._usable(endpoint, now)
+            ]
+            if not candidates:
+                return None
+            chosen: Endpoint = min(candidates, key=lambda endpoint: endpoint.in_flight)
+            chosen.in_flight += 1
+            return chosen
+
+    def _finish(self, endpoint: Endpoint, seconds: float, healthy: bool, cancelled: bool) -> None:
+        with self._lock:
+            endpoint.in_flight -= 1
+            if cancelled:
+                return
+            if healthy:
+                endpoint.failures = 0
+                self._latencies.append(seconds)
+                return
+            endpoint.failures += 1
+            if endpoint.failures >= self.failure_threshold:
+                endpoint.opened_at = time.monotonic()
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            ordered: list[float] = sorted(self._latencies)
+        if self.hedge_percentile <= 0 or len(self.endpoints) < 2 or len(ordered) < HEDGE_MIN_SAMPLES:
+            return math.inf
+        rank: int = max(0, math.ceil(self.hedge_percentile / 100 * len(ordered)) - 1)
+        return max(self.hedge_min_seconds, ordered[rank])
+
+    def _attempt(
+        self, endpoint: Endpoint, body: list[bytes], timeout: float, ticket: PostTicket, results: queue.Queue,
+        extra_headers: dict[str, str] | None,
+    ) -> None:
+        started: float = time.monotonic()
+        status: int = 0
+        payload: bytes = b""
+        error: Exception | None = None
+        try:
+            status, payload = endpoint.pool.post(body, timeout, ticket, extra_headers)
+        except (OSError, http.client.HTTPException, VlmFailure) as exc:
+            error = exc
+        healthy: bool = error is None and status < HTTP_SERVER_ERROR
+        self._finish(endpoint, time.monotonic() - started, healthy, ticket.cancelled)
+        results.put((endpoint, status, payload, error))
+
+    def post(
+        self, body: list[bytes], timeout: float, extra_headers: dict[str, str] | None = None,
+    ) -> tuple[int, bytes]:
+        deadline: float = time.monotonic() + timeout
+        results: queue.Queue = queue.Queue()
+        tickets: dict[str, PostTicket] = {}
+
+        def launch() -> int:
+            endpoint: Endpoint | None = self._acquire(set(tickets))
+            if endpoint is None:
+                return 0
+            ticket: PostTicket = PostTicket()
+            tickets[endpoint.url] = ticket
+            attempt_timeout: float = max(deadline - time.monotonic(), MIN_ATTEMPT_TIMEOUT)
+            threading.Thread(
+                target=self._attempt, args=(endpoint, body, attempt_timeout, ticket, results, extra_headers),
+                daemon=True,
+            ).start()
+            return 1
+
+        running: int = launch()
+        if not running:
+            raise VlmFailure("unavailable", "no VLM endpoint available (circuit breakers open)")
+        hedge_after: float = self.hedge_delay()
+        hedged: bool = math.isinf(hedge_after)
+        last: tuple[int, bytes, Exception | None] | None = None
+        while running:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                endpoint, status, payload, error = results.get(timeout=remaining if hedged else min(remaining, hedge_after))
+            except queue.Empty:
+                if not hedged:
+                    hedged = True
+                    running += launch()
+                continue
+            running -= 1
+            if error is None and status < HTTP_SERVER_ERROR:
+                for url, ticket in tickets.items():
+                    if url != endpoint.url:
+                        ticket.cancel()
+                return status, payload
+            last = (status, payload, error)
+            if not running:
+                running += launch()
+        for ticket in tickets.values():
+            ticket.cancel()
+        if last is None:
+            raise TimeoutError(f"no response in {timeout}s")
+        status, payload, error = last
+        if error is not None:
+            raise error
+        return status, payload
+
+    def warm(self, body: list[bytes], timeout: float) -> list[tuple[str, float, str]]:
+        results: list[tuple[str, float, str]] = []
+
+        def warm_one(endpoint: Endpoint) -> None:
+            started: float = time.monotonic()
+            error: str = ""
+            try:
+                status, _ = endpoint.pool.post(body, timeout)
+                if status != HTTP_OK:
+                    error = f"status {status}"
+            except (OSError, http.client.HTTPException, VlmFailure) as exc:
+                error = str(exc) or type(exc).__name__
+            results.append((endpoint.url, time.monotonic() - started, error))
+
+        threads: list[threading.Thread] = [
+            threading.Thread(target=warm_one, args=(endpoint,), daemon=True) for endpoint in self.endpoints
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def snapshot(self) -> list[dict[str, object]]:
+        with self._lock:
+            return [
+                {
+                    "url": endpoint.url,
+                    "in_flight": endpoint.in_flight,
+                    "failures": endpoint.failures,
+                    "open": endpoint.failures >= self.failure_threshold,
+                }
+                for endpoint in self.endpoints
+            ]
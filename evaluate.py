@@ -0,0 +1,195 @@
+import json
+import math
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from pathlib import Path
+
+from imaging import Frame
+
+
+EVAL_WORKERS: int = 4
+EVAL_BRAIN_FILE: str = "brain.py"
+EVAL_TOLERANCE: int = 50
+EVAL_IMAGE_SUFFIXES: tuple[str, ...] = (".png", ".frz")
+EVAL_EXPECTED_SUFFIX: str = ".expected.json"
+EVAL_REPORT_NAME: str = "eval_report.jsonl"
+EVAL_SUMMARY_NAME: str = "eval_summary.json"
+EVAL_COORD_KEYS: tuple[str, ...] = ("x", "y")
+
+
+_eval_router: object = None
+_eval_brain: object = None
+_eval_franz: object = None
+_eval_frame: Frame | None = None
+
+
+def _eval_init(brain_file: str, endpoints: list[str]) -> None:
+    global _eval_router, _eval_brain, _eval_franz
+    import router
+    _eval_router = router
+    _eval_franz = getattr(router, "_load_module")("franz", "franz.py")
+    _eval_brain = getattr(router, "_load_module")("brain", brain_file)
+    if endpoints:
+        getattr(router, "_runtime_overrides")["VLM_ENDPOINT_URLS"] = endpoints
+    brain: object = _eval_brain
+    vlm_request: object = getattr(router, "_vlm_request")
+    getattr(_eval_franz, "_bind_frame_source")(lambda max_age: _eval_frame)
+    getattr(_eval_franz, "_bind_vlm")(
+        lambda request: vlm_request(brain, request),
+        int(getattr(router, "_cfg")(brain, "VLM_MAX_CONCURRENCY", getattr(router, "VLM_MAX_CONCURRENCY"))),
+    )
+    getattr(_eval_franz, "_bind_similar")(getattr(router, "SCREENS").nearest)
+    on_start_fn: object = getattr(brain, "on_start", None)
+    if callable(on_start_fn):
+        try:
+            on_start_fn()
+        except Exception as exc:
+            print(f"on_start: {exc}", file=sys.stderr)
+
+
+def _load_eval_frame(path: Path, seq: int) -> Frame | None:
+    data: bytes = path.read_bytes()
+    if path.suffix.lower() == ".frz":
+        return Frame.from_frz(seq, "", data)
+    return Frame.from_png(seq, "", data)
+
+
+def _load_expected(path: Path) -> list[dict[str, object]] | None:
+    expected_path: Path = path.with_name(path.stem + EVAL_EXPECTED_SUFFIX)
+    if not expected_path.exists():
+        return None
+    loaded: object = json.loads(expected_path.read_text(encoding="utf-8"))
+    return loaded if isinstance(loaded, list) else None
+
+
+def _action_matches(actual: dict[str, object], expected: dict[str, object]) -> bool:
+    for key, value in expected.items():
+        if key in EVAL_COORD_KEYS:
+            if not isinstance(actual.get(key), int) or abs(int(actual[key]) - int(value)) > EVAL_TOLERANCE:
+                return False
+        elif actual.get(key) != value:
+            return False
+    return True
+
+
+def _eval_one(path_str: str, seq: int) -> dict[str, object]:
+    global _eval_frame
+    path: Path = Path(path_str)
+    result: dict[str, object] = {"image": path.name}
+    frame: Frame | None = _load_eval_frame(path, seq)
+    if frame is None:
+        result["error"] = "unreadable image"
+        return result
+    router: object = _eval_router
+    franz: object = _eval_franz
+    brain: object = _eval_brain
+    _eval_frame = frame
+    started: float = time.monotonic()
+    narrator: dict[str, object] = getattr(router, "_vlm_request")(brain, {
+        "text": getattr(router, "FIRST_TURN_PROMPT"),
+        "image": frame.resized(*getattr(router, "_vlm_size")(brain)),
+        "system": str(getattr(brain, "SYSTEM_PROMPT", "")),
+    })
+    result["narrator"] = narrator["text"]
+    result["narrator_seconds"] = narrator["seconds"]
+    found_actions: list[dict[str, object]] = []
+    parse_errors: list[dict[str, object]] = []
+    if narrator["error"]:
+        result["error"] = f"{narrator['kind']}: {narrator['error']}"
+    else:
+        turn_handle, turn_token = getattr(franz, "_begin_turn")()
+        try:
+            getattr(brain, "on_vlm_response")(str(narrator["text"]))
+        except Exception as exc:
+            result["error"] = f"on_vlm_response: {exc}"
+        found_actions, _, parse_errors = getattr(franz, "_end_turn")(turn_handle, turn_token)
+    result["seconds"] = time.monotonic() - started
+    result["actions"] = found_actions
+    result["parse_errors"] = parse_errors
+    expected: list[dict[str, object]] | None = _load_expected(path)
+    if expected is not None:
+        result["expected"] = expected
+        result["correct"] = len(found_actions) == len(expected) and all(
+            _action_matches(actual, wanted) for actual, wanted in zip(found_actions, expected)
+        )
+    return result
+
+
+def _read_report(report_path: Path) -> dict[str, dict[str, object]]:
+    done: dict[str, dict[str, object]] = {}
+    if not report_path.exists():
+        return done
+    for line in report_path.read_text(encoding="utf-8").splitlines():
+        try:
+            entry: object = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(entry, dict) and "image" in entry:
+            done[str(entry["image"])] = entry
+    return done
+
+
+def _eval_summary(entries: list[dict[str, object]]) -> dict[str, object]:
+    latencies: list[float] = sorted(float(entry["seconds"]) for entry in entries if "seconds" in entry)
+    graded: list[dict[str, object]] = [entry for entry in entries if "correct" in entry]
+    return {
+        "images": len(entries),
+        "errors": sum(1 for entry in entries if entry.get("error")),
+        "parse_failures": sum(len(entry.get("parse_errors", [])) for entry in entries),
+        "actions": sum(len(entry.get("actions", [])) for entry in entries),
+        "mean_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+        "p95_seconds": latencies[max(0, math.ceil(0.95 * len(latencies)) - 1)] if latencies else 0.0,
+        "graded": len(graded),
+        "accuracy": sum(1 for entry in graded if entry["correct"]) / len(graded) if graded else None,
+    }
+
+
+def run_eval(args: list[str]) -> None:
+    def get_arg(name: str, default: str = "") -> str:
+        flag: str = f"--{name}"
+        for idx in range(len(args)):
+            if args[idx] == flag and idx + 1 < len(args):
+                return args[idx + 1]
+        return default
+
+    if not args or args[0].startswith("--"):
+        print(
+            "usage: python router.py eval <folder> [--brain brain.py] [--workers N]"
+            " [--out report.jsonl] [--endpoints url,url]"
+        )
+        raise SystemExit(1)
+    folder: Path = Path(args[0])
+    brain_file: str = get_arg("brain", EVAL_BRAIN_FILE)
+    workers: int = int(get_arg("workers", str(EVAL_WORKERS)))
+    report_path: Path = Path(get_arg("out", str(folder / EVAL_REPORT_NAME)))
+    endpoints: list[str] = [url for url in get_arg("endpoints").split(",") if url]
+    images: list[Path] = sorted(
+        path for path in folder.iterdir()
+        if path.suffix.lower() in EVAL_IMAGE_SUFFIXES and not path.name.endswith(EVAL_EXPECTED_SUFFIX)
+    )
+    done: dict[str, dict[str, object]] = _read_report(report_path)
+    pending: list[Path] = [path for path in images if path.name not in done or done[path.name].get("error")]
+    print(f"eval: {brain_file}, {len(images)} images, {len(images) - len(pending)} already done, {workers} workers")
+
+    with report_path.open("a", encoding="utf-8") as report, ProcessPoolExecutor(
+        max_workers=max(1, workers), initializer=_eval_init, initargs=(brain_file, endpoints),
+    ) as pool:
+        futures: dict[object, Path] = {
+            pool.submit(_eval_one, str(path), seq): path for seq, path in enumerate(pending, start=1)
+        }
+        for finished, future in enumerate(as_completed(futures), start=1):
+            try:
+                entry: dict[str, object] = future.result()
+            except Exception as exc:
+                entry = {"image": futures[future].name, "error": f"worker: {exc}"}
+            done[str(entry["image"])] = entry
+            report.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            report.flush()
+            status: str = entry.get("error") or f"{len(entry.get('actions', []))} actions"
+            print(f"[{finished}/{len(pending)}] {entry['image']}: {status}")
+
+    summary: dict[str, object] = _eval_summary([done[path.name] for path in images if path.name in done])
+    report_path.with_name(EVAL_SUMMARY_NAME).write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    print(json.dumps(summary, indent=2))
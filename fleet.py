@@ -0,0 +1,278 @@
+import http.client
+import http.server
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from endpoints import ConnectionPool
+from endpoints import HEALTH_PATH
+from endpoints import HTTP_OK
+from endpoints import VLM_TIMEOUT
+from endpoints import VlmFailure
+from imaging import NO_RESIZE
+
+
+HERE: Path = Path(__file__).resolve().parent
+
+FLEET_PORT: int = 1300
+FLEET_ENDPOINT_CONCURRENCY: int = 1
+FLEET_DESKTOP_HEADER: str = "X-Franz-Desktop"
+FLEET_PRIORITY_HEADER: str = "X-Franz-Priority"
+FLEET_PRIORITIES: dict[str, int] = {"turn": 0, "background": 1}
+FLEET_DEFAULT_PRIORITY: str = "background"
+FLEET_CHAT_PATH: str = "/v1/chat/completions"
+FLEET_STATE_TIMEOUT: float = 1.0
+HTTP_BAD_GATEWAY: int = 502
+SECONDS_PER_MINUTE: float = 60.0
+
+
+class FleetTicket:
+    __slots__ = ("desktop", "rank", "seq", "enqueued", "endpoint")
+
+    def __init__(self, desktop: str, rank: int, seq: int) -> None:
+        self.desktop: str = desktop
+        self.rank: int = rank
+        self.seq: int = seq
+        self.enqueued: float = time.monotonic()
+        self.endpoint: "FleetEndpoint | None" = None
+
+
+class FleetEndpoint:
+    def __init__(self, url: str, limit: int) -> None:
+        self.url: str = url
+        self.limit: int = max(1, limit)
+        self.pool: ConnectionPool = ConnectionPool(url)
+        self.active: int = 0
+        self.served: int = 0
+
+
+class DesktopUsage:
+    def __init__(self) -> None:
+        self.requests: dict[str, int] = {name: 0 for name in FLEET_PRIORITIES}
+        self.waiting: int = 0
+        self.errors: int = 0
+        self.wait_seconds: float = 0.0
+        self.service_seconds: float = 0.0
+        self.last_dispatch: float = 0.0
+
+    def to_json(self) -> dict[str, object]:
+        finished: int = max(1, sum(self.requests.values()) - self.waiting)
+        return {
+            "requests": dict(self.requests),
+            "waiting": self.waiting,
+            "errors": self.errors,
+            "avg_wait_seconds": self.wait_seconds / finished,
+            "avg_service_seconds": self.service_seconds / finished,
+        }
+
+
+class VlmScheduler:
+    def __init__(self, endpoints: list[FleetEndpoint]) -> None:
+        self.endpoints: list[FleetEndpoint] = endpoints
+        self._waiting: list[FleetTicket] = []
+        self._usage: dict[str, DesktopUsage] = {}
+        self._seq: int = 0
+        self._changed: threading.Condition = threading.Condition()
+
+    def _dispatch(self) -> None:
+        while self._waiting:
+            free: list[FleetEndpoint] = [endpoint for endpoint in self.endpoints if endpoint.active < endpoint.limit]
+            if not free:
+                return
+            endpoint: FleetEndpoint = min(free, key=lambda candidate: candidate.active / candidate.limit)
+            ticket: FleetTicket = min(
+                self._waiting,
+                key=lambda waiting: (waiting.rank, self._usage[waiting.desktop].last_dispatch, waiting.seq),
+            )
+            self._waiting.remove(ticket)
+            usage: DesktopUsage = self._usage[ticket.desktop]
+            now: float = time.monotonic()
+            usage.waiting -= 1
+            usage.wait_seconds += now - ticket.enqueued
+            usage.last_dispatch = now
+            endpoint.active += 1
+            endpoint.served += 1
+            ticket.endpoint = endpoint
+            self._changed.notify_all()
+
+    def submit(self, desktop: str, priority: str, body: bytes, timeout: float) -> tuple[int, bytes]:
+        if priority not in FLEET_PRIORITIES:
+            priority = FLEET_DEFAULT_PRIORITY
+        with self._changed:
+            self._seq += 1
+            ticket: FleetTicket = FleetTicket(desktop, FLEET_PRIORITIES[priority], self._seq)
+            usage: DesktopUsage = self._usage.setdefault(desktop, DesktopUsage())
+            usage.requests[priority] += 1
+            usage.waiting += 1
+            self._waiting.append(ticket)
+            self._dispatch()
+            self._changed.wait_for(lambda: ticket.endpoint is not None)
+        endpoint: FleetEndpoint = ticket.endpoint
+        started: float = time.monotonic()
+        failed: bool = True
+        try:
+            status, payload = endpoint.pool.post([body], timeout)
+            failed = status != HTTP_OK
+            return status, payload
+        finally:
+            with self._changed:
+                endpoint.active -= 1
+                usage.service_seconds += time.monotonic() - started
+                usage.errors += int(failed)
+                self._dispatch()
+
+    def snapshot(self) -> dict[str, object]:
+        with self._changed:
+            return {
+                "queued": len(self._waiting),
+                "endpoints": [
+                    {"url": endpoint.url, "active": endpoint.active, "limit": endpoint.limit, "served": endpoint.served}
+                    for endpoint in self.endpoints
+                ],
+                "desktops": {name: usage.to_json() for name, usage in self._usage.items()},
+            }
+
+
+class FleetDesktop:
+    def __init__(self, spec: dict[str, object], fleet_url: str) -> None:
+        self.name: str = str(spec["name"])
+        self.host: str = str(spec.get("host", "127.0.0.1"))
+        self.port: int = int(spec["port"])
+        self.started: float = time.monotonic()
+        region: str = str(spec.get("region", ""))
+        overrides: dict[str, object] = {
+            "FLEET_DESKTOP": self.name,
+            "SERVER_HOST": self.host,
+            "SERVER_PORT": self.port,
+            "CAPTURE_REGION": region,
+            "DESKTOP_AGENT": str(spec.get("agent", "")),
+            "DESKTOP_AGENT_TOKEN": str(spec.get("token", "")),
+            "VLM_ENDPOINT_URLS": [fleet_url],
+            "VLM_HEDGE_PERCENTILE": 0.0,
+        }
+        if region:
+            overrides["CAPTURE_WIDTH"] = NO_RESIZE
+            overrides["CAPTURE_HEIGHT"] = NO_RESIZE
+        launch: str = json.dumps({"brain": str(spec.get("brain", "brain.py")), "overrides": overrides})
+        self.proc: subprocess.Popen[bytes] = subprocess.Popen(
+            [sys.executable, str(HERE / "router.py"), "desktop", launch],
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env={**os.environ, "PYTHONUNBUFFERED": "1"},
+        )
+        threading.Thread(target=self._echo, daemon=True).start()
+
+    def _echo(self) -> None:
+        for line in self.proc.stdout:
+            print(f"[{self.name}] {line.decode('utf-8', 'replace').rstrip()}")
+
+    def status(self) -> dict[str, object]:
+        entry: dict[str, object] = {
+            "name": self.name,
+            "url": f"http://{self.host}:{self.port}",
+            "running": self.proc.poll() is None,
+        }
+        try:
+            with urllib.request.urlopen(f"http://{self.host}:{self.port}/state", timeout=FLEET_STATE_TIMEOUT) as resp:
+                state: object = json.loads(resp.read().decode("utf-8"))
+        except (OSError, ValueError) as exc:
+            entry["error"] = str(exc) or type(exc).__name__
+            return entry
+        if not isinstance(state, dict):
+            return entry
+        vlm: object = state.get("vlm")
+        turn: int = int(state.get("turn", 0) or 0)
+        minutes: float = (time.monotonic() - self.started) / SECONDS_PER_MINUTE
+        entry.update({
+            "phase": state.get("phase"),
+            "turn": turn,
+            "error": state.get("error"),
+            "turns_per_minute": turn / minutes if minutes > 0 else 0.0,
+            "vlm": vlm if isinstance(vlm, dict) else {},
+        })
+        return entry
+
+
+_fleet_scheduler: VlmScheduler | None = None
+_fleet_desktops: list[FleetDesktop] = []
+
+
+class FleetHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, format_str: str, *args: object) -> None:
+        pass
+
+    def _send_json_bytes(self, code: int, body: bytes) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self) -> None:
+        path: str = self.path.split("?", 1)[0]
+        match path:
+            case "/fleet" | "/":
+                self._send_json_bytes(200, json.dumps({
+                    "desktops": [desktop.status() for desktop in _fleet_desktops],
+                    "scheduler": _fleet_scheduler.snapshot() if _fleet_scheduler is not None else {},
+                }, ensure_ascii=False).encode("utf-8"))
+            case _ if path == HEALTH_PATH:
+                self._send_json_bytes(200, b'{"object": "list", "data": []}')
+            case _:
+                self._send_json_bytes(404, b'{"error": "not found"}')
+
+    def do_POST(self) -> None:
+        path: str = self.path.split("?", 1)[0]
+        content_length: int = int(self.headers.get("Content-Length", "0"))
+        body: bytes = self.rfile.read(content_length) if content_length > 0 else b""
+        if path != FLEET_CHAT_PATH or _fleet_scheduler is None:
+            self._send_json_bytes(404, b'{"error": "not found"}')
+            return
+        desktop: str = self.headers.get(FLEET_DESKTOP_HEADER, "") or self.client_address[0]
+        priority: str = self.headers.get(FLEET_PRIORITY_HEADER, FLEET_DEFAULT_PRIORITY)
+        try:
+            status, payload = _fleet_scheduler.submit(desktop, priority, body, VLM_TIMEOUT)
+        except (OSError, http.client.HTTPException, VlmFailure) as exc:
+            self._send_json_bytes(HTTP_BAD_GATEWAY, json.dumps({"error": str(exc) or type(exc).__name__}).encode("utf-8"))
+            return
+        self._send_json_bytes(status, payload)
+
+
+def run_fleet(args: list[str]) -> None:
+    global _fleet_scheduler
+    if not args:
+        print("usage: python router.py fleet <fleet.json>")
+        raise SystemExit(1)
+    config: object = json.loads(Path(args[0]).read_text(encoding="utf-8"))
+    if not isinstance(config, dict) or not config.get("desktops") or not config.get("endpoints"):
+        print("ERROR: fleet config needs \"endpoints\" and \"desktops\"")
+        raise SystemExit(1)
+    default_limit: int = int(config.get("endpoint_concurrency", FLEET_ENDPOINT_CONCURRENCY))
+    endpoints: list[FleetEndpoint] = [
+        FleetEndpoint(entry, default_limit) if isinstance(entry, str)
+        else FleetEndpoint(str(entry["url"]), int(entry.get("concurrency", default_limit)))
+        for entry in config["endpoints"]
+    ]
+    host: str = str(config.get("host", "127.0.0.1"))
+    port: int = int(config.get("port", FLEET_PORT))
+    _fleet_scheduler = VlmScheduler(endpoints)
+    server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer((host, port), FleetHandler)
+    fleet_url: str = f"http://{host}:{port}{FLEET_CHAT_PATH}"
+    for spec in config["desktops"]:
+        desktop: FleetDesktop = FleetDesktop(spec, fleet_url)
+        _fleet_desktops.append(desktop)
+        print(f"Desktop {desktop.name}: http://{desktop.host}:{desktop.port}")
+    print(f"Fleet dashboard: http://{host}:{port}/fleet")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping fleet.")
+        server.shutdown()
+    finally:
+        for desktop in _fleet_desktops:
+            desktop.proc.terminate()
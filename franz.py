@@ -1,28 +1,163 @@
+import contextvars
+import json
 import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 
 NORM_MIN: int = 0
 NORM_MAX: int = 1000
+LABEL_FONT_SIZE: int = 10
+STYLE_CACHE_LIMIT: int = 1024
+PIPE_CAPACITY: int = 1024
+SIMILAR_K: int = 5
+SIMILAR_MAX_DISTANCE: int = 10
 
 
-_action_pipe: list[dict[str, object]] = []
-_overlay_pipe: list[dict[str, object]] = []
+class Turn:
+    __slots__ = ("capacity", "_actions", "_overlays", "_parse_errors", "_closed", "_lock")
+
+    def __init__(self, capacity: int = PIPE_CAPACITY) -> None:
+        self.capacity: int = max(1, capacity)
+        self._actions: list[dict[str, object]] = []
+        self._overlays: list[object] = []
+        self._parse_errors: list[dict[str, object]] = []
+        self._closed: bool = False
+        self._lock: threading.Lock = threading.Lock()
+
+    def _push(self, pipe: list[object], name: str, item: object) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError(f"{name}() called after its turn ended")
+            if len(pipe) >= self.capacity:
+                raise RuntimeError(f"{name}() pipe is full ({self.capacity} per turn)")
+            pipe.append(item)
+
+    def actions(self, action: dict[str, object]) -> None:
+        self._push(self._actions, "actions", action)
+
+    def overlays(self, overlay: object) -> None:
+        self._push(self._overlays, "overlays", overlay)
+
+    def _drain(self) -> tuple[list[dict[str, object]], list[object], list[dict[str, object]]]:
+        with self._lock:
+            self._closed = True
+            return self._actions, self._overlays, self._parse_errors
+
+
+_turn: contextvars.ContextVar[Turn | None] = contextvars.ContextVar("franz_turn", default=None)
+_frame_source: object = None
+_vlm_source: object = None
+_vlm_executor: ThreadPoolExecutor | None = None
+_similar_source: object = None
+
+
+def current_turn() -> Turn:
+    found: Turn | None = _turn.get()
+    if found is None:
+        raise RuntimeError(
+            "actions() and overlays() only work inside on_vlm_response; "
+            "pass franz.current_turn() to other threads and call .actions()/.overlays() on it"
+        )
+    return found
 
 
 def actions(action: dict[str, object]) -> None:
-    _action_pipe.append(action)
+    current_turn().actions(action)
+
+
+def overlays(overlay: object) -> None:
+    current_turn().overlays(overlay)
+
+
+def _begin_turn(capacity: int = PIPE_CAPACITY) -> tuple[Turn, contextvars.Token]:
+    started: Turn = Turn(capacity)
+    return started, _turn.set(started)
+
+
+def _end_turn(
+    ended: Turn, token: contextvars.Token,
+) -> tuple[list[dict[str, object]], list[object], list[dict[str, object]]]:
+    _turn.reset(token)
+    return ended._drain()
+
+
+def _bind_frame_source(source: object) -> None:
+    global _frame_source
+    _frame_source = source
 
 
-def overlays(overlay: dict[str, object]) -> None:
-    _overlay_pipe.append(overlay)
+def current_frame(width: int = 0, height: int = 0, max_age: float | None = None) -> object:
+    if _frame_source is None:
+        raise RuntimeError("current_frame() is only available inside the franz engine")
+    frame: object = _frame_source(max_age)
+    if frame is None:
+        return None
+    return frame.resized(width, height)
 
 
-def _flush_pipes() -> tuple[list[dict[str, object]], list[dict[str, object]]]:
-    flushed_actions: list[dict[str, object]] = list(_action_pipe)
-    flushed_overlays: list[dict[str, object]] = list(_overlay_pipe)
-    _action_pipe.clear()
-    _overlay_pipe.clear()
-    return flushed_actions, flushed_overlays
+def _bind_similar(source: object) -> None:
+    global _similar_source
+    _similar_source = source
+
+
+def similar_frames(
+    k: int = SIMILAR_K, max_distance: int = SIMILAR_MAX_DISTANCE, frame: object = None,
+) -> list[dict[str, object]]:
+    if _similar_source is None:
+        raise RuntimeError("similar_frames() is only available inside the franz engine")
+    target: object = frame if frame is not None else current_frame()
+    screen_hash: int | None = target.dhash() if target is not None else None
+    if screen_hash is None:
+        return []
+    return _similar_source(screen_hash, k, max_distance)
+
+
+class VlmError(Exception):
+    def __init__(self, kind: str, message: str) -> None:
+        super().__init__(f"{kind}: {message}")
+        self.kind: str = kind
+        self.message: str = message
+
+
+def _bind_vlm(source: object, max_workers: int) -> None:
+    global _vlm_source, _vlm_executor
+    if _vlm_executor is not None:
+        _vlm_executor.shutdown(wait=False)
+    _vlm_source = source
+    _vlm_executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="franz-vlm")
+
+
+def _vlm_call(request: dict[str, object]) -> dict[str, object]:
+    if _vlm_source is None:
+        raise RuntimeError("vlm() is only available inside the franz engine")
+    started: float = time.monotonic()
+    try:
+        return _vlm_source(request)
+    except Exception as exc:
+        return {
+            "text": "", "error": str(exc) or type(exc).__name__,
+            "kind": "internal", "seconds": time.monotonic() - started,
+        }
+
+
+def vlm(
+    text: str = "", image: object = None, system: str = "",
+    timeout: float | None = None, **params: object,
+) -> str:
+    result: dict[str, object] = _vlm_call(
+        {"text": text, "image": image, "system": system, "timeout": timeout, **params}
+    )
+    if result["error"]:
+        raise VlmError(str(result["kind"]), str(result["error"]))
+    return str(result["text"])
+
+
+def vlm_many(requests: list[dict[str, object]]) -> list[dict[str, object]]:
+    if _vlm_executor is None:
+        raise RuntimeError("vlm_many() is only available inside the franz engine")
+    return list(_vlm_executor.map(_vlm_call, requests))
 
 
 def _clamp(value: int) -> int:
@@ -69,6 +204,197 @@ def drag_end(x: int, y: int) -> dict[str, object]:
     return {"type": "drag_end", "x": _clamp(x), "y": _clamp(y)}
 
 
+class Style:
+    __slots__ = ("stroke", "fill", "font_size", "bg", "color", "align")
+
+    def __init__(
+        self, stroke: str, fill: str, font_size: int, bg: str, color: str, align: str,
+    ) -> None:
+        self.stroke: str = stroke
+        self.fill: str = fill
+        self.font_size: int = font_size
+        self.bg: str = bg
+        self.color: str = color
+        self.align: str = align
+
+    def as_list(self) -> list[object]:
+        return [self.stroke, self.fill, self.font_size, self.bg, self.color, self.align]
+
+
+_styles: dict[tuple[str, str, int, str, str, str], Style] = {}
+_styles_lock: threading.Lock = threading.Lock()
+
+
+def style(
+    stroke: str = "", fill: str = "", font_size: int = LABEL_FONT_SIZE,
+    bg: str = "", color: str = "", align: str = "left",
+) -> Style:
+    key: tuple[str, str, int, str, str, str] = (stroke, fill, font_size, bg, color, align)
+    found: Style | None = _styles.get(key)
+    if found is None:
+        with _styles_lock:
+            if len(_styles) >= STYLE_CACHE_LIMIT:
+                _styles.clear()
+            found = _styles.setdefault(key, Style(*key))
+    return found
+
+
+class Overlay:
+    __slots__ = ("points", "closed", "style", "label", "label_x", "label_y", "extra")
+
+    def __init__(
+        self, points: tuple[int, ...], closed: bool, overlay_style: Style,
+        label: str, label_x: int, label_y: int, extra: dict[str, object] | None = None,
+    ) -> None:
+        self.points: tuple[int, ...] = points
+        self.closed: bool = closed
+        self.style: Style = overlay_style
+        self.label: str = label
+        self.label_x: int = label_x
+        self.label_y: int = label_y
+        self.extra: dict[str, object] | None = extra
+
+    def to_dict(self) -> dict[str, object]:
+        result: dict[str, object] = dict(self.extra or {})
+        result.update({
+            "points": [[self.points[idx], self.points[idx + 1]] for idx in range(0, len(self.points), 2)],
+            "closed": self.closed,
+            "stroke": self.style.stroke,
+            "fill": self.style.fill,
+            "label": self.label,
+            "label_position": [self.label_x, self.label_y],
+            "label_style": {
+                "font_size": self.style.font_size, "bg": self.style.bg,
+                "color": self.style.color, "align": self.style.align,
+            },
+        })
+        return result
+
+
+_OVERLAY_KEYS: frozenset[str] = frozenset(
+    {"points", "closed", "stroke", "fill", "label", "label_position", "label_style"}
+)
+
+
+def _as_overlay(item: object) -> Overlay:
+    if isinstance(item, Overlay):
+        return item
+    if not isinstance(item, dict):
+        raise TypeError(f"overlay must be an Overlay or dict, got {type(item).__name__}")
+    flat: list[int] = []
+    for point in item.get("points", []) or []:
+        flat.extend((int(point[0]), int(point[1])))
+    label_style: object = item.get("label_style") or {}
+    if not isinstance(label_style, dict):
+        label_style = {}
+    stroke: str = str(item.get("stroke", "") or "")
+    label_position: object = item.get("label_position") or flat[:2] or [0, 0]
+    extra: dict[str, object] = {key: value for key, value in item.items() if key not in _OVERLAY_KEYS}
+    return Overlay(
+        tuple(flat),
+        bool(item.get("closed", False)),
+        style(
+            stroke,
+            str(item.get("fill", "") or ""),
+            int(label_style.get("font_size", LABEL_FONT_SIZE) or LABEL_FONT_SIZE),
+            str(label_style.get("bg", "") or ""),
+            str(label_style.get("color", "") or ""),
+            str(label_style.get("align", "left") or "left"),
+        ),
+        str(item.get("label", "") or ""),
+        int(label_position[0]),
+        int(label_position[1]),
+        extra or None,
+    )
+
+
+def _encode_overlays(items: list[object]) -> tuple[list[Overlay], bytes]:
+    records: list[Overlay] = [_as_overlay(item) for item in items]
+    table: dict[int, int] = {}
+    styles: list[list[object]] = []
+    rows: list[list[object]] = []
+    for record in records:
+        style_idx: int | None = table.get(id(record.style))
+        if style_idx is None:
+            style_idx = len(styles)
+            table[id(record.style)] = style_idx
+            styles.append(record.style.as_list())
+        row: list[object] = [
+            style_idx, int(record.closed), record.points,
+            record.label, record.label_x, record.label_y,
+        ]
+        if record.extra:
+            row.append(record.extra)
+        rows.append(row)
+    encoded: bytes = json.dumps(
+        {"styles": styles, "items": rows}, ensure_ascii=False, separators=(",", ":"),
+    ).encode("utf-8")
+    return records, encoded
+
+
+class Layer:
+    __slots__ = ("name", "static", "version", "_items", "_dirty", "_encoded", "_lock")
+
+    def __init__(self, name: str, static: bool) -> None:
+        self.name: str = name
+        self.static: bool = static
+        self.version: int = 0
+        self._items: list[object] = []
+        self._dirty: bool = True
+        self._encoded: bytes = b""
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, overlay: object) -> None:
+        with self._lock:
+            self._items.append(overlay)
+            self._dirty = True
+
+    def set(self, items: list[object]) -> None:
+        copied: list[object] = list(items)
+        with self._lock:
+            self._items = copied
+            self._dirty = True
+
+    def clear(self) -> None:
+        with self._lock:
+            if self._items:
+                self._items = []
+                self._dirty = True
+
+    def _flush(self) -> tuple[str, int, bytes]:
+        with self._lock:
+            if self._dirty:
+                encoded: bytes = _encode_overlays(self._items)[1]
+                if encoded != self._encoded:
+                    self._encoded = encoded
+                    self.version += 1
+                self._dirty = False
+            if not self.static and self._items:
+                self._items = []
+                self._dirty = True
+            return self.name, self.version, self._encoded
+
+
+_layers: dict[str, Layer] = {}
+_layers_lock: threading.Lock = threading.Lock()
+
+
+def layer(name: str, static: bool = True) -> Layer:
+    with _layers_lock:
+        found: Layer | None = _layers.get(name)
+        if found is None:
+            found = Layer(name, static)
+            _layers[name] = found
+        found.static = static
+    return found
+
+
+def _flush_layers() -> list[tuple[str, int, bytes]]:
+    with _layers_lock:
+        found: list[Layer] = list(_layers.values())
+    return [entry._flush() for entry in found]
+
+
 def dot(
     x: int, y: int, label: str = "", color: str = "#00ff00",
 ) -> dict[str, object]:
@@ -79,7 +405,7 @@ def dot(
         "fill": "",
         "label": label,
         "label_position": [x, y],
-        "label_style": {"font_size": 10, "bg": "", "color": color, "align": "left"},
+        "label_style": {"font_size": LABEL_FONT_SIZE, "bg": "", "color": color, "align": "left"},
     }
 
 
@@ -94,9 +420,7 @@ def box(
         "fill": fill_color,
         "label": label,
         "label_position": [x1, y1],
-        "label_style": {
-            "font_size": 10, "bg": "", "color": stroke_color, "align": "left",
-        },
+        "label_style": {"font_size": LABEL_FONT_SIZE, "bg": "", "color": stroke_color, "align": "left"},
     }
 
 
@@ -110,5 +434,126 @@ def line(
         "fill": "",
         "label": label,
         "label_position": points[0] if points else [0, 0],
-        "label_style": {"font_size": 10, "bg": "", "color": color, "align": "left"},
+        "label_style": {"font_size": LABEL_FONT_SIZE, "bg": "", "color": color, "align": "left"},
     }
+
+
+_COORD_TOOLS: dict[str, object] = {
+    "click": click,
+    "double_click": double_click,
+    "right_click": right_click,
+    "scroll_up": scroll_up,
+    "scroll_down": scroll_down,
+    "drag_start": drag_start,
+    "drag_end": drag_end,
+}
+_TEXT_TOOLS: dict[str, object] = {
+    "type_text": type_text,
+    "press_key": press_key,
+    "hotkey": hotkey,
+}
+_TOOL_ALIASES: dict[str, str] = {
+    "left_click": "click",
+    "doubleclick": "double_click",
+    "rightclick": "right_click",
+    "type": "type_text",
+    "key": "press_key",
+}
+_TOOL_CALL_RE: re.Pattern[str] = re.compile(
+    r"(?P<name>\b[A-Za-z_]\w*)[ \t]*\((?P<args>[^()\n]*)\)"
+    r"|(?P<json>\{[^{}]*\"(?:bbox_2d|point_2d)\"[^{}]*\})"
+)
+_NUMBER_RE: re.Pattern[str] = re.compile(r"-?\d+(?:\.\d+)?")
+_QUOTES: tuple[str, ...] = ("\"", "'", "`")
+_POINT_ARITY: int = 2
+_BBOX_ARITY: int = 4
+
+
+def _unquote(value: str) -> str:
+    stripped: str = value.strip()
+    if len(stripped) >= 2 and stripped[0] == stripped[-1] and stripped[0] in _QUOTES:
+        return stripped[1:-1]
+    return stripped
+
+
+def _point_from(numbers: list[float]) -> tuple[int, int]:
+    if len(numbers) == _POINT_ARITY:
+        return round(numbers[0]), round(numbers[1])
+    if len(numbers) == _BBOX_ARITY:
+        return round((numbers[0] + numbers[2]) / 2), round((numbers[1] + numbers[3]) / 2)
+    raise ValueError(f"expected 2 coordinates or a 4-number box, got {len(numbers)} numbers")
+
+
+def _canonical_tool(name: str) -> str:
+    tool: str = _TOOL_ALIASES.get(name, name)
+    if tool in _COORD_TOOLS or tool in _TEXT_TOOLS:
+        return tool
+    return ""
+
+
+def _build_action(name: str, args: str) -> dict[str, object]:
+    tool: str = _TOOL_ALIASES.get(name, name)
+    coord_helper: object = _COORD_TOOLS.get(tool)
+    if coord_helper is not None:
+        x_val, y_val = _point_from([float(num) for num in _NUMBER_RE.findall(args)])
+        return coord_helper(x_val, y_val)
+    text_helper: object = _TEXT_TOOLS.get(tool)
+    if text_helper is not None:
+        value: str = _unquote(args)
+        if not value:
+            raise ValueError("missing argument")
+        return text_helper(value)
+    raise KeyError(name)
+
+
+def _build_json_action(raw: str) -> dict[str, object]:
+    parsed: object = json.loads(raw)
+    if not isinstance(parsed, dict):
+        raise ValueError("expected a JSON object")
+    tool: str = "click"
+    for key in ("action", "type", "tool", "label"):
+        candidate: object = parsed.get(key)
+        if isinstance(candidate, str) and _canonical_tool(candidate.strip().lower().replace(" ", "_")):
+            tool = _canonical_tool(candidate.strip().lower().replace(" ", "_"))
+            break
+    if tool in _TEXT_TOOLS:
+        for key in ("text", "params", "key", "keys"):
+            value: object = parsed.get(key)
+            if isinstance(value, str) and value:
+                return _TEXT_TOOLS[tool](value)
+        raise ValueError(f"{tool}: missing text")
+    coords: object = parsed.get("bbox_2d", parsed.get("point_2d"))
+    if not isinstance(coords, list) or not all(isinstance(num, int | float) for num in coords):
+        raise ValueError("bbox_2d/point_2d must be a list of numbers")
+    x_val, y_val = _point_from([float(num) for num in coords])
+    return _COORD_TOOLS[tool](x_val, y_val)
+
+
+def parse_tool_calls(text: str) -> tuple[list[dict[str, object]], list[dict[str, object]]]:
+    found: list[dict[str, object]] = []
+    errors: list[dict[str, object]] = []
+    line_no: int = 1
+    scanned: int = 0
+    for match in _TOOL_CALL_RE.finditer(text):
+        line_no += text.count("\n", scanned, match.start())
+        scanned = match.start()
+        raw: str | None = match.group("json")
+        try:
+            if raw is not None:
+                found.append(_build_json_action(raw))
+            else:
+                found.append(_build_action(match.group("name").lower(), match.group("args")))
+        except KeyError:
+            line_start: int = text.rfind("\n", 0, match.start()) + 1
+            line_end: int = text.find("\n", match.end())
+            whole_line: str = text[line_start:line_end if line_end >= 0 else len(text)]
+            if whole_line.strip().strip("`-*>").strip() == match.group(0):
+                errors.append({"line": line_no, "text": match.group(0), "error": "unknown tool"})
+        except (ValueError, TypeError) as exc:
+            errors.append({"line": line_no, "text": match.group(0), "error": str(exc)})
+    active: Turn | None = _turn.get()
+    if active is not None and errors:
+        with active._lock:
+            if not active._closed:
+                active._parse_errors.extend(errors)
+    return found, errors
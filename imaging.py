@@ -0,0 +1,800 @@
+import base64
+import json
+import operator
+import re
+import struct
+import sys
+import threading
+import time
+import weakref
+import zlib
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from pathlib import Path
+
+
+PNG_SIGNATURE: bytes = b"\x89PNG\r\n\x1a\n"
+PNG_COMPRESS_LEVEL: int = 6
+PNG_THREADS: int = 0
+PNG_STRIPE_ROWS: int = 64
+PNG_IHDR_END: int = 24
+PNG_IHDR_B64_CHARS: int = 32
+RAW_MAGIC: bytes = b"BGRA"
+RAW_HEADER: struct.Struct = struct.Struct(">4sII")
+FRZ_MAGIC: bytes = b"FRZ1"
+FRZ_HEADER: struct.Struct = struct.Struct(">4sII")
+FRZ_TOKEN: struct.Struct = struct.Struct(">BI")
+FRZ_ROWS: int = 1
+FRZ_RUN: int = 2
+FRZ_LITERAL: int = 3
+FRZ_TOKEN_RE: re.Pattern[bytes] = re.compile(rb"(....)\1{2,}|(?:....)+?(?=(....)\2\2|\Z)", re.DOTALL)
+BYTES_PER_PIXEL: int = 4
+BOX_MAX_WINDOW: int = 8
+BOX_SHIFT: int = 16
+BOX_FIELD: int = 4
+OPAQUE: bytes = b"\xff"
+DATA_URL_PREFIX: str = "data:image/png;base64,"
+NO_RESIZE: int = 0
+DEFAULT_ENCODING_BUDGET: int = 64 * 1024 * 1024
+ZLIB_WINDOW: int = 32 * 1024
+ZLIB_CMF: int = 0x78
+ZLIB_DEFAULT_LEVEL: int = 6
+ZLIB_HEADER_CHECK: int = 31
+RAW_DEFLATE_WBITS: int = -15
+ADLER_BASE: int = 65521
+ADLER_MASK: int = 0xFFFF
+ADLER_SHIFT: int = 16
+DHASH_WIDTH: int = 9
+DHASH_HEIGHT: int = 8
+DHASH_SAMPLES: int = 8
+PREVIEW_SAMPLE_STEP: int = 16
+PREVIEW_PROBE_LEVEL: int = 1
+LUMA_RED: int = 299
+LUMA_GREEN: int = 587
+LUMA_BLUE: int = 114
+PNG_CHUNK_HEADER: struct.Struct = struct.Struct(">I4s")
+PNG_CRC_BYTES: int = 4
+APNG_ACTL: struct.Struct = struct.Struct(">II")
+APNG_ACTL_OFFSET: int = 33
+APNG_FCTL: struct.Struct = struct.Struct(">IIIIIHHBB")
+APNG_SEQUENCE_BYTES: int = 4
+APNG_DELAY_DEN: int = 1000
+APNG_DELAY_MAX: int = 0xFFFF
+APNG_DISPOSE_NONE: int = 0
+APNG_BLEND_SOURCE: int = 0
+RECORDING_INDEX: str = "recording.jsonl"
+
+
+def _png_chunk(chunk_type: bytes, chunk_data: bytes) -> bytes:
+    combined: bytes = chunk_type + chunk_data
+    return (
+        struct.pack(">I", len(chunk_data))
+        + combined
+        + struct.pack(">I", zlib.crc32(combined) & 0xFFFFFFFF)
+    )
+
+
+def bgra_to_rgba(bgra: bytes) -> bytearray:
+    rgba: bytearray = bytearray(bgra)
+    rgba[0::BYTES_PER_PIXEL] = bgra[2::BYTES_PER_PIXEL]
+    rgba[2::BYTES_PER_PIXEL] = bgra[0::BYTES_PER_PIXEL]
+    rgba[3::BYTES_PER_PIXEL] = OPAQUE * (len(bgra) // BYTES_PER_PIXEL)
+    return rgba
+
+
+def png_scanlines(rgba: bytes | bytearray, width: int, height: int) -> bytes:
+    stride: int = width * BYTES_PER_PIXEL
+    view: memoryview = memoryview(rgba)
+    return b"\x00" + b"\x00".join(
+        view[yidx * stride:(yidx + 1) * stride] for yidx in range(height)
+    )
+
+
+def _zlib_header(level: int) -> bytes:
+    effective: int = ZLIB_DEFAULT_LEVEL if level < 0 else level
+    flevel: int = 0 if effective < 2 else 1 if effective < ZLIB_DEFAULT_LEVEL else 2 if effective == ZLIB_DEFAULT_LEVEL else 3
+    flg: int = flevel << 6
+    flg |= (ZLIB_HEADER_CHECK - (ZLIB_CMF * 256 + flg) % ZLIB_HEADER_CHECK) % ZLIB_HEADER_CHECK
+    return bytes((ZLIB_CMF, flg))
+
+
+def adler32_combine(first: int, second: int, second_len: int) -> int:
+    rem: int = second_len % ADLER_BASE
+    sum1: int = first & ADLER_MASK
+    sum2: int = (rem * sum1) % ADLER_BASE
+    sum1 = (sum1 + (second & ADLER_MASK) + ADLER_BASE - 1) % ADLER_BASE
+    sum2 = (sum2 + (first >> ADLER_SHIFT) + (second >> ADLER_SHIFT) + ADLER_BASE - rem) % ADLER_BASE
+    return sum1 | (sum2 << ADLER_SHIFT)
+
+
+def _deflate_stripe(data: memoryview, start: int, end: int, level: int) -> tuple[bytes, int, int]:
+    compressor: object = (
+        zlib.compressobj(level, zlib.DEFLATED, RAW_DEFLATE_WBITS, zdict=data[max(0, start - ZLIB_WINDOW):start])
+        if start > 0
+        else zlib.compressobj(level, zlib.DEFLATED, RAW_DEFLATE_WBITS)
+    )
+    stripe: memoryview = data[start:end]
+    block: bytes = compressor.compress(stripe) + compressor.flush(
+        zlib.Z_FINISH if end >= len(data) else zlib.Z_FULL_FLUSH
+    )
+    return block, zlib.adler32(stripe), end - start
+
+
+class StripeCompressor:
+    def __init__(self, threads: int, stripe_rows: int) -> None:
+        self.threads: int = threads
+        self.stripe_rows: int = stripe_rows
+        self._pool: ThreadPoolExecutor | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def configure(self, threads: int, stripe_rows: int) -> None:
+        with self._lock:
+            old_pool: ThreadPoolExecutor | None = self._pool
+            self.threads = threads
+            self.stripe_rows = max(1, stripe_rows)
+            self._pool = None
+        if old_pool is not None:
+            old_pool.shutdown(wait=False)
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="png")
+            return self._pool
+
+    def compress(self, scanlines: bytes, row_bytes: int, level: int) -> bytes:
+        stripe_bytes: int = row_bytes * max(1, self.stripe_rows)
+        total: int = len(scanlines)
+        if self.threads <= 1 or total <= stripe_bytes:
+            return zlib.compress(scanlines, level)
+        view: memoryview = memoryview(scanlines)
+        starts: range = range(0, total, stripe_bytes)
+        ends: list[int] = [min(start + stripe_bytes, total) for start in starts]
+        parts: list[bytes] = [_zlib_header(level)]
+        checksum: int = 1
+        for block, stripe_adler, stripe_len in self._executor().map(
+            _deflate_stripe, repeat(view), starts, ends, repeat(level),
+        ):
+            parts.append(block)
+            checksum = adler32_combine(checksum, stripe_adler, stripe_len)
+        parts.append(struct.pack(">I", checksum))
+        return b"".join(parts)
+
+
+PNG_STRIPES: StripeCompressor = StripeCompressor(PNG_THREADS, PNG_STRIPE_ROWS)
+
+
+def bgra_to_png(bgra: bytes, width: int, height: int, level: int = PNG_COMPRESS_LEVEL) -> bytes:
+    scanlines: bytes = png_scanlines(bgra_to_rgba(bgra), width, height)
+    return (
+        PNG_SIGNATURE
+        + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        + _png_chunk(b"IDAT", PNG_STRIPES.compress(scanlines, width * BYTES_PER_PIXEL + 1, level))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+def sample_bgra(bgra: bytes, src_w: int, src_h: int, dst_w: int, dst_h: int) -> bytes:
+    source: memoryview = memoryview(bgra).cast("I")
+    columns: list[int] = [(xidx * 2 + 1) * src_w // (dst_w * 2) for xidx in range(dst_w)]
+    pick: operator.itemgetter = operator.itemgetter(*columns, *columns[:1])
+    output: array = array("I")
+    last_src_y: int = -1
+    row: array = array("I")
+    for yidx in range(dst_h):
+        src_y: int = (yidx * 2 + 1) * src_h // (dst_h * 2)
+        if src_y != last_src_y:
+            row = array("I", pick(source[src_y * src_w:(src_y + 1) * src_w])[:dst_w])
+            last_src_y = src_y
+        output.extend(row)
+    return output.tobytes()
+
+
+def _box_starts(src: int, dst: int, window: int) -> list[int]:
+    return [min(src - window, max(0, (2 * index + 1) * src // (2 * dst) - (window - 1) // 2)) for index in range(dst)]
+
+
+def resize_bgra(bgra: bytes, src_w: int, src_h: int, dst_w: int, dst_h: int) -> bytes:
+    window_x: int = min(BOX_MAX_WINDOW, src_w, max(1, round(src_w / dst_w)))
+    window_y: int = min(BOX_MAX_WINDOW, src_h, max(1, round(src_h / dst_h)))
+    if window_x == 1 and window_y == 1:
+        return sample_bgra(bgra, src_w, src_h, dst_w, dst_h)
+    count: int = window_x * window_y
+    scale: int = -(-(1 << BOX_SHIFT) // count)
+    stride: int = src_w * BYTES_PER_PIXEL
+    pixel_bits: int = BYTES_PER_PIXEL * BOX_FIELD * 8
+    spread: bytearray = bytearray(stride * BOX_FIELD)
+    spread[0::BOX_FIELD] = bytes([count // 2]) * stride
+    bias: int = int.from_bytes(spread, "little")
+    spread[0::BOX_FIELD] = bytes(stride)
+    pick: operator.itemgetter = operator.itemgetter(*_box_starts(src_w, dst_w, window_x), 0)
+    rows: dict[int, int] = {}
+    output: array = array("I")
+    for start in _box_starts(src_h, dst_h, window_y):
+        total: int = 0
+        for src_y in range(start, start + window_y):
+            found: int | None = rows.get(src_y)
+            if found is None:
+                spread[0::BOX_FIELD] = bgra[src_y * stride:(src_y + 1) * stride]
+                found = int.from_bytes(spread, "little")
+                rows[src_y] = found
+            total += found
+        for src_y in [row for row in rows if row < start]:
+            del rows[src_y]
+        band: int = total + bias
+        for offset in range(1, window_x):
+            band += total >> (offset * pixel_bits)
+        pixels: memoryview = memoryview(
+            (band * scale >> BOX_SHIFT).to_bytes(stride * BOX_FIELD, "little")[0::BOX_FIELD],
+        ).cast("I")
+        output.extend(pick(pixels)[:dst_w])
+    return output.tobytes()
+
+
+def dhash_bgra(bgra: bytes, width: int, height: int) -> int:
+    cols: int = DHASH_WIDTH * DHASH_SAMPLES
+    rows: int = DHASH_HEIGHT * DHASH_SAMPLES
+    small: bytes = sample_bgra(bgra, width, height, cols, rows)
+    cells: list[int] = [0] * (DHASH_WIDTH * DHASH_HEIGHT)
+    blue: bytes = small[0::BYTES_PER_PIXEL]
+    green: bytes = small[1::BYTES_PER_PIXEL]
+    red: bytes = small[2::BYTES_PER_PIXEL]
+    for yidx in range(rows):
+        base: int = yidx // DHASH_SAMPLES * DHASH_WIDTH
+        start: int = yidx * cols
+        for cell in range(DHASH_WIDTH):
+            lo: int = start + cell * DHASH_SAMPLES
+            hi: int = lo + DHASH_SAMPLES
+            cells[base + cell] += LUMA_RED * sum(red[lo:hi]) + LUMA_GREEN * sum(green[lo:hi]) + LUMA_BLUE * sum(blue[lo:hi])
+    value: int = 0
+    for yidx in range(DHASH_HEIGHT):
+        for xidx in range(DHASH_WIDTH - 1):
+            left: int = yidx * DHASH_WIDTH + xidx
+            value = (value << 1) | (cells[left] < cells[left + 1])
+    return value
+
+
+def png_size(png: bytes) -> tuple[int, int]:
+    if len(png) < PNG_IHDR_END or not png.startswith(PNG_SIGNATURE):
+        return 0, 0
+    width, height = struct.unpack(">II", png[16:PNG_IHDR_END])
+    return int(width), int(height)
+
+
+def pack_raw(bgra: bytes, width: int, height: int) -> bytes:
+    return RAW_HEADER.pack(RAW_MAGIC, width, height) + bgra
+
+
+def unpack_raw(data: bytes) -> tuple[bytes, int, int] | None:
+    if len(data) < RAW_HEADER.size:
+        return None
+    magic, width, height = RAW_HEADER.unpack_from(data)
+    if magic != RAW_MAGIC:
+        return None
+    pixels: bytes = data[RAW_HEADER.size:]
+    if len(pixels) != width * height * BYTES_PER_PIXEL:
+        return None
+    return pixels, int(width), int(height)
+
+
+def _frz_row(row: memoryview, parts: list[bytes | memoryview]) -> None:
+    for match in FRZ_TOKEN_RE.finditer(row):
+        start, end = match.span()
+        pixel: bytes | None = match.group(1)
+        if pixel is not None:
+            parts.append(FRZ_TOKEN.pack(FRZ_RUN, (end - start) // BYTES_PER_PIXEL))
+            parts.append(pixel)
+        else:
+            parts.append(FRZ_TOKEN.pack(FRZ_LITERAL, (end - start) // BYTES_PER_PIXEL))
+            parts.append(row[start:end])
+
+
+def frz_is_smaller(bgra: bytes, width: int, height: int) -> bool:
+    stride: int = width * BYTES_PER_PIXEL
+    view: memoryview = memoryview(bgra)
+    sample: bytes = b"".join(view[yidx * stride:(yidx + 1) * stride] for yidx in range(0, height, PREVIEW_SAMPLE_STEP))
+    if not sample:
+        return False
+    rows: int = len(sample) // stride
+    return len(bgra_to_frz(sample, width, rows)) < len(zlib.compress(sample, PREVIEW_PROBE_LEVEL))
+
+
+def bgra_to_frz(bgra: bytes, width: int, height: int) -> bytes:
+    stride: int = width * BYTES_PER_PIXEL
+    view: memoryview = memoryview(bgra)
+    parts: list[bytes | memoryview] = [FRZ_HEADER.pack(FRZ_MAGIC, width, height)]
+    repeats: int = 0
+    for yidx in range(height):
+        row_start: int = yidx * stride
+        if yidx > 0 and bgra[row_start:row_start + stride] == bgra[row_start - stride:row_start]:
+            repeats += 1
+            continue
+        if repeats:
+            parts.append(FRZ_TOKEN.pack(FRZ_ROWS, repeats))
+            repeats = 0
+        _frz_row(view[row_start:row_start + stride], parts)
+    if repeats:
+        parts.append(FRZ_TOKEN.pack(FRZ_ROWS, repeats))
+    return b"".join(parts)
+
+
+def frz_to_bgra(data: bytes) -> tuple[bytes, int, int] | None:
+    if len(data) < FRZ_HEADER.size:
+        return None
+    magic, width, height = FRZ_HEADER.unpack_from(data)
+    if magic != FRZ_MAGIC:
+        return None
+    stride: int = width * BYTES_PER_PIXEL
+    view: memoryview = memoryview(data)
+    output: bytearray = bytearray()
+    pos: int = FRZ_HEADER.size
+    while pos < len(data):
+        tag, count = FRZ_TOKEN.unpack_from(data, pos)
+        pos += FRZ_TOKEN.size
+        if tag == FRZ_ROWS and len(output) >= stride:
+            output += output[len(output) - stride:] * count
+        elif tag == FRZ_RUN:
+            output += bytes(view[pos:pos + BYTES_PER_PIXEL]) * count
+            pos += BYTES_PER_PIXEL
+        elif tag == FRZ_LITERAL:
+            output += view[pos:pos + count * BYTES_PER_PIXEL]
+            pos += count * BYTES_PER_PIXEL
+        else:
+            return None
+    if len(output) != stride * height:
+        return None
+    return bytes(output), int(width), int(height)
+
+
+def crop_bgra(bgra: bytes, width: int, x: int, y: int, crop_w: int, crop_h: int) -> bytes:
+    stride: int = width * BYTES_PER_PIXEL
+    view: memoryview = memoryview(bgra)
+    left: int = x * BYTES_PER_PIXEL
+    right: int = (x + crop_w) * BYTES_PER_PIXEL
+    return b"".join(view[row * stride + left:row * stride + right] for row in range(y, y + crop_h))
+
+
+def changed_boxes(
+    before: bytes, after: bytes, width: int, height: int, cell: int, margin: int,
+) -> list[tuple[int, int, int, int]]:
+    stride: int = width * BYTES_PER_PIXEL
+    cell_bytes: int = cell * BYTES_PER_PIXEL
+    cols: int = (width + cell - 1) // cell
+    rows: int = (height + cell - 1) // cell
+    grid: bytearray = bytearray(cols * rows)
+    for band in range(rows):
+        band_start: int = band * cell * stride
+        band_end: int = min(height, (band + 1) * cell) * stride
+        if before[band_start:band_end] == after[band_start:band_end]:
+            continue
+        base: int = band * cols
+        for row_start in range(band_start, band_end, stride):
+            old_row: bytes = before[row_start:row_start + stride]
+            new_row: bytes = after[row_start:row_start + stride]
+            if old_row == new_row:
+                continue
+            for cidx in range(cols):
+                if not grid[base + cidx] and old_row[cidx * cell_bytes:(cidx + 1) * cell_bytes] != new_row[cidx * cell_bytes:(cidx + 1) * cell_bytes]:
+                    grid[base + cidx] = 1
+    boxes: list[tuple[int, int, int, int]] = []
+    for start in range(len(grid)):
+        if grid[start] != 1:
+            continue
+        grid[start] = 2
+        stack: list[int] = [start]
+        min_c: int = cols
+        min_r: int = rows
+        max_c: int = 0
+        max_r: int = 0
+        while stack:
+            index: int = stack.pop()
+            crow, ccol = divmod(index, cols)
+            min_c, max_c = min(min_c, ccol), max(max_c, ccol)
+            min_r, max_r = min(min_r, crow), max(max_r, crow)
+            for nrow in range(max(0, crow - 1), min(rows, crow + 2)):
+                for ncol in range(max(0, ccol - 1), min(cols, ccol + 2)):
+                    neighbour: int = nrow * cols + ncol
+                    if grid[neighbour] == 1:
+                        grid[neighbour] = 2
+                        stack.append(neighbour)
+        left: int = max(0, min_c - margin) * cell
+        top: int = max(0, min_r - margin) * cell
+        right: int = min(width, (max_c + 1 + margin) * cell)
+        bottom: int = min(height, (max_r + 1 + margin) * cell)
+        boxes.append((left, top, right - left, bottom - top))
+    return boxes
+
+
+class EncodingBudget:
+    def __init__(self, limit: int) -> None:
+        self.limit: int = limit
+        self._frames: OrderedDict[int, weakref.ref] = OrderedDict()
+        self._lock: threading.Lock = threading.Lock()
+
+    def used(self) -> int:
+        with self._lock:
+            live: list[Frame] = [f for f in (ref() for ref in self._frames.values()) if f is not None]
+        return sum(frame.encoded_bytes() for frame in live)
+
+    def charge(self, frame: "Frame") -> None:
+        victims: list[Frame] = []
+        with self._lock:
+            key: int = id(frame)
+            self._frames[key] = weakref.ref(frame)
+            self._frames.move_to_end(key)
+            live: list[tuple[int, Frame]] = []
+            for live_key, ref in list(self._frames.items()):
+                live_frame: Frame | None = ref()
+                if live_frame is None:
+                    del self._frames[live_key]
+                else:
+                    live.append((live_key, live_frame))
+            total: int = sum(item.encoded_bytes() for _, item in live)
+            for live_key, live_frame in live:
+                if total <= self.limit or live_frame is frame:
+                    break
+                total -= live_frame.droppable_bytes()
+                victims.append(live_frame)
+                del self._frames[live_key]
+        for victim in victims:
+            victim.drop_encodings()
+
+
+ENCODING_BUDGET: EncodingBudget = EncodingBudget(DEFAULT_ENCODING_BUDGET)
+
+
+class Frame:
+    __slots__ = (
+        "seq", "region", "width", "height", "captured_at",
+        "_bgra", "_png", "_b64", "_b64_ascii", "_data_url", "_frz", "_frz_b64", "_dhash", "_derived", "_lock",
+        "__weakref__",
+    )
+
+    def __init__(
+        self, seq: int, region: str, width: int, height: int,
+        bgra: bytes | None = None, png: bytes | None = None,
+        b64: str | None = None, captured_at: float | None = None,
+    ) -> None:
+        self.seq: int = seq
+        self.region: str = region
+        self.width: int = width
+        self.height: int = height
+        self.captured_at: float = time.time() if captured_at is None else captured_at
+        self._bgra: bytes | None = bgra
+        self._png: bytes | None = png
+        self._b64: str | None = b64
+        self._b64_ascii: bytes | None = None
+        self._data_url: str | None = None
+        self._frz: bytes | None = None
+        self._frz_b64: str | None = None
+        self._dhash: int | None = None
+        self._derived: dict[tuple[int, int], Frame] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def from_raw(seq: int, region: str, data: bytes) -> "Frame | None":
+        unpacked: tuple[bytes, int, int] | None = unpack_raw(data)
+        if unpacked is None:
+            return None
+        return Frame(seq, region, unpacked[1], unpacked[2], bgra=unpacked[0])
+
+    @staticmethod
+    def from_png(seq: int, region: str, png: bytes) -> "Frame | None":
+        width, height = png_size(png)
+        if not width or not height:
+            return None
+        return Frame(seq, region, width, height, png=png)
+
+    @staticmethod
+    def from_frz(seq: int, region: str, data: bytes) -> "Frame | None":
+        decoded: tuple[bytes, int, int] | None = frz_to_bgra(data)
+        if decoded is None:
+            return None
+        return Frame(seq, region, decoded[1], decoded[2], bgra=decoded[0])
+
+    @staticmethod
+    def from_b64(seq: int, region: str, data_b64: str) -> "Frame":
+        width, height = png_size(base64.b64decode(data_b64[:PNG_IHDR_B64_CHARS]))
+        return Frame(seq, region, width, height, b64=data_b64)
+
+    @property
+    def bgra(self) -> bytes | None:
+        return self._bgra
+
+    def crop(self, x: int, y: int, crop_w: int, crop_h: int) -> "Frame":
+        if self._bgra is None:
+            return self
+        return Frame(
+            self.seq, self.region, crop_w, crop_h,
+            bgra=crop_bgra(self._bgra, self.width, x, y, crop_w, crop_h),
+            captured_at=self.captured_at,
+        )
+
+    def resized(self, width: int, height: int) -> "Frame":
+        if width <= 0 or height <= 0 or self._bgra is None or (width, height) == (self.width, self.height):
+            return self
+        key: tuple[int, int] = (width, height)
+        with self._lock:
+            cached: Frame | None = self._derived.get(key)
+        if cached is None:
+            derived: Frame = Frame(
+                self.seq, self.region, width, height,
+                bgra=resize_bgra(self._bgra, self.width, self.height, width, height),
+                captured_at=self.captured_at,
+            )
+            with self._lock:
+                cached = self._derived.setdefault(key, derived)
+        return cached
+
+    def png(self) -> bytes:
+        with self._lock:
+            if self._png is None:
+                if self._bgra is not None:
+                    self._png = bgra_to_png(self._bgra, self.width, self.height)
+                elif self._b64 is not None:
+                    self._png = base64.b64decode(self._b64)
+                else:
+                    self._png = b""
+            result: bytes = self._png
+        ENCODING_BUDGET.charge(self)
+        return result
+
+    def b64(self) -> str:
+        with self._lock:
+            cached: str | None = self._b64
+        if cached is None:
+            encoded: str = base64.b64encode(self.png()).decode("ascii")
+            with self._lock:
+                if self._b64 is None:
+                    self._b64 = encoded
+                cached = self._b64
+            ENCODING_BUDGET.charge(self)
+        return cached
+
+    def b64_ascii(self) -> bytes:
+        with self._lock:
+            cached: bytes | None = self._b64_ascii
+            source: str | None = self._b64
+        if cached is None:
+            encoded: bytes = source.encode("ascii") if source is not None else base64.b64encode(self.png())
+            with self._lock:
+                if self._b64_ascii is None:
+                    self._b64_ascii = encoded
+                cached = self._b64_ascii
+            ENCODING_BUDGET.charge(self)
+        return cached
+
+    def data_url(self) -> str:
+        with self._lock:
+            cached: str | None = self._data_url
+        if cached is None:
+            built: str = DATA_URL_PREFIX + self.b64()
+            with self._lock:
+                if self._data_url is None:
+                    self._data_url = built
+                cached = self._data_url
+            ENCODING_BUDGET.charge(self)
+        return cached
+
+    def frz(self) -> bytes:
+        if self._bgra is None:
+            return b""
+        with self._lock:
+            if self._frz is None:
+                self._frz = bgra_to_frz(self._bgra, self.width, self.height)
+            result: bytes = self._frz
+        ENCODING_BUDGET.charge(self)
+        return result
+
+    def dhash(self) -> int | None:
+        if self._bgra is None:
+            return None
+        with self._lock:
+            cached: int | None = self._dhash
+        if cached is None:
+            cached = dhash_bgra(self._bgra, self.width, self.height)
+            with self._lock:
+                self._dhash = cached
+        return cached
+
+    def frz_b64(self) -> str:
+        with self._lock:
+            cached: str | None = self._frz_b64
+        if cached is None:
+            encoded: str = base64.b64encode(self.frz()).decode("ascii")
+            with self._lock:
+                if self._frz_b64 is None:
+                    self._frz_b64 = encoded
+                cached = self._frz_b64
+            ENCODING_BUDGET.charge(self)
+        return cached
+
+    def preferred_format(self) -> str:
+        if self._bgra is not None and frz_is_smaller(self._bgra, self.width, self.height):
+            return "frz"
+        return "png"
+
+    def preview(self) -> tuple[str, str]:
+        if self.preferred_format() == "frz":
+            return "frz", self.frz_b64()
+        return "png", self.b64()
+
+    def encoded_bytes(self) -> int:
+        return (
+            len(self._png or b"")
+            + len(self._b64 or "")
+            + len(self._b64_ascii or b"")
+            + len(self._data_url or "")
+            + len(self._frz or b"")
+            + len(self._frz_b64 or "")
+        )
+
+    def resident_bytes(self) -> int:
+        return len(self._bgra or b"") + self.encoded_bytes()
+
+    def droppable_bytes(self) -> int:
+        if self._bgra is not None:
+            return self.encoded_bytes()
+        return (
+            len(self._data_url or "")
+            + len(self._b64_ascii or b"")
+            + (len(self._png or b"") if self._b64 is not None else 0)
+        )
+
+    def drop_encodings(self) -> None:
+        with self._lock:
+            self._data_url = None
+            self._b64_ascii = None
+            self._frz = None
+            self._frz_b64 = None
+            if self._bgra is not None:
+                self._png = None
+                self._b64 = None
+            elif self._b64 is not None:
+                self._png = None
+
+
+APNG_IEND: bytes = _png_chunk(b"IEND", b"")
+
+
+class ApngWriter:
+    def __init__(self, path: Path, width: int, height: int) -> None:
+        self.path: Path = path
+        self.width: int = width
+        self.height: int = height
+        self.frames: int = 0
+        self._sequence: int = 0
+        self._handle: object = path.open("w+b")
+        header: bytes = (
+            PNG_SIGNATURE
+            + _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + _png_chunk(b"acTL", APNG_ACTL.pack(0, 0))
+        )
+        self._handle.write(header + APNG_IEND)
+        self._handle.flush()
+        self.size: int = len(header)
+
+    def append(
+        self, bgra: bytes, x: int, y: int, width: int, height: int, delay_ms: int, level: int = PNG_COMPRESS_LEVEL,
+    ) -> tuple[int, int]:
+        scanlines: bytes = png_scanlines(bgra_to_rgba(bgra), width, height)
+        data: bytes = PNG_STRIPES.compress(scanlines, width * BYTES_PER_PIXEL + 1, level)
+        control: bytes = _png_chunk(b"fcTL", APNG_FCTL.pack(
+            self._sequence, width, height, x, y,
+            max(0, min(delay_ms, APNG_DELAY_MAX)), APNG_DELAY_DEN, APNG_DISPOSE_NONE, APNG_BLEND_SOURCE,
+        ))
+        self._sequence += 1
+        body: bytes
+        if self.frames == 0:
+            body = _png_chunk(b"IDAT", data)
+        else:
+            body = _png_chunk(b"fdAT", struct.pack(">I", self._sequence) + data)
+            self._sequence += 1
+        offset: int = self.size
+        self._handle.seek(offset)
+        self._handle.write(control + body + APNG_IEND)
+        self.size = offset + len(control) + len(body)
+        self.frames += 1
+        self._handle.seek(APNG_ACTL_OFFSET)
+        self._handle.write(_png_chunk(b"acTL", APNG_ACTL.pack(self.frames, 0)))
+        self._handle.flush()
+        return offset, self.size - offset
+
+    def close(self) -> None:
+        self._handle.close()
+
+
+def apng_compose(path: Path, spans: list[tuple[int, int]], width: int, height: int) -> bytes:
+    stride: int = width * BYTES_PER_PIXEL
+    canvas: bytearray = bytearray(stride * height)
+    with path.open("rb") as handle:
+        for offset, length in spans:
+            handle.seek(offset)
+            blob: bytes = handle.read(length)
+            position: int = 0
+            region: tuple[int, int, int, int] = (0, 0, width, height)
+            parts: list[bytes] = []
+            while position < len(blob):
+                size, kind = PNG_CHUNK_HEADER.unpack_from(blob, position)
+                data: bytes = blob[position + PNG_CHUNK_HEADER.size:position + PNG_CHUNK_HEADER.size + size]
+                if kind == b"fcTL":
+                    _, part_w, part_h, part_x, part_y, _, _, _, _ = APNG_FCTL.unpack(data)
+                    region = (part_x, part_y, part_w, part_h)
+                elif kind == b"IDAT":
+                    parts.append(data)
+                elif kind == b"fdAT":
+                    parts.append(data[APNG_SEQUENCE_BYTES:])
+                position += PNG_CHUNK_HEADER.size + size + PNG_CRC_BYTES
+            part_x, part_y, part_w, part_h = region
+            raw: bytes = zlib.decompress(b"".join(parts))
+            row_bytes: int = part_w * BYTES_PER_PIXEL
+            for row in range(part_h):
+                start: int = row * (row_bytes + 1)
+                if raw[start] != 0:
+                    raise ValueError(f"{path.name}: unsupported PNG filter {raw[start]}")
+                target: int = (part_y + row) * stride + part_x * BYTES_PER_PIXEL
+                canvas[target:target + row_bytes] = raw[start + 1:start + 1 + row_bytes]
+    return bytes(bgra_to_rgba(canvas))
+
+
+def _extract_recorded(folder: Path, turn: int, kind: str) -> int:
+    entries: list[dict[str, object]] = []
+    with (folder / RECORDING_INDEX).open("r", encoding="utf-8") as handle:
+        for line in handle:
+            entries.append(json.loads(line))
+    matches: list[dict[str, object]] = [entry for entry in entries if entry["turn"] == turn and entry["kind"] == kind]
+    if not matches:
+        print(f"{folder}: turn {turn} ({kind}) was not recorded", file=sys.stderr)
+        return 1
+    target: dict[str, object] = matches[-1]
+    spans: dict[int, tuple[int, int]] = {}
+    for entry in entries:
+        if (
+            entry["segment"] == target["segment"] and entry["keyframe"] == target["keyframe"]
+            and int(entry["frame"]) <= int(target["frame"])
+        ):
+            spans[int(entry["frame"])] = (int(entry["offset"]), int(entry["length"]))
+    width: int = int(target["width"])
+    height: int = int(target["height"])
+    bgra: bytes = apng_compose(folder / str(target["segment"]), [spans[frame] for frame in sorted(spans)], width, height)
+    output: Path = folder / f"turn-{turn}-{kind}.png"
+    output.write_bytes(bgra_to_png(bgra, width, height))
+    print(f"{folder / str(target['segment'])} frame {target['frame']} -> {output}")
+    return 0
+
+
+def _convert_to_png(paths: list[Path]) -> int:
+    failures: int = 0
+    for path in paths:
+        decoded: tuple[bytes, int, int] | None = frz_to_bgra(path.read_bytes())
+        if decoded is None:
+            print(f"{path}: not a frame file", file=sys.stderr)
+            failures += 1
+            continue
+        target: Path = path.with_suffix(".png")
+        target.write_bytes(bgra_to_png(*decoded))
+        print(f"{path} -> {target}")
+    return failures
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    if len(args) in (3, 4) and args[0] == "extract":
+        raise SystemExit(_extract_recorded(Path(args[1]), int(args[2]), args[3] if len(args) == 4 else "pre"))
+    if len(args) < 2 or args[0] != "topng":
+        sys.stderr.write(
+            "usage: python imaging.py topng <file.frz | folder>...\n"
+            "       python imaging.py extract <session folder> <turn> [pre|post]\n"
+        )
+        raise SystemExit(1)
+    paths: list[Path] = []
+    for arg in args[1:]:
+        root: Path = Path(arg)
+        paths.extend(sorted(root.rglob("*.frz")) if root.is_dir() else [root])
+    raise SystemExit(1 if _convert_to_png(paths) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+import json
+import queue
+import sys
+import threading
+import time
+from pathlib import Path
+
+from imaging import ApngWriter
+from imaging import changed_boxes
+from imaging import crop_bgra
+from imaging import Frame
+from imaging import RECORDING_INDEX
+
+
+RECORD_KEYFRAME_INTERVAL: int = 30
+RECORD_SEGMENT_BYTES: int = 256 * 1024 * 1024
+RECORD_SEGMENT_SECONDS: float = 3600.0
+RECORD_QUEUE_FRAMES: int = 64
+RECORD_CELL: int = 16
+EMPTY_OVERLAYS_JSON: bytes = b'{"styles":[],"items":[]}'
+
+
+class SessionRecorder:
+    def __init__(
+        self, session_dir: Path, keyframe_interval: int, segment_bytes: int, segment_seconds: float,
+    ) -> None:
+        self.session_dir: Path = session_dir
+        self.keyframe_interval: int = max(1, keyframe_interval)
+        self.segment_bytes: int = segment_bytes
+        self.segment_seconds: float = segment_seconds
+        self.dropped: int = 0
+        self._queue: queue.Queue[tuple[int, str, Frame, bytes] | None] = queue.Queue(maxsize=RECORD_QUEUE_FRAMES)
+        self._writer: ApngWriter | None = None
+        self._segment: int = 0
+        self._segment_started: float = 0.0
+        self._previous: Frame | None = None
+        self._keyframe: int = 0
+        self._last_span: tuple[int, int] = (0, 0)
+        self._thread: threading.Thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+
+    def record(self, turn: int, kind: str, frame: Frame, overlays_json: bytes = EMPTY_OVERLAYS_JSON) -> bool:
+        if frame.bgra is None:
+            return False
+        try:
+            self._queue.put_nowait((turn, kind, frame, overlays_json))
+        except queue.Full:
+            self.dropped += 1
+            print(f"recorder queue full, turn {turn} {kind} saved as a file ({self.dropped} so far)", file=sys.stderr)
+            return False
+        return True
+
+    def close(self) -> None:
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            item: tuple[int, str, Frame, bytes] | None = self._queue.get()
+            if item is None:
+                if self._writer is not None:
+                    self._writer.close()
+                return
+            try:
+                self._write(*item)
+            except OSError as exc:
+                print(f"recorder error: {exc}", file=sys.stderr)
+
+    def _rotate(self, frame: Frame) -> ApngWriter:
+        if self._writer is not None:
+            self._writer.close()
+        self._segment += 1
+        self._writer = ApngWriter(
+            self.session_dir / f"recording-{self._segment:04d}.png", frame.width, frame.height,
+        )
+        self._segment_started = time.monotonic()
+        self._previous = None
+        return self._writer
+
+    def _write(self, turn: int, kind: str, frame: Frame, overlays_json: bytes) -> None:
+        writer: ApngWriter | None = self._writer
+        if (
+            writer is None or (writer.width, writer.height) != (frame.width, frame.height)
+            or writer.size >= self.segment_bytes
+            or time.monotonic() - self._segment_started >= self.segment_seconds
+        ):
+            writer = self._rotate(frame)
+        previous: Frame | None = self._previous
+        delay_ms: int = int((frame.captured_at - previous.captured_at) * 1000) if previous is not None else 0
+        if previous is None or writer.frames - self._keyframe >= self.keyframe_interval:
+            self._last_span = writer.append(frame.bgra, 0, 0, frame.width, frame.height, delay_ms)
+            self._keyframe = writer.frames - 1
+        else:
+            boxes: list[tuple[int, int, int, int]] = changed_boxes(
+                previous.bgra, frame.bgra, frame.width, frame.height, RECORD_CELL, 0,
+            )
+            if boxes:
+                left: int = min(box[0] for box in boxes)
+                top: int = min(box[1] for box in boxes)
+                right: int = max(box[0] + box[2] for box in boxes)
+                bottom: int = max(box[1] + box[3] for box in boxes)
+                self._last_span = writer.append(
+                    crop_bgra(frame.bgra, frame.width, left, top, right - left, bottom - top),
+                    left, top, right - left, bottom - top, delay_ms,
+                )
+        self._previous = frame
+        entry: bytes = json.dumps({
+            "turn": turn,
+            "kind": kind,
+            "segment": writer.path.name,
+            "frame": writer.frames - 1,
+            "keyframe": self._keyframe,
+            "offset": self._last_span[0],
+            "length": self._last_span[1],
+            "width": frame.width,
+            "height": frame.height,
+            "captured_at": frame.captured_at,
+        }).encode("utf-8")
+        with (self.session_dir / RECORDING_INDEX).open("ab") as handle:
+            handle.write(entry[:-1] + b', "overlays": ' + overlays_json + b"}\n")
@@ -1,17 +1,64 @@
-import base64
+import gzip
+import http.client
 import http.server
+import itertools
 import json
+import multiprocessing
+import pickle
+import queue
+import sqlite3
+import struct
 import subprocess
 import sys
 import threading
 import time
-import urllib.request
+import urllib.parse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
 
+from agent import AgentClient
+from catalog import BUSY_ERRORS
+from catalog import CATALOG_FILE
+from catalog import find_turns
+from catalog import list_sessions
+from catalog import PAGE_LIMIT
+from catalog import SessionCatalog
+from endpoints import BREAKER_COOLDOWN
+from endpoints import BREAKER_FAILURES
+from endpoints import EndpointPool
+from endpoints import HEALTH_PATH
+from endpoints import HEDGE_MIN_SECONDS
+from endpoints import HEDGE_PERCENTILE
+from endpoints import HTTP_OK
+from endpoints import VLM_TIMEOUT
+from endpoints import VlmFailure
+from evaluate import run_eval
+from fleet import FLEET_DEFAULT_PRIORITY
+from fleet import FLEET_DESKTOP_HEADER
+from fleet import FLEET_PRIORITY_HEADER
+from fleet import run_fleet
+from imaging import ENCODING_BUDGET
+from imaging import changed_boxes
+from imaging import DATA_URL_PREFIX
+from imaging import Frame
+from imaging import NO_RESIZE
+from imaging import PNG_STRIPES
+from imaging import RECORDING_INDEX
+from recorder import EMPTY_OVERLAYS_JSON
+from recorder import RECORD_KEYFRAME_INTERVAL
+from recorder import RECORD_SEGMENT_BYTES
+from recorder import RECORD_SEGMENT_SECONDS
+from recorder import SessionRecorder
+from screens import SCREENS_FILE
+from screens import ScreenIndex
+from screens import ScreenRecord
+
 
 HERE: Path = Path(__file__).resolve().parent
 PANEL_PATH: Path = HERE / "panel.html"
+CATALOG_PATH: Path = HERE / "logs" / CATALOG_FILE
 WIN32_PATH: Path = HERE / "win32.py"
 
 CURSOR_ARM: int = 12
@@ -20,10 +67,50 @@ CURSOR_LABEL_LIMIT: int = 980
 CURSOR_FONT_SIZE: int = 11
 DEFAULT_CURSOR_POS: int = 500
 MIN_ANNOTATION_LENGTH: int = 100
-VLM_TIMEOUT: int = 120
+VLM_MAX_CONCURRENCY: int = 4
+HTTP_NOT_MODIFIED: int = 304
 FALLBACK_SLEEP: float = 1.0
 ERROR_SLEEP: float = 2.0
-NO_RESIZE: int = 0
+ANNOTATOR_LEASE_SECONDS: float = 3.0
+VIEWER_TIMEOUT_SECONDS: float = 10.0
+STATE_POLL_SECONDS: float = 2.0
+BRAIN_TURN_VLM_CALLS: int = 2
+BRAIN_TURN_MARGIN: float = 30.0
+BRAIN_TURN_TIMEOUT: float = BRAIN_TURN_VLM_CALLS * VLM_TIMEOUT + BRAIN_TURN_MARGIN
+HISTORY_MAX_FRAMES: int = 60
+HISTORY_MAX_BYTES: int = 256 * 1024 * 1024
+SCREEN_TEXT_LIMIT: int = 500
+HISTORY_PAGE_LIMIT: int = 8
+NORM_SCALE: int = 1000
+ROI_MAX_CROPS: int = 2
+ROI_PIXEL_BUDGET: int = 512 * 512
+ROI_CELL: int = 32
+ROI_MARGIN_CELLS: int = 1
+ROI_MAX_COVERAGE: float = 0.5
+PATCH_SIZE: int = 28
+GOVERNOR_STEP_PATCHES: int = 2
+GOVERNOR_TOKEN_STEP: float = 0.2
+GOVERNOR_BAND: float = 0.2
+GOVERNOR_SMOOTHING: float = 0.3
+GOVERNOR_CAP_RATIO: float = 0.9
+GOVERNOR_MIN_WIDTH: int = 336
+GOVERNOR_MIN_TOKENS: int = 128
+USAGE_KEYS: tuple[str, ...] = ("prompt_tokens", "completion_tokens")
+CACHED_TOKENS_KEY: str = "cached_tokens"
+BODY_PREFIX_CACHE_LIMIT: int = 256
+BODY_USER_OPEN: bytes = b', "messages": ['
+BODY_USER_CONTENT: bytes = b', {"role": "user", "content": ['
+BODY_TAIL: bytes = b"]}]}"
+BODY_SEPARATOR: bytes = b", "
+IMAGE_PART_OPEN: bytes = b'{"type": "image_url", "image_url": {"url": "' + DATA_URL_PREFIX.encode("ascii")
+IMAGE_PART_CLOSE: bytes = b'"}}'
+PROMPT_MS_KEY: str = "prompt_ms"
+WORKER_HEADER: struct.Struct = struct.Struct(">iI")
+WARMUP_TEXT: str = "Reply with OK."
+WARMUP_MAX_TOKENS: int = 1
+WARMUP_TIMEOUT: float = 120.0
+PANEL_GZIP_LEVEL: int = 9
+FIRST_TURN_PROMPT: str = "What do you see? What should you do?"
 
 
 def _utc_stamp() -> str:
@@ -57,6 +144,8 @@ class SessionLog:
     def __init__(self, session_dir: Path, turns_file: Path) -> None:
         self.session_dir: Path = session_dir
         self.turns_file: Path = turns_file
+        self.recorder: SessionRecorder | None = None
+        self.catalog: SessionCatalog | None = None
 
     @staticmethod
     def create() -> "SessionLog":
@@ -70,54 +159,305 @@ class SessionLog:
         with self.turns_file.open("a", encoding="utf-8") as handle:
             handle.write(f"--- TURN {turn} | {_utc_stamp()} | {label} ---\n{text}\n")
 
-    def save_png(self, data_b64: str) -> None:
-        (self.session_dir / f"{_utc_stamp()}.png").write_bytes(base64.b64decode(data_b64))
+    def write_event(self, event: dict[str, object]) -> None:
+        with (self.session_dir / "events.jsonl").open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps({"time": _utc_stamp(), **event}, ensure_ascii=False) + "\n")
+
+    def save_frame(
+        self, frame: Frame, turn: int = 0, kind: str = "", overlays_json: bytes = EMPTY_OVERLAYS_JSON,
+    ) -> str:
+        if self.recorder is not None and self.recorder.record(turn, kind, frame, overlays_json):
+            return RECORDING_INDEX
+        image_format: str = frame.preferred_format()
+        target: Path = self.session_dir / f"{_utc_stamp()}.{image_format}"
+        target.write_bytes(frame.frz() if image_format == "frz" else frame.png())
+        return target.name
+
+
+class StateSnapshot:
+    __slots__ = ("version", "members")
+
+    def __init__(self, version: int, members: bytes) -> None:
+        self.version: int = version
+        self.members: bytes = members
 
 
 class ServerState:
     def __init__(self) -> None:
         self.phase: str = "init"
         self.turn: int = 0
-        self.raw_b64: str = ""
+        self.frame: Frame | None = None
+        self.view_size: tuple[int, int] = (NO_RESIZE, NO_RESIZE)
         self.raw_seq: int = 0
-        self.overlays: list[dict[str, object]] = []
+        self.overlays: list[object] = []
+        self.overlays_json: bytes = EMPTY_OVERLAYS_JSON
+        self.layers: list[tuple[str, int, bytes]] = []
         self.pending_seq: int = 0
         self.annotated_seq: int = -1
-        self.annotated_b64: str = ""
+        self.annotated_frame: Frame | None = None
+        self.view_frame: Frame | None = None
+        self.frame_body: tuple[tuple[object, ...], int, bytes] | None = None
+        self.frame_body_version: int = 0
         self.annotated_ready: threading.Event = threading.Event()
         self.display_text: str = ""
         self.display_actions: list[dict[str, object]] = []
+        self.display_parse_error: str = ""
         self.error_text: str = ""
+        self.version: int = 0
+        self.snapshot: StateSnapshot = StateSnapshot(0, b'"version": 0, "phase": "init"')
         self.lock: threading.Lock = threading.Lock()
+        self.changed: threading.Condition = threading.Condition(self.lock)
 
 
 STATE: ServerState = ServerState()
 
 
-def _subprocess_capture(brain: object) -> str:
-    cmd: list[str] = [sys.executable, str(WIN32_PATH), "capture"]
+class AnnotatorLease:
+    def __init__(self, lease_seconds: float, viewer_timeout: float) -> None:
+        self.lease_seconds: float = lease_seconds
+        self.viewer_timeout: float = viewer_timeout
+        self.holder: str = ""
+        self.expires: float = 0.0
+        self._seen: dict[str, float] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def claim(self, client: str) -> bool:
+        if not client:
+            return False
+        now: float = time.monotonic()
+        with self._lock:
+            self._seen[client] = now
+            if self.holder == client or not self.holder or now >= self.expires:
+                self.holder = client
+                self.expires = now + self.lease_seconds
+                return True
+            return False
+
+    def holds(self, client: str) -> bool:
+        with self._lock:
+            return bool(client) and self.holder == client and time.monotonic() < self.expires
+
+    def viewers(self) -> int:
+        now: float = time.monotonic()
+        with self._lock:
+            for client in [key for key, seen in self._seen.items() if now - seen > self.viewer_timeout]:
+                del self._seen[client]
+            return len(self._seen)
+
+
+LEASE: AnnotatorLease = AnnotatorLease(ANNOTATOR_LEASE_SECONDS, VIEWER_TIMEOUT_SECONDS)
+
+
+class HistoryEntry:
+    __slots__ = ("entry_id", "turn", "kind", "frame", "overlays_json", "actions_json")
+
+    def __init__(
+        self, entry_id: int, turn: int, kind: str, frame: Frame,
+        overlays_json: bytes, actions_json: bytes,
+    ) -> None:
+        self.entry_id: int = entry_id
+        self.turn: int = turn
+        self.kind: str = kind
+        self.frame: Frame = frame
+        self.overlays_json: bytes = overlays_json
+        self.actions_json: bytes = actions_json
+
+    def to_json(self) -> bytes:
+        image_format, image_b64 = self.frame.preview()
+        return b"".join((
+            b'{"id": ', str(self.entry_id).encode("ascii"),
+            b', "turn": ', str(self.turn).encode("ascii"),
+            b', "kind": "', self.kind.encode("ascii"),
+            b'", "seq": ', str(self.frame.seq).encode("ascii"),
+            b', "width": ', str(self.frame.width).encode("ascii"),
+            b', "height": ', str(self.frame.height).encode("ascii"),
+            b', "captured_at": ', repr(self.frame.captured_at).encode("ascii"),
+            b', "format": "', image_format.encode("ascii"),
+            b'", "image_b64": "', image_b64.encode("ascii"),
+            b'", "overlays": ', self.overlays_json,
+            b', "actions": ', self.actions_json, b"}",
+        ))
+
+
+class FrameHistory:
+    def __init__(self, max_frames: int, max_bytes: int) -> None:
+        self.max_frames: int = max_frames
+        self.max_bytes: int = max_bytes
+        self._entries: deque[HistoryEntry] = deque()
+        self._next_id: int = 1
+        self._lock: threading.Lock = threading.Lock()
+
+    def add(self, turn: int, kind: str, frame: Frame, overlays_json: bytes, actions_json: bytes) -> int:
+        with self._lock:
+            entry: HistoryEntry = HistoryEntry(self._next_id, turn, kind, frame, overlays_json, actions_json)
+            self._next_id += 1
+            self._entries.append(entry)
+            total: int = sum(item.frame.resident_bytes() for item in self._entries)
+            while len(self._entries) > 1 and (len(self._entries) > self.max_frames or total > self.max_bytes):
+                total -= self._entries.popleft().frame.resident_bytes()
+            return entry.entry_id
+
+    def latest_id(self) -> int:
+        with self._lock:
+            return self._next_id - 1
+
+    def since(self, entry_id: int, limit: int) -> list[HistoryEntry]:
+        found: list[HistoryEntry] = []
+        with self._lock:
+            for entry in self._entries:
+                if len(found) >= limit:
+                    break
+                if entry.entry_id > entry_id:
+                    found.append(entry)
+        return found
+
+
+HISTORY: FrameHistory = FrameHistory(HISTORY_MAX_FRAMES, HISTORY_MAX_BYTES)
+
+
+SCREENS: ScreenIndex = ScreenIndex()
+
+
+def _load_screen_history(session: SessionLog, sessions: int) -> int:
+    if sessions <= 0:
+        return 0
+    earlier: list[Path] = sorted(
+        path for path in session.session_dir.parent.glob(f"*/{SCREENS_FILE}") if path.parent != session.session_dir
+    )
+    return sum(SCREENS.load(path) for path in earlier[-sessions:])
+
+
+def _vlm_size(brain: object) -> tuple[int, int]:
+    return int(_cfg(brain, "CAPTURE_WIDTH", 640)), int(_cfg(brain, "CAPTURE_HEIGHT", 640))
+
+
+def _read_exact(stream: object, size: int) -> bytes:
+    chunks: list[bytes] = []
+    remaining: int = size
+    while remaining > 0:
+        chunk: bytes = stream.read(remaining)
+        if not chunk:
+            raise EOFError("win32 worker closed its output")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+class Win32Worker:
+    def __init__(self) -> None:
+        self._proc: subprocess.Popen[bytes] | None = None
+        self.agent: AgentClient | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def use_agent(self, agent: AgentClient) -> None:
+        self.agent = agent
+
+    def _ensure(self) -> subprocess.Popen[bytes]:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                [sys.executable, str(WIN32_PATH), "serve"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            )
+        return self._proc
+
+    def start(self) -> None:
+        if self.agent is not None:
+            self.agent.start()
+            return
+        with self._lock:
+            self._ensure()
+
+    def run(self, args: list[str]) -> tuple[int, bytes]:
+        if self.agent is not None:
+            return self.agent.run(args)
+        with self._lock:
+            try:
+                proc: subprocess.Popen[bytes] = self._ensure()
+                proc.stdin.write(json.dumps(args).encode("utf-8") + b"\n")
+                proc.stdin.flush()
+                code, length = WORKER_HEADER.unpack(_read_exact(proc.stdout, WORKER_HEADER.size))
+                return code, _read_exact(proc.stdout, length)
+            except (OSError, EOFError, struct.error):
+                if self._proc is not None:
+                    self._proc.kill()
+                self._proc = None
+        completed: subprocess.CompletedProcess[bytes] = subprocess.run(
+            [sys.executable, str(WIN32_PATH), *args], capture_output=True,
+        )
+        return completed.returncode, completed.stdout
+
+
+WORKER: Win32Worker = Win32Worker()
+
+
+class PanelAsset:
+    def __init__(self, path: Path) -> None:
+        self.path: Path = path
+        self._mtime: float = -1.0
+        self._raw: bytes = b""
+        self._gzipped: bytes = b""
+        self._lock: threading.Lock = threading.Lock()
+
+    def load(self) -> tuple[bytes, bytes]:
+        mtime: float = self.path.stat().st_mtime
+        with self._lock:
+            if mtime != self._mtime:
+                self._raw = self.path.read_bytes()
+                self._gzipped = gzip.compress(self._raw, PANEL_GZIP_LEVEL)
+                self._mtime = mtime
+            return self._raw, self._gzipped
+
+
+PANEL: PanelAsset = PanelAsset(PANEL_PATH)
+
+
+def _subprocess_capture(brain: object, seq: int) -> Frame | None:
+    cmd: list[str] = ["capture", "--format", "raw"]
     region: str = str(_cfg(brain, "CAPTURE_REGION", ""))
     if region:
         cmd.extend(["--region", region])
-    width: int = int(_cfg(brain, "CAPTURE_WIDTH", 640))
-    height: int = int(_cfg(brain, "CAPTURE_HEIGHT", 640))
-    cmd.extend(["--width", str(width)])
-    cmd.extend(["--height", str(height)])
-    proc: subprocess.CompletedProcess[bytes] = subprocess.run(cmd, capture_output=True)
-    if proc.returncode != 0 or not proc.stdout:
-        return ""
-    return base64.b64encode(proc.stdout).decode("ascii")
+    cmd.extend(["--width", str(NO_RESIZE)])
+    cmd.extend(["--height", str(NO_RESIZE)])
+    code, output = WORKER.run(cmd)
+    if code != 0 or not output:
+        return None
+    return Frame.from_raw(seq, region, output)
+
+
+def _next_raw_seq() -> int:
+    with STATE.lock:
+        STATE.raw_seq += 1
+        return STATE.raw_seq
+
+
+def _store_frame(frame: Frame) -> None:
+    with STATE.lock:
+        if STATE.frame is None or STATE.frame.seq < frame.seq:
+            STATE.frame = frame
+
+
+def _current_frame(brain: object, max_age: float | None) -> Frame | None:
+    with STATE.lock:
+        frame: Frame | None = STATE.frame
+    if frame is not None and (max_age is None or time.time() - frame.captured_at <= max_age):
+        return frame
+    fresh: Frame | None = _subprocess_capture(brain, _next_raw_seq())
+    if fresh is None:
+        return frame
+    _store_frame(fresh)
+    _publish_state()
+    return fresh
 
 
 def _subprocess_cursor_pos(brain: object) -> tuple[int, int]:
-    cmd: list[str] = [sys.executable, str(WIN32_PATH), "cursor_pos"]
+    cmd: list[str] = ["cursor_pos"]
     region: str = str(_cfg(brain, "CAPTURE_REGION", ""))
     if region:
         cmd.extend(["--region", region])
-    proc: subprocess.CompletedProcess[bytes] = subprocess.run(cmd, capture_output=True)
-    if proc.returncode != 0 or not proc.stdout:
+    code, output = WORKER.run(cmd)
+    if code != 0 or not output:
         return DEFAULT_CURSOR_POS, DEFAULT_CURSOR_POS
-    parts: list[str] = proc.stdout.decode("ascii").strip().split(",")
+    parts: list[str] = output.decode("ascii").strip().split(",")
     if len(parts) != 2:
         return DEFAULT_CURSOR_POS, DEFAULT_CURSOR_POS
     return int(parts[0]), int(parts[1])
@@ -133,7 +473,7 @@ def _subprocess_execute_one(action: dict[str, object], brain: object) -> None:
     action_type: str = str(action.get("type", ""))
     params_str: str = str(action.get("params", ""))
     region: str = str(_cfg(brain, "CAPTURE_REGION", ""))
-    cmd: list[str] = [sys.executable, str(WIN32_PATH)]
+    cmd: list[str] = []
 
     match action_type:
         case "click":
@@ -157,64 +497,448 @@ def _subprocess_execute_one(action: dict[str, object], brain: object) -> None:
 
     if region:
         cmd.extend(["--region", region])
-    subprocess.run(cmd, capture_output=True)
+    WORKER.run(cmd)
 
 
 def _subprocess_execute_drag(
     from_action: dict[str, object], to_action: dict[str, object], brain: object,
 ) -> None:
     cmd: list[str] = [
-        sys.executable, str(WIN32_PATH), "drag",
+        "drag",
         "--from_pos", _action_xy_str(from_action),
         "--to_pos", _action_xy_str(to_action),
     ]
     region: str = str(_cfg(brain, "CAPTURE_REGION", ""))
     if region:
         cmd.extend(["--region", region])
-    subprocess.run(cmd, capture_output=True)
+    WORKER.run(cmd)
+
+
+_endpoint_pools: dict[tuple[str, ...], EndpointPool] = {}
+_endpoint_pools_lock: threading.Lock = threading.Lock()
+
+
+def _endpoint_pool(brain: object) -> EndpointPool:
+    urls: object = _cfg(brain, "VLM_ENDPOINT_URLS", None) or [_cfg(brain, "VLM_ENDPOINT_URL", "")]
+    key: tuple[str, ...] = tuple(str(url) for url in urls if url)
+    if not key:
+        raise VlmFailure("config", "VLM_ENDPOINT_URL is empty")
+    with _endpoint_pools_lock:
+        pool: EndpointPool | None = _endpoint_pools.get(key)
+        if pool is None:
+            pool = EndpointPool(
+                list(key),
+                float(_cfg(brain, "VLM_HEDGE_PERCENTILE", HEDGE_PERCENTILE)),
+                float(_cfg(brain, "VLM_HEDGE_MIN_SECONDS", HEDGE_MIN_SECONDS)),
+                int(_cfg(brain, "VLM_BREAKER_FAILURES", BREAKER_FAILURES)),
+                float(_cfg(brain, "VLM_BREAKER_COOLDOWN", BREAKER_COOLDOWN)),
+                str(_cfg(brain, "VLM_HEALTH_PATH", HEALTH_PATH)),
+            )
+            _endpoint_pools[key] = pool
+        return pool
+
+
+def _endpoint_snapshot() -> list[dict[str, object]]:
+    with _endpoint_pools_lock:
+        pools: list[EndpointPool] = list(_endpoint_pools.values())
+    return [entry for pool in pools for entry in pool.snapshot()]
+
+
+def _publish_state() -> None:
+    with STATE.lock:
+        STATE.version += 1
+        version: int = STATE.version
+        fields: dict[str, object] = {
+            "version": version,
+            "phase": STATE.phase,
+            "turn": STATE.turn,
+            "pending_seq": STATE.pending_seq,
+            "annotated_seq": STATE.annotated_seq,
+            "raw_seq": STATE.raw_seq,
+            "error": STATE.error_text,
+            "text": STATE.display_text,
+            "display": {
+                "text": STATE.display_text,
+                "actions": STATE.display_actions,
+                "parse_error": STATE.display_parse_error,
+            },
+            "msg_id": STATE.turn,
+            "view_seq": STATE.view_frame.seq if STATE.view_frame is not None else -1,
+        }
+    fields["vlm"] = VLM_METRICS.snapshot()
+    fields["endpoints"] = _endpoint_snapshot()
+    fields["history_id"] = HISTORY.latest_id()
+    members: bytes = b", ".join(
+        json.dumps(key).encode("ascii") + b": " + json.dumps(value, ensure_ascii=False).encode("utf-8")
+        for key, value in fields.items()
+    )
+    with STATE.changed:
+        if version > STATE.snapshot.version:
+            STATE.snapshot = StateSnapshot(version, members)
+            STATE.changed.notify_all()
+
+
+class VlmMetrics:
+    def __init__(self) -> None:
+        self.calls: int = 0
+        self.errors: int = 0
+        self.in_flight: int = 0
+        self.total_seconds: float = 0.0
+        self.last_seconds: float = 0.0
+        self.last_error: str = ""
+        self.prompt_tokens: int = 0
+        self.completion_tokens: int = 0
+        self.cached_tokens: int = 0
+        self.last_cached_tokens: int = 0
+        self.last_prompt_ms: int = 0
+        self.last_tokens_per_second: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+
+    def begin(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def end(self, seconds: float, error: str, usage: dict[str, int]) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            self.total_seconds += seconds
+            self.last_seconds = seconds
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            self.cached_tokens += usage.get(CACHED_TOKENS_KEY, 0)
+            if not error:
+                self.last_cached_tokens = usage.get(CACHED_TOKENS_KEY, 0)
+                self.last_prompt_ms = usage.get(PROMPT_MS_KEY, 0)
+            if usage.get("completion_tokens", 0) and seconds > 0:
+                self.last_tokens_per_second = usage["completion_tokens"] / seconds
+            if error:
+                self.errors += 1
+                self.last_error = error
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "avg_seconds": self.total_seconds / self.calls if self.calls else 0.0,
+                "last_seconds": self.last_seconds,
+                "last_error": self.last_error,
+                "prompt_tokens": self.prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "cached_tokens": self.cached_tokens,
+                "last_cached_tokens": self.last_cached_tokens,
+                "last_prompt_ms": self.last_prompt_ms,
+                "last_tokens_per_second": self.last_tokens_per_second,
+            }
+
+
+VLM_METRICS: VlmMetrics = VlmMetrics()
+
+
+class PromptSlots:
+    def __init__(self) -> None:
+        self._slots: dict[str, int] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def slot(self, system_prompt: str, slot_count: int) -> int:
+        with self._lock:
+            if system_prompt not in self._slots:
+                self._slots[system_prompt] = len(self._slots) % slot_count
+            return self._slots[system_prompt]
+
+
+PROMPT_SLOTS: PromptSlots = PromptSlots()
+
+
+_body_prefixes: dict[tuple[object, ...], bytes] = {}
+_body_prefixes_lock: threading.Lock = threading.Lock()
+
+
+def _body_prefix(fields: tuple[tuple[str, object], ...], system_prompt: str) -> bytes:
+    key: tuple[object, ...] = (fields, system_prompt)
+    found: bytes | None = _body_prefixes.get(key)
+    if found is None:
+        built: bytes = b"".join((
+            b"{",
+            BODY_SEPARATOR.join(
+                json.dumps(name).encode("ascii") + b": " + json.dumps(value, ensure_ascii=False).encode("utf-8")
+                for name, value in fields
+            ),
+            BODY_USER_OPEN,
+            json.dumps({"role": "system", "content": system_prompt}, ensure_ascii=False).encode("utf-8"),
+            BODY_USER_CONTENT,
+        ))
+        with _body_prefixes_lock:
+            if len(_body_prefixes) >= BODY_PREFIX_CACHE_LIMIT:
+                _body_prefixes.clear()
+            found = _body_prefixes.setdefault(key, built)
+    return found
+
 
+def _image_parts(image: object) -> list[bytes]:
+    if isinstance(image, str):
+        return [json.dumps({"type": "image_url", "image_url": {"url": image}}).encode("utf-8")]
+    return [IMAGE_PART_OPEN, getattr(image, "b64_ascii")(), IMAGE_PART_CLOSE]
 
-def _call_vlm(image_b64: str, user_text: str, system_prompt: str, brain: object) -> str:
-    user_content: list[dict[str, object]] = []
+
+def _chat_body(brain: object, request: dict[str, object]) -> list[bytes]:
+    content: list[list[bytes]] = []
+    user_text: str = str(request.get("text", "") or "")
     if user_text:
-        user_content.append({"type": "text", "text": user_text})
-    user_content.append({
-        "type": "image_url",
-        "image_url": {"url": f"data:image/png;base64,{image_b64}"},
-    })
-    body: bytes = json.dumps({
-        "model": str(_cfg(brain, "VLM_MODEL_NAME", "")),
-        "temperature": float(_cfg(brain, "VLM_TEMPERATURE", 0.6)),
-        "top_p": float(_cfg(brain, "VLM_TOP_P", 0.85)),
-        "max_tokens": int(_cfg(brain, "VLM_MAX_TOKENS", 800)),
-        "messages": [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_content},
-        ],
-    }).encode("utf-8")
-    endpoint: str = str(_cfg(brain, "VLM_ENDPOINT_URL", ""))
-    req: urllib.request.Request = urllib.request.Request(
-        endpoint,
-        data=body,
-        headers={"Content-Type": "application/json", "Accept": "application/json"},
-        method="POST",
-    )
+        content.append([json.dumps({"type": "text", "text": user_text}, ensure_ascii=False).encode("utf-8")])
+    image: object = request.get("image")
+    if image is not None and image != "":
+        content.append(_image_parts(image))
+    extra_images: object = request.get("images") or []
+    if not isinstance(extra_images, list):
+        raise TypeError("images must be a list")
+    for extra in extra_images:
+        content.append(_image_parts(extra))
+    system_prompt: str = str(request.get("system", "") or "")
+    fields: list[tuple[str, object]] = [
+        ("model", str(request.get("model") or _cfg(brain, "VLM_MODEL_NAME", ""))),
+        ("temperature", float(request.get("temperature", _cfg(brain, "VLM_TEMPERATURE", 0.6)))),
+        ("top_p", float(request.get("top_p", _cfg(brain, "VLM_TOP_P", 0.85)))),
+        ("max_tokens", int(request.get("max_tokens", _cfg(brain, "VLM_MAX_TOKENS", 800)))),
+    ]
+    if bool(request.get("cache_prompt", _cfg(brain, "VLM_CACHE_PROMPT", False))):
+        fields.append(("cache_prompt", True))
+    slot_count: int = int(_cfg(brain, "VLM_CACHE_SLOTS", 0))
+    if request.get("slot") is not None:
+        fields.append(("id_slot", int(request["slot"])))
+    elif slot_count > 0:
+        fields.append(("id_slot", PROMPT_SLOTS.slot(system_prompt, slot_count)))
+    buffers: list[bytes] = [_body_prefix(tuple(fields), system_prompt)]
+    for index, part in enumerate(content):
+        if index:
+            buffers.append(BODY_SEPARATOR)
+        buffers.extend(part)
+    buffers.append(BODY_TAIL)
+    return buffers
+
+
+def _extract_content(resp_obj: object) -> str:
+    if isinstance(resp_obj, dict):
+        choices: object = resp_obj.get("choices", [])
+        if isinstance(choices, list) and len(choices) > 0:
+            first: object = choices[0]
+            if isinstance(first, dict):
+                msg: object = first.get("message", {})
+                if isinstance(msg, dict):
+                    content: object = msg.get("content", "")
+                    if isinstance(content, str):
+                        return content
+    raise VlmFailure("bad_response", "no choices[0].message.content")
+
+
+def _extract_usage(resp_obj: object) -> dict[str, int]:
+    usage: object = resp_obj.get("usage") if isinstance(resp_obj, dict) else None
+    if not isinstance(usage, dict):
+        return {}
+    found: dict[str, int] = {key: int(usage[key]) for key in USAGE_KEYS if isinstance(usage.get(key), int)}
+    details: object = usage.get("prompt_tokens_details")
+    timings: object = resp_obj.get("timings")
+    if isinstance(details, dict) and isinstance(details.get(CACHED_TOKENS_KEY), int):
+        found[CACHED_TOKENS_KEY] = int(details[CACHED_TOKENS_KEY])
+    elif isinstance(timings, dict) and isinstance(timings.get("cache_n"), int):
+        found[CACHED_TOKENS_KEY] = int(timings["cache_n"])
+    if isinstance(timings, dict) and isinstance(timings.get(PROMPT_MS_KEY), (int, float)):
+        found[PROMPT_MS_KEY] = round(timings[PROMPT_MS_KEY])
+    return found
+
+
+def _post_chat(
+    pool: EndpointPool, body: list[bytes], timeout: float, extra_headers: dict[str, str] | None = None,
+) -> tuple[str, dict[str, int]]:
+    try:
+        status, payload = pool.post(body, timeout, extra_headers)
+    except TimeoutError as exc:
+        raise VlmFailure("timeout", str(exc) or f"no response in {timeout}s") from exc
+    except (OSError, http.client.HTTPException) as exc:
+        raise VlmFailure("network", str(exc) or type(exc).__name__) from exc
+    if status != HTTP_OK:
+        raise VlmFailure("http", f"status {status}: {payload.decode('utf-8', 'replace')}")
     try:
-        with urllib.request.urlopen(req, timeout=VLM_TIMEOUT) as resp:
-            resp_obj: object = json.loads(resp.read().decode("utf-8"))
-        if isinstance(resp_obj, dict):
-            choices: object = resp_obj.get("choices", [])
-            if isinstance(choices, list) and len(choices) > 0:
-                first: object = choices[0]
-                if isinstance(first, dict):
-                    msg: object = first.get("message", {})
-                    if isinstance(msg, dict):
-                        content: object = msg.get("content", "")
-                        if isinstance(content, str):
-                            return content
-    except Exception as exc:
-        print(f"VLM error: {exc}", file=sys.stderr)
-    return ""
+        resp_obj: object = json.loads(payload.decode("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        raise VlmFailure("bad_response", str(exc)) from exc
+    return _extract_content(resp_obj), _extract_usage(resp_obj)
+
+
+def _vlm_request(brain: object, request: dict[str, object]) -> dict[str, object]:
+    started: float = time.monotonic()
+    timeout: float = float(request.get("timeout") or VLM_TIMEOUT)
+    text: str = ""
+    usage: dict[str, int] = {}
+    kind: str = ""
+    error: str = ""
+    fleet_desktop: str = str(_cfg(brain, "FLEET_DESKTOP", ""))
+    extra_headers: dict[str, str] | None = {
+        FLEET_DESKTOP_HEADER: fleet_desktop,
+        FLEET_PRIORITY_HEADER: str(request.get("priority") or FLEET_DEFAULT_PRIORITY),
+    } if fleet_desktop else None
+    VLM_METRICS.begin()
+    try:
+        body: list[bytes] = _chat_body(brain, request)
+        text, usage = _post_chat(_endpoint_pool(brain), body, timeout, extra_headers)
+    except VlmFailure as exc:
+        kind = exc.kind
+        error = exc.message
+    except (TypeError, ValueError) as exc:
+        kind = "bad_request"
+        error = str(exc)
+    seconds: float = time.monotonic() - started
+    VLM_METRICS.end(seconds, error, usage)
+    return {"text": text, "error": error, "kind": kind, "seconds": seconds, "usage": usage}
+
+
+def _call_vlm(
+    frame: Frame, user_text: str, system_prompt: str, brain: object,
+    crops: list[Frame] | None = None, max_tokens: int = 0,
+) -> dict[str, object]:
+    request: dict[str, object] = {
+        "text": user_text,
+        "image": frame,
+        "images": crops or [],
+        "system": system_prompt,
+        "priority": "turn",
+    }
+    if max_tokens > 0:
+        request["max_tokens"] = max_tokens
+    result: dict[str, object] = _vlm_request(brain, request)
+    if result["error"]:
+        print(f"VLM error: {result['kind']}: {result['error']}", file=sys.stderr)
+    return result
+
+
+def _snap_patch(value: float) -> int:
+    return max(PATCH_SIZE, round(value / PATCH_SIZE) * PATCH_SIZE)
+
+
+class LatencyGovernor:
+    def __init__(
+        self, target_seconds: float, width: int, height: int,
+        min_width: int, max_width: int, max_tokens: int, min_tokens: int, max_tokens_cap: int,
+    ) -> None:
+        self.target_seconds: float = target_seconds
+        self.resizable: bool = width > 0 and height > 0
+        self.aspect: float = height / width if self.resizable else 1.0
+        self.min_width: int = _snap_patch(min_width)
+        self.max_width: int = max(self.min_width, max_width // PATCH_SIZE * PATCH_SIZE)
+        self.width: int = min(self.max_width, max(self.min_width, _snap_patch(width))) if self.resizable else 0
+        self.min_tokens: int = min_tokens
+        self.max_tokens_cap: int = max(min_tokens, max_tokens_cap)
+        self.max_tokens: int = min(self.max_tokens_cap, max(min_tokens, max_tokens))
+        self.latency: float = 0.0
+
+    def size(self) -> tuple[int, int]:
+        if not self.resizable:
+            return NO_RESIZE, NO_RESIZE
+        return self.width, _snap_patch(self.width * self.aspect)
+
+    def _step_width(self, direction: int) -> bool:
+        stepped: int = min(self.max_width, max(self.min_width, self.width + direction * GOVERNOR_STEP_PATCHES * PATCH_SIZE))
+        if not self.resizable or stepped == self.width:
+            return False
+        self.width = stepped
+        return True
+
+    def _step_tokens(self, direction: int) -> bool:
+        stepped: int = min(self.max_tokens_cap, max(
+            self.min_tokens, int(self.max_tokens * (1 + direction * GOVERNOR_TOKEN_STEP)),
+        ))
+        if stepped == self.max_tokens:
+            return False
+        self.max_tokens = stepped
+        return True
+
+    def observe(self, seconds: float, usage: dict[str, int]) -> dict[str, object] | None:
+        self.latency = seconds if self.latency <= 0 else (
+            GOVERNOR_SMOOTHING * seconds + (1 - GOVERNOR_SMOOTHING) * self.latency
+        )
+        capped: bool = usage.get("completion_tokens", 0) >= self.max_tokens * GOVERNOR_CAP_RATIO
+        reason: str = ""
+        if self.latency > self.target_seconds * (1 + GOVERNOR_BAND):
+            if self._step_width(-1):
+                reason = "slow: smaller image"
+            elif self._step_tokens(-1):
+                reason = "slow: fewer tokens"
+        elif self.latency < self.target_seconds * (1 - GOVERNOR_BAND):
+            if capped and self._step_tokens(1):
+                reason = "fast: more tokens"
+            elif self._step_width(1):
+                reason = "fast: larger image"
+        if not reason:
+            return None
+        width, height = self.size()
+        return {
+            "event": "governor",
+            "reason": reason,
+            "latency": self.latency,
+            "target": self.target_seconds,
+            "width": width,
+            "height": height,
+            "max_tokens": self.max_tokens,
+        }
+
+
+def _make_governor(brain: object, view_width: int, view_height: int) -> LatencyGovernor | None:
+    target: float = float(_cfg(brain, "GOVERNOR_TARGET_SECONDS", 0.0))
+    if target <= 0:
+        return None
+    max_tokens: int = int(_cfg(brain, "VLM_MAX_TOKENS", 800))
+    return LatencyGovernor(
+        target, view_width, view_height,
+        int(_cfg(brain, "GOVERNOR_MIN_WIDTH", GOVERNOR_MIN_WIDTH)),
+        int(_cfg(brain, "GOVERNOR_MAX_WIDTH", view_width)),
+        max_tokens,
+        int(_cfg(brain, "GOVERNOR_MIN_TOKENS", GOVERNOR_MIN_TOKENS)),
+        int(_cfg(brain, "GOVERNOR_MAX_TOKENS", max_tokens)),
+    )
+
+
+def _roi_crops(
+    previous: Frame | None, frame: Frame, max_crops: int, pixel_budget: int,
+) -> list[tuple[Frame, tuple[int, int, int, int]]]:
+    if (
+        max_crops <= 0 or pixel_budget <= 0 or previous is None
+        or previous.bgra is None or frame.bgra is None
+        or (previous.width, previous.height) != (frame.width, frame.height)
+    ):
+        return []
+    boxes: list[tuple[int, int, int, int]] = changed_boxes(
+        previous.bgra, frame.bgra, frame.width, frame.height, ROI_CELL, ROI_MARGIN_CELLS,
+    )
+    screen_area: int = frame.width * frame.height
+    boxes = [box for box in boxes if box[2] * box[3] <= screen_area * ROI_MAX_COVERAGE]
+    boxes.sort(key=lambda box: box[2] * box[3], reverse=True)
+    chosen: list[tuple[int, int, int, int]] = boxes[:max_crops]
+    crops: list[tuple[Frame, tuple[int, int, int, int]]] = []
+    for x, y, crop_w, crop_h in chosen:
+        share: int = pixel_budget // len(chosen)
+        scale: float = min(1.0, (share / (crop_w * crop_h)) ** 0.5)
+        crop: Frame = frame.crop(x, y, crop_w, crop_h).resized(
+            max(1, int(crop_w * scale)), max(1, int(crop_h * scale)),
+        )
+        crops.append((crop, (
+            x * NORM_SCALE // frame.width,
+            y * NORM_SCALE // frame.height,
+            (x + crop_w) * NORM_SCALE // frame.width,
+            (y + crop_h) * NORM_SCALE // frame.height,
+        )))
+    return crops
+
+
+def _roi_text(crops: list[tuple[Frame, tuple[int, int, int, int]]]) -> str:
+    if not crops:
+        return ""
+    lines: list[str] = [
+        f"Image {index} zooms into [{x1},{y1},{x2},{y2}] of the screenshot at higher resolution."
+        for index, (_, (x1, y1, x2, y2)) in enumerate(crops, start=2)
+    ]
+    return "\n" + "\n".join(lines)
 
 
 def _make_cursor_overlay(cx: int, cy: int) -> dict[str, object]:
@@ -240,13 +964,240 @@ def _make_cursor_overlay(cx: int, cy: int) -> dict[str, object]:
     }
 
 
-def _engine_loop(brain: object, franz: object, session: SessionLog) -> None:
+_worker_conn: object = None
+_worker_conn_lock: threading.Lock = threading.Lock()
+_worker_calls: dict[int, queue.Queue] = {}
+_worker_call_ids: itertools.count = itertools.count(1)
+_worker_commands: queue.Queue = queue.Queue()
+_worker_frame: Frame | None = None
+
+
+def _worker_call(kind: str, *args: object) -> object:
+    reply: queue.Queue = queue.Queue(maxsize=1)
+    with _worker_conn_lock:
+        call_id: int = next(_worker_call_ids)
+        _worker_calls[call_id] = reply
+        _worker_conn.send((kind, call_id, *args))
+    result: object = reply.get()
+    if isinstance(result, EOFError):
+        raise result
+    return result
+
+
+def _worker_read(conn: object) -> None:
+    while True:
+        try:
+            message: tuple[object, ...] = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] != "reply":
+            _worker_commands.put(message)
+            continue
+        with _worker_conn_lock:
+            reply: queue.Queue | None = _worker_calls.pop(int(message[1]), None)
+        if reply is not None:
+            reply.put(message[2])
+    with _worker_conn_lock:
+        waiting: list[queue.Queue] = list(_worker_calls.values())
+        _worker_calls.clear()
+    for reply in waiting:
+        reply.put(EOFError("brain worker pipe closed"))
+    _worker_commands.put(None)
+
+
+def _worker_current_frame(max_age: float | None) -> Frame | None:
+    global _worker_frame
+    cached: Frame | None = _worker_frame
+    reply: tuple[object, ...] | None = _worker_call("frame", max_age, cached.seq if cached is not None else -1)
+    if reply is not None:
+        seq, region, width, height, bgra, png, captured_at = reply
+        _worker_frame = Frame(seq, region, width, height, bgra=bgra, png=png, captured_at=captured_at)
+    return _worker_frame
+
+
+def _worker_similar(screen_hash: int, k: int, max_distance: int) -> list[dict[str, object]]:
+    return _worker_call("similar", screen_hash, k, max_distance)
+
+
+def _worker_vlm(request: dict[str, object]) -> dict[str, object]:
+    sendable: dict[str, object] = dict(request)
+    image: object = sendable.get("image")
+    if image is not None and not isinstance(image, str):
+        sendable["image"] = getattr(image, "data_url")()
+    images: object = sendable.get("images")
+    if isinstance(images, list):
+        sendable["images"] = [item if isinstance(item, str) else getattr(item, "data_url")() for item in images]
+    return _worker_call("vlm", sendable)
+
+
+def _brain_worker_main(conn: object, brain_file: str, overrides: dict[str, object]) -> None:
+    global _worker_conn
+    _worker_conn = conn
+    _runtime_overrides.update(overrides)
+    franz: object = _load_module("franz", "franz.py")
+    brain: object = _load_module("brain", brain_file)
+    getattr(franz, "_bind_frame_source")(_worker_current_frame)
+    getattr(franz, "_bind_similar")(_worker_similar)
+    getattr(franz, "_bind_vlm")(_worker_vlm, int(_cfg(brain, "VLM_MAX_CONCURRENCY", VLM_MAX_CONCURRENCY)))
+    threading.Thread(target=_worker_read, args=(conn,), name="brain-pipe", daemon=True).start()
+    while True:
+        message: tuple[object, ...] | None = _worker_commands.get()
+        if message is None:
+            return
+        result: dict[str, object] = {"text": None, "error": ""}
+        match message[0]:
+            case "start":
+                on_start_fn: object = getattr(brain, "on_start", None)
+                if callable(on_start_fn):
+                    try:
+                        on_start_fn()
+                    except Exception as exc:
+                        result["error"] = f"on_start: {exc}"
+            case "turn":
+                turn_handle, turn_token = getattr(franz, "_begin_turn")(int(message[2]))
+                try:
+                    result["text"] = getattr(brain, "on_vlm_response")(str(message[1]))
+                except Exception as exc:
+                    result["error"] = f"on_vlm_response: {exc}"
+                result["actions"], result["overlays"], result["parse_errors"] = getattr(franz, "_end_turn")(
+                    turn_handle, turn_token,
+                )
+                try:
+                    result["layers"] = getattr(franz, "_flush_layers")()
+                except (TypeError, ValueError, IndexError, KeyError) as exc:
+                    result["error"] = f"layers: {exc}"
+                    result["layers"] = []
+        with _worker_conn_lock:
+            conn.send(("done", result))
+
+
+class BrainWorker:
+    def __init__(self, brain_file: str, overrides: dict[str, object], timeout: float, vlm_workers: int) -> None:
+        self.brain_file: str = brain_file
+        self.overrides: dict[str, object] = overrides
+        self.timeout: float = timeout
+        self.restarts: int = 0
+        self._context: object = multiprocessing.get_context("spawn")
+        self._proc: object = None
+        self._conn: object = None
+        self._send_lock: threading.Lock = threading.Lock()
+        self._vlm_pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max(1, vlm_workers), thread_name_prefix="brain-vlm",
+        )
+
+    def _kill(self) -> None:
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.join()
+            self._conn.close()
+        self._proc = None
+        self._conn = None
+
+    def _reply(self, conn: object, call_id: int, value: object) -> None:
+        with self._send_lock:
+            conn.send(("reply", call_id, value))
+
+    def _answer_vlm(self, brain: object, conn: object, call_id: int, request: dict[str, object]) -> None:
+        result: dict[str, object] = _vlm_request(brain, request)
+        try:
+            self._reply(conn, call_id, result)
+        except OSError:
+            pass
+
+    def _exchange(self, brain: object, message: tuple[object, ...]) -> dict[str, object]:
+        deadline: float = time.monotonic() + self.timeout
+        conn: object = self._conn
+        with self._send_lock:
+            conn.send(message)
+        while True:
+            remaining: float = deadline - time.monotonic()
+            if remaining <= 0 or not conn.poll(remaining):
+                raise TimeoutError(f"{message[0]} took longer than {self.timeout:.0f}s")
+            reply: tuple[object, ...] = conn.recv()
+            match reply[0]:
+                case "done":
+                    return dict(reply[1])
+                case "vlm":
+                    self._vlm_pool.submit(self._answer_vlm, brain, conn, int(reply[1]), dict(reply[2]))
+                case "similar":
+                    self._reply(conn, int(reply[1]), SCREENS.nearest(int(reply[2]), int(reply[3]), int(reply[4])))
+                case "frame":
+                    frame: Frame | None = _current_frame(brain, reply[2])
+                    if frame is None or frame.seq == reply[3]:
+                        self._reply(conn, int(reply[1]), None)
+                    else:
+                        self._reply(conn, int(reply[1]), (
+                            frame.seq, frame.region, frame.width, frame.height, frame.bgra,
+                            None if frame.bgra is not None else frame.png(), frame.captured_at,
+                        ))
+
+    def _ensure(self, brain: object) -> dict[str, object] | None:
+        if self._proc is not None and self._proc.is_alive():
+            return None
+        if self._proc is not None:
+            self._kill()
+            self.restarts += 1
+        parent_conn, child_conn = self._context.Pipe()
+        self._proc = self._context.Process(
+            target=_brain_worker_main, args=(child_conn, self.brain_file, self.overrides), daemon=True,
+        )
+        self._proc.start()
+        child_conn.close()
+        self._conn = parent_conn
+        return self._exchange(brain, ("start",))
+
+    def run(self, brain: object, message: tuple[object, ...]) -> dict[str, object]:
+        try:
+            started: dict[str, object] | None = self._ensure(brain)
+            if message[0] == "start":
+                return started or {"text": None, "error": ""}
+            return self._exchange(brain, message)
+        except (OSError, EOFError, TimeoutError, pickle.PicklingError) as exc:
+            self._kill()
+            self.restarts += 1
+            return {"text": None, "error": f"brain worker: {str(exc) or type(exc).__name__}", "restarted": True}
+
+
+def _engine_loop(brain: object, franz: object, session: SessionLog, brain_file: str) -> None:
     system_prompt: str = str(getattr(brain, "SYSTEM_PROMPT", ""))
     on_vlm_response_fn: object = getattr(brain, "on_vlm_response")
-    flush_pipes_fn: object = getattr(franz, "_flush_pipes")
+    on_start_fn: object = getattr(brain, "on_start", None)
+    begin_turn_fn: object = getattr(franz, "_begin_turn")
+    end_turn_fn: object = getattr(franz, "_end_turn")
+    encode_overlays_fn: object = getattr(franz, "_encode_overlays")
+    flush_layers_fn: object = getattr(franz, "_flush_layers")
+    pipe_capacity: int = int(_cfg(brain, "PIPE_CAPACITY", getattr(franz, "PIPE_CAPACITY")))
     capture_delay: float = float(_cfg(brain, "CAPTURE_DELAY_SECONDS", 3.0))
     action_delay: float = float(_cfg(brain, "ACTION_DELAY_SECONDS", 0.3))
     show_cursor: bool = bool(_cfg(brain, "SHOW_CURSOR", True))
+    view_width, view_height = _vlm_size(brain)
+    roi_max_crops: int = int(_cfg(brain, "ROI_MAX_CROPS", ROI_MAX_CROPS))
+    roi_pixel_budget: int = int(_cfg(brain, "ROI_PIXEL_BUDGET", ROI_PIXEL_BUDGET))
+    screen_index: bool = bool(_cfg(brain, "SCREEN_INDEX", True))
+    save_captures: bool = bool(_cfg(brain, "SAVE_CAPTURES", False))
+    last_seen: Frame | None = None
+    governor: LatencyGovernor | None = _make_governor(brain, view_width, view_height)
+    if governor is not None:
+        view_width, view_height = governor.size()
+    worker: BrainWorker | None = None
+    if bool(_cfg(brain, "BRAIN_ISOLATION", False)):
+        worker = BrainWorker(
+            brain_file, dict(_runtime_overrides), float(_cfg(brain, "BRAIN_TURN_TIMEOUT", BRAIN_TURN_TIMEOUT)),
+            int(_cfg(brain, "VLM_MAX_CONCURRENCY", VLM_MAX_CONCURRENCY)),
+        )
+
+    with STATE.lock:
+        STATE.view_size = (view_width, view_height)
+
+    if worker is not None:
+        started: dict[str, object] = worker.run(brain, ("start",))
+        if started["error"]:
+            print(f"brain worker error: {started['error']}", file=sys.stderr)
+    elif callable(on_start_fn):
+        try:
+            on_start_fn()
+        except Exception as exc:
+            print(f"on_start error: {exc}", file=sys.stderr)
 
     previous_user_text: str = ""
     last_cursor_pos: tuple[int, int] = (DEFAULT_CURSOR_POS, DEFAULT_CURSOR_POS)
@@ -255,55 +1206,131 @@ def _engine_loop(brain: object, franz: object, session: SessionLog) -> None:
         with STATE.lock:
             STATE.turn += 1
             STATE.phase = "capturing"
+        _publish_state()
+        turn_started: float = time.time()
 
         if capture_delay > 0:
             time.sleep(capture_delay)
-        raw_b64: str = _subprocess_capture(brain)
-        if not raw_b64:
+        capture_started: float = time.monotonic()
+        frame: Frame | None = _subprocess_capture(brain, _next_raw_seq())
+        capture_seconds: float = time.monotonic() - capture_started
+        if frame is None:
             time.sleep(FALLBACK_SLEEP)
             continue
 
+        _store_frame(frame)
         with STATE.lock:
-            STATE.raw_b64 = raw_b64
-            STATE.raw_seq += 1
             STATE.phase = "calling_vlm"
-
+        _publish_state()
         current_turn: int = STATE.turn
+        frame_refs: dict[str, str] = {}
+        if save_captures or session.recorder is not None:
+            frame_refs["pre"] = session.save_frame(frame, current_turn, "pre")
+
         user_text_for_vlm: str = (
             f"Previous: {previous_user_text}"
             if previous_user_text
-            else "What do you see? What should you do?"
+            else FIRST_TURN_PROMPT
         )
+        crops: list[tuple[Frame, tuple[int, int, int, int]]] = _roi_crops(
+            last_seen, frame, roi_max_crops, roi_pixel_budget,
+        )
+        user_text_for_vlm += _roi_text(crops)
+        last_seen = frame
         session.write_turn(current_turn, "INPUT", user_text_for_vlm)
 
-        vlm_response: str = _call_vlm(raw_b64, user_text_for_vlm, system_prompt, brain)
+        vlm_result: dict[str, object] = _call_vlm(
+            frame.resized(view_width, view_height), user_text_for_vlm, system_prompt, brain,
+            [crop for crop, _ in crops], governor.max_tokens if governor is not None else 0,
+        )
+        vlm_response: str = str(vlm_result["text"])
+        vlm_seconds: float = float(vlm_result["seconds"])
+        usage: dict[str, int] = dict(vlm_result["usage"])
         session.write_turn(current_turn, "OUTPUT", vlm_response)
+        session.write_event({
+            "event": "vlm",
+            "turn": current_turn,
+            "capture_seconds": capture_seconds,
+            "seconds": vlm_seconds,
+            "width": view_width,
+            "height": view_height,
+            **usage,
+            "tokens_per_second": usage.get("completion_tokens", 0) / vlm_seconds if vlm_seconds > 0 else 0.0,
+        })
+        if current_turn == 1:
+            print(f"First turn: capture {capture_seconds:.2f}s, VLM {vlm_seconds:.2f}s")
+        if governor is not None and not vlm_result["error"]:
+            adjustment: dict[str, object] | None = governor.observe(vlm_seconds, usage)
+            if adjustment is not None:
+                session.write_event({"turn": current_turn, **adjustment})
+                view_width, view_height = governor.size()
+                with STATE.lock:
+                    STATE.view_size = (view_width, view_height)
 
         if not vlm_response:
             with STATE.lock:
                 STATE.phase = "error"
                 STATE.error_text = "VLM returned empty"
+            _publish_state()
             time.sleep(ERROR_SLEEP)
             continue
 
         with STATE.lock:
             STATE.phase = "parsing"
-
-        try:
-            user_text_out: str = on_vlm_response_fn(vlm_response)
-        except Exception as exc:
-            print(f"on_vlm_response error: {exc}", file=sys.stderr)
-            user_text_out = vlm_response
+        _publish_state()
 
         pipe_actions: list[dict[str, object]]
-        pipe_overlays: list[dict[str, object]]
-        pipe_actions, pipe_overlays = flush_pipes_fn()
+        pipe_overlays: list[object]
+        parse_errors: list[dict[str, object]]
+        turn_layers: list[tuple[str, int, bytes]] | None = None
+        brain_started: float = time.monotonic()
+        if worker is not None:
+            outcome: dict[str, object] = worker.run(brain, ("turn", vlm_response, pipe_capacity))
+            if outcome["error"]:
+                print(f"brain worker error: {outcome['error']}", file=sys.stderr)
+                session.write_event({
+                    "event": "brain",
+                    "turn": current_turn,
+                    "error": outcome["error"],
+                    "restarted": bool(outcome.get("restarted", False)),
+                })
+            user_text_out: str = outcome["text"] if outcome["text"] is not None else vlm_response
+            pipe_actions = list(outcome.get("actions", []))
+            pipe_overlays = list(outcome.get("overlays", []))
+            parse_errors = list(outcome.get("parse_errors", []))
+            turn_layers = list(outcome.get("layers", []))
+        else:
+            turn_handle, turn_token = begin_turn_fn(pipe_capacity)
+            try:
+                user_text_out = on_vlm_response_fn(vlm_response)
+            except Exception as exc:
+                print(f"on_vlm_response error: {exc}", file=sys.stderr)
+                user_text_out = vlm_response
+            pipe_actions, pipe_overlays, parse_errors = end_turn_fn(turn_handle, turn_token)
+        brain_seconds: float = time.monotonic() - brain_started
+        encoded_actions: list[str] = []
+        sendable_actions: list[dict[str, object]] = []
+        for action in pipe_actions:
+            try:
+                encoded_actions.append(json.dumps(action, ensure_ascii=False))
+            except (TypeError, ValueError) as exc:
+                print(f"action error: {exc}", file=sys.stderr)
+                continue
+            sendable_actions.append(action)
+        pipe_actions = sendable_actions
+        actions_json: bytes = f"[{', '.join(encoded_actions)}]".encode("utf-8")
+        HISTORY.add(current_turn, "pre", frame.resized(view_width, view_height), EMPTY_OVERLAYS_JSON, actions_json)
 
         with STATE.lock:
             STATE.display_text = vlm_response
             STATE.display_actions = list(pipe_actions)
+            STATE.display_parse_error = "; ".join(
+                f"line {problem['line']}: {problem['error']}" for problem in parse_errors
+            )
             STATE.phase = "executing"
+        _publish_state()
 
+        execute_started: float = time.monotonic()
         executed_count: int = 0
         pending_drag: dict[str, object] | None = None
         for action in pipe_actions:
@@ -321,43 +1348,85 @@ def _engine_loop(brain: object, franz: object, session: SessionLog) -> None:
             _subprocess_execute_one(action, brain)
             executed_count += 1
             last_cursor_pos = _subprocess_cursor_pos(brain)
+        execute_seconds: float = time.monotonic() - execute_started
 
         with STATE.lock:
             STATE.phase = "annotating"
+        _publish_state()
 
         if capture_delay > 0:
             time.sleep(capture_delay)
-        post_b64: str = _subprocess_capture(brain)
-        if post_b64:
-            raw_b64 = post_b64
-            with STATE.lock:
-                STATE.raw_b64 = raw_b64
-                STATE.raw_seq += 1
-
-        final_overlays: list[dict[str, object]] = list(pipe_overlays)
+        post_frame: Frame | None = _subprocess_capture(brain, _next_raw_seq())
+        if post_frame is not None:
+            _store_frame(post_frame)
+        screen_hash: int | None = frame.dhash() if screen_index else None
+        if screen_hash is not None:
+            SCREENS.add(ScreenRecord(
+                session.session_dir.name, current_turn, screen_hash,
+                post_frame.dhash() if post_frame is not None else None, actions_json,
+                str(user_text_out)[:SCREEN_TEXT_LIMIT],
+            ))
+
+        final_overlays: list[object] = list(pipe_overlays)
         if show_cursor:
             final_overlays.append(
                 _make_cursor_overlay(last_cursor_pos[0], last_cursor_pos[1])
             )
+        try:
+            overlay_records, overlays_json = encode_overlays_fn(final_overlays)
+            layers: list[tuple[str, int, bytes]] = turn_layers if turn_layers is not None else flush_layers_fn()
+        except (TypeError, ValueError, IndexError, KeyError) as exc:
+            print(f"overlay error: {exc}", file=sys.stderr)
+            overlay_records, overlays_json, layers = [], EMPTY_OVERLAYS_JSON, []
 
         with STATE.lock:
-            STATE.overlays = final_overlays
+            STATE.overlays = overlay_records
+            STATE.overlays_json = overlays_json
+            STATE.layers = layers
             STATE.pending_seq = current_turn
             STATE.annotated_seq = -1
-            STATE.annotated_b64 = ""
+            STATE.annotated_frame = None
             STATE.annotated_ready.clear()
             STATE.phase = "waiting_annotated"
+        if post_frame is not None:
+            HISTORY.add(current_turn, "post", post_frame.resized(view_width, view_height), overlays_json, actions_json)
+            if session.recorder is not None:
+                frame_refs["post"] = session.save_frame(post_frame, current_turn, "post", overlays_json)
+        _publish_state()
 
+        annotate_started: float = time.monotonic()
         STATE.annotated_ready.wait()
+        annotate_seconds: float = time.monotonic() - annotate_started
 
         with STATE.lock:
-            annotated_result: str = STATE.annotated_b64
+            annotated_result: Frame | None = STATE.annotated_frame
 
-        session.save_png(annotated_result)
+        if annotated_result is not None:
+            HISTORY.add(current_turn, "annotated", annotated_result, overlays_json, actions_json)
+            frame_refs["annotated"] = session.save_frame(annotated_result, current_turn, "annotated", overlays_json)
         previous_user_text = user_text_out if isinstance(user_text_out, str) else vlm_response
+        if session.catalog is not None:
+            session.catalog.add_turn({
+                "session": session.session_dir.name,
+                "turn": current_turn,
+                "started_at": turn_started,
+                "ended_at": time.time(),
+                "capture_seconds": capture_seconds,
+                "vlm_seconds": vlm_seconds,
+                "brain_seconds": brain_seconds,
+                "execute_seconds": execute_seconds,
+                "annotate_seconds": annotate_seconds,
+                "input": user_text_for_vlm,
+                "output": vlm_response,
+                "actions": pipe_actions,
+                "parse_errors": len(parse_errors),
+                "parse_error": "\n".join(f"line {problem['line']}: {problem['error']}" for problem in parse_errors),
+                "frames": frame_refs,
+            })
 
         with STATE.lock:
             STATE.phase = "idle"
+        _publish_state()
 
 
 class FranzHandler(http.server.BaseHTTPRequestHandler):
@@ -365,11 +1434,15 @@ class FranzHandler(http.server.BaseHTTPRequestHandler):
         pass
 
     def _send_json(self, code: int, data: dict[str, object]) -> None:
-        body: bytes = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self._send_json_bytes(code, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+    def _send_json_bytes(self, code: int, body: bytes, etag: str = "") -> None:
         self.send_response(code)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(body)))
         self.send_header("Cache-Control", "no-cache")
+        if etag:
+            self.send_header("ETag", etag)
         self.send_header("Access-Control-Allow-Origin", "*")
         self.send_header("Access-Control-Allow-Methods", "GET,POST,OPTIONS")
         self.send_header("Access-Control-Allow-Headers", "Content-Type")
@@ -377,9 +1450,11 @@ class FranzHandler(http.server.BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(body)
 
-    def _send_html(self, code: int, html_bytes: bytes) -> None:
+    def _send_html(self, code: int, html_bytes: bytes, encoding: str = "") -> None:
         self.send_response(code)
         self.send_header("Content-Type", "text/html; charset=utf-8")
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
         self.send_header("Content-Length", str(len(html_bytes)))
         self.send_header("Cache-Control", "no-cache")
         self.send_header("Access-Control-Allow-Origin", "*")
@@ -387,34 +1462,150 @@ class FranzHandler(http.server.BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(html_bytes)
 
+    def _send_png(self, seq: int, png: bytes) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(png)))
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("ETag", f'"{seq}"')
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(png)
+
+    def _not_modified(self, etag: str) -> bool:
+        if self.headers.get("If-None-Match", "") != etag:
+            return False
+        self.send_response(HTTP_NOT_MODIFIED)
+        self.send_header("ETag", etag)
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        return True
+
+    def _query(self, name: str) -> str:
+        return urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query).get(name, [""])[0]
+
+    def _frame_body(self) -> tuple[int, bytes]:
+        with STATE.lock:
+            frame: Frame | None = STATE.frame
+            view_size: tuple[int, int] = STATE.view_size
+            overlays_json: bytes = STATE.overlays_json
+            manifest: list[list[object]] = [[name, version] for name, version, _ in STATE.layers]
+            cached: tuple[tuple[object, ...], int, bytes] | None = STATE.frame_body
+        key: tuple[object, ...] = (frame, view_size, overlays_json, tuple(tuple(entry) for entry in manifest))
+        if (
+            cached is not None and cached[0][0] is frame and cached[0][2] is overlays_json
+            and cached[0][1] == view_size and cached[0][3] == key[3]
+        ):
+            return cached[1], cached[2]
+        if frame is not None:
+            frame = frame.resized(*view_size)
+        image_format, raw_b64 = frame.preview() if frame is not None else ("png", "")
+        seq: int = frame.seq if frame is not None else 0
+        body: bytes = b"".join((
+            b'{"seq": ', str(seq).encode("ascii"),
+            b', "format": "', image_format.encode("ascii"),
+            b'", "raw_b64": "', raw_b64.encode("ascii"),
+            b'", "overlays": ', overlays_json,
+            b', "layers": ', json.dumps(manifest, ensure_ascii=False).encode("utf-8"), b"}",
+        ))
+        with STATE.lock:
+            STATE.frame_body_version += 1
+            version: int = STATE.frame_body_version
+            STATE.frame_body = (key, version, body)
+        return version, body
+
     def do_GET(self) -> None:
         path: str = self.path.split("?", 1)[0]
         match path:
             case "/" | "/index.html":
-                self._send_html(200, PANEL_PATH.read_bytes())
+                raw_html, gzipped_html = PANEL.load()
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    self._send_html(200, gzipped_html, "gzip")
+                else:
+                    self._send_html(200, raw_html)
             case "/state":
-                with STATE.lock:
-                    self._send_json(200, {
-                        "phase": STATE.phase,
-                        "turn": STATE.turn,
-                        "pending_seq": STATE.pending_seq,
-                        "annotated_seq": STATE.annotated_seq,
-                        "raw_seq": STATE.raw_seq,
-                        "error": STATE.error_text,
-                        "text": STATE.display_text,
-                        "display": {
-                            "text": STATE.display_text,
-                            "actions": STATE.display_actions,
-                        },
-                        "msg_id": STATE.turn,
-                    })
+                is_annotator: bool = LEASE.claim(self._query("client"))
+                try:
+                    state_since: int = int(self._query("since") or "-1")
+                except ValueError:
+                    self._send_json(400, {"error": "bad since"})
+                    return
+                with STATE.changed:
+                    STATE.changed.wait_for(lambda: STATE.snapshot.version > state_since, STATE_POLL_SECONDS)
+                    snapshot: StateSnapshot = STATE.snapshot
+                viewers: int = LEASE.viewers()
+                etag: str = f'"{snapshot.version}-{int(is_annotator)}-{viewers}"'
+                if self._not_modified(etag):
+                    return
+                self._send_json_bytes(200, b"".join((
+                    b'{"annotator": ', b"true" if is_annotator else b"false",
+                    b', "viewers": ', str(viewers).encode("ascii"),
+                    b", ", snapshot.members, b"}",
+                )), etag)
             case "/frame":
+                frame_version, frame_body = self._frame_body()
+                frame_etag: str = f'"f{frame_version}"'
+                if self._not_modified(frame_etag):
+                    return
+                self._send_json_bytes(200, frame_body, frame_etag)
+            case "/frames":
+                try:
+                    since: int = int(self._query("since") or "0")
+                    limit: int = int(self._query("limit") or str(HISTORY_PAGE_LIMIT))
+                except ValueError:
+                    self._send_json(400, {"error": "bad since/limit"})
+                    return
+                entries: list[HistoryEntry] = HISTORY.since(since, max(1, limit))
+                next_id: int = entries[-1].entry_id if entries else since
+                self._send_json_bytes(200, b"".join((
+                    b'{"latest": ', str(HISTORY.latest_id()).encode("ascii"),
+                    b', "next": ', str(next_id).encode("ascii"),
+                    b', "frames": [', b", ".join(entry.to_json() for entry in entries), b"]}",
+                )))
+            case "/sessions":
+                try:
+                    page_limit: int = int(self._query("limit") or str(PAGE_LIMIT))
+                    search: str = self._query("q")
+                    session_name: str = self._query("session")
+                    errors_only: bool = self._query("errors") in ("1", "true")
+                    page: dict[str, object] = (
+                        find_turns(
+                            CATALOG_PATH, search, session_name, errors_only,
+                            int(self._query("before") or "0"), page_limit,
+                        )
+                        if search or session_name or errors_only
+                        else list_sessions(CATALOG_PATH, self._query("before"), page_limit)
+                    )
+                except ValueError as exc:
+                    self._send_json(400, {"error": str(exc)})
+                    return
+                except sqlite3.Error as exc:
+                    self._send_json(503 if exc.sqlite_errorname in BUSY_ERRORS else 500, {"error": f"catalog: {exc}"})
+                    return
+                self._send_json(200, page)
+            case "/view.png":
+                with STATE.lock:
+                    view: Frame | None = STATE.view_frame
+                if view is None:
+                    self._send_json(404, {"error": "no annotated frame yet"})
+                    return
+                self._send_png(view.seq, view.png())
+            case "/layer":
+                name: str = self._query("name")
                 with STATE.lock:
-                    self._send_json(200, {
-                        "seq": STATE.raw_seq,
-                        "raw_b64": STATE.raw_b64,
-                        "overlays": STATE.overlays,
-                    })
+                    found: tuple[str, int, bytes] | None = next(
+                        (entry for entry in STATE.layers if entry[0] == name), None,
+                    )
+                if found is None:
+                    self._send_json(404, {"error": "unknown layer"})
+                    return
+                self._send_json_bytes(200, b"".join((
+                    b'{"name": ', json.dumps(found[0], ensure_ascii=False).encode("utf-8"),
+                    b', "version": ', str(found[1]).encode("ascii"),
+                    b', "overlays": ', found[2], b"}",
+                )))
             case _:
                 self._send_json(404, {"error": "not found"})
 
@@ -434,17 +1625,24 @@ class FranzHandler(http.server.BaseHTTPRequestHandler):
                     return
                 seq_val: object = parsed.get("seq")
                 img_val: object = parsed.get("image_b64", "")
+                if not LEASE.holds(str(parsed.get("client", ""))):
+                    self._send_json(409, {"ok": False, "err": "not annotator"})
+                    return
                 with STATE.lock:
                     expected: int = STATE.pending_seq
+                    region: str = STATE.frame.region if STATE.frame is not None else ""
                 if seq_val != expected:
                     self._send_json(409, {"ok": False, "err": "seq mismatch"})
                     return
                 if not isinstance(img_val, str) or len(img_val) < MIN_ANNOTATION_LENGTH:
                     self._send_json(400, {"ok": False, "err": "image too short"})
                     return
+                annotated: Frame = Frame.from_b64(expected, region, img_val)
                 with STATE.lock:
-                    STATE.annotated_b64 = img_val
+                    STATE.annotated_frame = annotated
+                    STATE.view_frame = annotated
                     STATE.annotated_seq = expected
+                _publish_state()
                 STATE.annotated_ready.set()
                 self._send_json(200, {"ok": True, "seq": expected})
             case _:
@@ -459,46 +1657,102 @@ class FranzHandler(http.server.BaseHTTPRequestHandler):
         self.end_headers()
 
 
+def _warm_up(brain: object) -> None:
+    WORKER.start()
+    PANEL.load()
+    try:
+        pool: EndpointPool = _endpoint_pool(brain)
+        body: list[bytes] = _chat_body(brain, {
+            "text": WARMUP_TEXT,
+            "system": str(getattr(brain, "SYSTEM_PROMPT", "")),
+            "max_tokens": WARMUP_MAX_TOKENS,
+        })
+    except VlmFailure as exc:
+        print(f"Warm-up skipped: {exc.message}")
+        return
+    for url, seconds, error in pool.warm(body, WARMUP_TIMEOUT):
+        print(f"Warm-up {url}: {seconds:.2f}s" + (f" ({error})" if error else ""))
+
+
 def _run_select_region() -> tuple[str, int]:
-    proc: subprocess.CompletedProcess[bytes] = subprocess.run(
-        [sys.executable, str(WIN32_PATH), "select_region"],
-        capture_output=True,
-    )
-    if proc.returncode == 2:
+    if WORKER.agent is not None:
+        code, output = WORKER.agent.run(["select_region"], None)
+    else:
+        proc: subprocess.CompletedProcess[bytes] = subprocess.run(
+            [sys.executable, str(WIN32_PATH), "select_region"],
+            capture_output=True,
+        )
+        code, output = proc.returncode, proc.stdout
+    if code == 2:
         return "", 2
-    if proc.returncode != 0 or not proc.stdout:
-        return "", proc.returncode
-    return proc.stdout.decode("ascii").strip(), 0
+    if code != 0 or not output:
+        return "", code
+    return output.decode("ascii").strip(), 0
 
 
 def main() -> None:
+    if sys.argv[1:2] == ["eval"]:
+        run_eval(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["fleet"]:
+        run_fleet(sys.argv[2:])
+        return
+
+    brain_file: str = "brain.py"
+    if sys.argv[1:2] == ["desktop"] and len(sys.argv) > 2:
+        launch: dict[str, object] = json.loads(sys.argv[2])
+        brain_file = str(launch["brain"])
+        _runtime_overrides.update(dict(launch["overrides"]))
+
     franz: object = _load_module("franz", "franz.py")
-    brain: object = _load_module("brain", "brain.py")
+    brain: object = _load_module("brain", brain_file)
 
     for name in ("SYSTEM_PROMPT", "on_vlm_response"):
         if not hasattr(brain, name):
             print(f"ERROR: brain.py missing: {name}")
             raise SystemExit(1)
 
-    if not hasattr(franz, "_flush_pipes"):
-        print("ERROR: franz.py missing: _flush_pipes")
+    if not hasattr(franz, "_begin_turn"):
+        print("ERROR: franz.py missing: _begin_turn")
         raise SystemExit(1)
 
-    print("Select capture region (drag), right-click for full screen, Escape to quit.")
-    region_str, exit_code = _run_select_region()
-
-    if exit_code == 2:
-        print("Cancelled.")
-        raise SystemExit(0)
-
-    if region_str:
-        print(f"Region selected: {region_str}")
-        _runtime_overrides["CAPTURE_REGION"] = region_str
-        _runtime_overrides["CAPTURE_WIDTH"] = NO_RESIZE
-        _runtime_overrides["CAPTURE_HEIGHT"] = NO_RESIZE
-    else:
-        print("Full screen mode.")
-        _runtime_overrides["CAPTURE_REGION"] = ""
+    agent_address: str = str(_cfg(brain, "DESKTOP_AGENT", ""))
+    if agent_address:
+        WORKER.use_agent(AgentClient.parse(agent_address, str(_cfg(brain, "DESKTOP_AGENT_TOKEN", ""))))
+        print(f"Desktop agent: {agent_address}")
+
+    threading.Thread(target=_warm_up, args=(brain,), daemon=True).start()
+
+    if "CAPTURE_REGION" not in _runtime_overrides:
+        print("Select capture region (drag), right-click for full screen, Escape to quit.")
+        region_str, exit_code = _run_select_region()
+
+        if exit_code == 2:
+            print("Cancelled.")
+            raise SystemExit(0)
+
+        if region_str:
+            print(f"Region selected: {region_str}")
+            _runtime_overrides["CAPTURE_REGION"] = region_str
+            _runtime_overrides["CAPTURE_WIDTH"] = NO_RESIZE
+            _runtime_overrides["CAPTURE_HEIGHT"] = NO_RESIZE
+        else:
+            print("Full screen mode.")
+            _runtime_overrides["CAPTURE_REGION"] = ""
+
+    getattr(franz, "_bind_frame_source")(lambda max_age: _current_frame(brain, max_age))
+    getattr(franz, "_bind_vlm")(
+        lambda request: _vlm_request(brain, request),
+        int(_cfg(brain, "VLM_MAX_CONCURRENCY", VLM_MAX_CONCURRENCY)),
+    )
+    getattr(franz, "_bind_similar")(SCREENS.nearest)
+    ENCODING_BUDGET.limit = int(_cfg(brain, "FRAME_ENCODING_BUDGET", ENCODING_BUDGET.limit))
+    PNG_STRIPES.configure(
+        int(_cfg(brain, "PNG_THREADS", PNG_STRIPES.threads)),
+        int(_cfg(brain, "PNG_STRIPE_ROWS", PNG_STRIPES.stripe_rows)),
+    )
+    HISTORY.max_frames = int(_cfg(brain, "HISTORY_MAX_FRAMES", HISTORY.max_frames))
+    HISTORY.max_bytes = int(_cfg(brain, "HISTORY_MAX_BYTES", HISTORY.max_bytes))
 
     session: SessionLog = SessionLog.create()
     host: str = str(_cfg(brain, "SERVER_HOST", "127.0.0.1"))
@@ -508,13 +1762,28 @@ def main() -> None:
     print(f"VLM: {_cfg(brain, 'VLM_ENDPOINT_URL', '?')}")
     print(f"Region: {_cfg(brain, 'CAPTURE_REGION', '') or 'full screen'}")
     print(f"Session: {session.session_dir}")
+    if bool(_cfg(brain, "SESSION_CATALOG", True)):
+        session.catalog = SessionCatalog(CATALOG_PATH)
+    if bool(_cfg(brain, "RECORD_APNG", False)):
+        session.recorder = SessionRecorder(
+            session.session_dir,
+            int(_cfg(brain, "RECORD_KEYFRAME_INTERVAL", RECORD_KEYFRAME_INTERVAL)),
+            int(_cfg(brain, "RECORD_SEGMENT_BYTES", RECORD_SEGMENT_BYTES)),
+            float(_cfg(brain, "RECORD_SEGMENT_SECONDS", RECORD_SEGMENT_SECONDS)),
+        )
+    if bool(_cfg(brain, "SCREEN_INDEX", True)):
+        SCREENS.open(session.session_dir / SCREENS_FILE)
+        earlier_screens: int = _load_screen_history(session, int(_cfg(brain, "SCREEN_INDEX_SESSIONS", 0)))
+        if earlier_screens:
+            print(f"Screens: {earlier_screens} from earlier sessions")
 
+    _publish_state()
     engine: threading.Thread = threading.Thread(
-        target=_engine_loop, args=(brain, franz, session), daemon=True,
+        target=_engine_loop, args=(brain, franz, session, brain_file), daemon=True,
     )
     engine.start()
 
-    server: http.server.HTTPServer = http.server.HTTPServer((host, port), FranzHandler)
+    server: http.server.ThreadingHTTPServer = http.server.ThreadingHTTPServer((host, port), FranzHandler)
     print(f"Running at http://{host}:{port}")
 
     try:
@@ -522,6 +1791,10 @@ def main() -> None:
     except KeyboardInterrupt:
         print("\nStopping.")
         server.shutdown()
+        if session.recorder is not None:
+            session.recorder.close()
+        if session.catalog is not None:
+            session.catalog.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+import heapq
+import itertools
+import json
+import threading
+from pathlib import Path
+
+
+SCREENS_FILE: str = "screens.jsonl"
+HASH_CHUNKS: int = 4
+HASH_CHUNK_BITS: int = 16
+HASH_CHUNK_MASK: int = (1 << HASH_CHUNK_BITS) - 1
+HASH_SCAN_RADIUS: int = 4
+
+
+class HashIndex:
+    def __init__(self) -> None:
+        self._hashes: list[int] = []
+        self._values: list[list[object]] = []
+        self._ids: dict[int, int] = {}
+        self._chunks: list[dict[int, list[int]]] = [{} for _ in range(HASH_CHUNKS)]
+        self._masks: dict[int, list[int]] = {}
+        self.size: int = 0
+
+    def add(self, value_hash: int, value: object) -> None:
+        self.size += 1
+        node: int | None = self._ids.get(value_hash)
+        if node is not None:
+            self._values[node].append(value)
+            return
+        node = len(self._hashes)
+        self._ids[value_hash] = node
+        self._hashes.append(value_hash)
+        self._values.append([value])
+        for chunk, table in enumerate(self._chunks):
+            table.setdefault((value_hash >> (chunk * HASH_CHUNK_BITS)) & HASH_CHUNK_MASK, []).append(node)
+
+    def _chunk_masks(self, radius: int) -> list[int]:
+        masks: list[int] | None = self._masks.get(radius)
+        if masks is None:
+            masks = [
+                sum(1 << bit for bit in bits)
+                for count in range(radius + 1)
+                for bits in itertools.combinations(range(HASH_CHUNK_BITS), count)
+            ]
+            self._masks[radius] = masks
+        return masks
+
+    def search(self, value_hash: int, max_distance: int) -> list[tuple[int, list[object]]]:
+        radius: int = max_distance // HASH_CHUNKS
+        candidates: set[int] = set()
+        if radius >= HASH_SCAN_RADIUS:
+            candidates.update(range(len(self._hashes)))
+        else:
+            masks: list[int] = self._chunk_masks(radius)
+            for chunk, table in enumerate(self._chunks):
+                key: int = (value_hash >> (chunk * HASH_CHUNK_BITS)) & HASH_CHUNK_MASK
+                for mask in masks:
+                    nodes: list[int] | None = table.get(key ^ mask)
+                    if nodes is not None:
+                        candidates.update(nodes)
+        found: list[tuple[int, list[object]]] = []
+        for node in candidates:
+            distance: int = (self._hashes[node] ^ value_hash).bit_count()
+            if distance <= max_distance:
+                found.append((distance, self._values[node]))
+        return found
+
+
+class ScreenRecord:
+    __slots__ = ("session", "turn", "screen_hash", "after_hash", "actions_json", "text")
+
+    def __init__(
+        self, session: str, turn: int, screen_hash: int, after_hash: int | None, actions_json: bytes, text: str,
+    ) -> None:
+        self.session: str = session
+        self.turn: int = turn
+        self.screen_hash: int = screen_hash
+        self.after_hash: int | None = after_hash
+        self.actions_json: bytes = actions_json
+        self.text: str = text
+
+    def to_dict(self) -> dict[str, object]:
+        return {
+            "session": self.session,
+            "turn": self.turn,
+            "hash": f"{self.screen_hash:016x}",
+            "after": f"{self.after_hash:016x}" if self.after_hash is not None else "",
+            "changed": (self.screen_hash ^ self.after_hash).bit_count() if self.after_hash is not None else -1,
+            "actions": json.loads(self.actions_json),
+            "text": self.text,
+        }
+
+
+class ScreenIndex:
+    def __init__(self) -> None:
+        self._buckets: HashIndex = HashIndex()
+        self._path: Path | None = None
+        self._lock: threading.Lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._buckets.size
+
+    def open(self, path: Path) -> None:
+        self._path = path
+
+    def load(self, path: Path) -> int:
+        loaded: int = 0
+        with path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    item: dict[str, object] = json.loads(line)
+                    record: ScreenRecord = ScreenRecord(
+                        str(item["session"]), int(item["turn"]), int(str(item["hash"]), 16),
+                        int(str(item["after"]), 16) if item["after"] else None,
+                        json.dumps(item["actions"], ensure_ascii=False).encode("utf-8"), str(item["text"]),
+                    )
+                except (ValueError, KeyError, TypeError):
+                    continue
+                with self._lock:
+                    self._buckets.add(record.screen_hash, record)
+                loaded += 1
+        return loaded
+
+    def add(self, record: ScreenRecord) -> None:
+        with self._lock:
+            self._buckets.add(record.screen_hash, record)
+        if self._path is not None:
+            with self._path.open("a", encoding="utf-8") as handle:
+                handle.write(json.dumps(record.to_dict(), ensure_ascii=False) + "\n")
+
+    def nearest(self, screen_hash: int, k: int, max_distance: int) -> list[dict[str, object]]:
+        with self._lock:
+            found: list[tuple[int, list[object]]] = self._buckets.search(screen_hash, max_distance)
+        ranked: list[tuple[int, ScreenRecord]] = heapq.nsmallest(
+            k, ((distance, record) for distance, records in found for record in reversed(records)),
+            key=lambda item: item[0],
+        )
+        return [{"distance": distance, **record.to_dict()} for distance, record in ranked]
@@ -1,10 +1,15 @@
 import ctypes
 import ctypes.wintypes as W
+import io
+import json
 import struct
 import sys
 import time
-import zlib
 from dataclasses import dataclass
+from typing import BinaryIO
+
+from imaging import bgra_to_png
+from imaging import pack_raw
 
 
 @dataclass(slots=True)
@@ -26,6 +31,7 @@ class Win32Config:
 
 
 NORM: int = 1000
+SERVE_HEADER: struct.Struct = struct.Struct(">iI")
 SRCCOPY: int = 0x00CC0020
 CAPTUREBLT: int = 0x40000000
 HALFTONE: int = 4
@@ -412,36 +418,10 @@ def _stretch_bgra(
     return result
 
 
-def _bgra_to_png(bgra: bytes, width: int, height: int) -> bytes:
-    stride: int = width * 4
-    source: memoryview = memoryview(bgra)
-    rows: bytearray = bytearray()
-    for yidx in range(height):
-        rows.append(0)
-        row: memoryview = source[yidx * stride:(yidx + 1) * stride]
-        for xoff in range(0, len(row), 4):
-            rows.extend((row[xoff + 2], row[xoff + 1], row[xoff + 0], 255))
-
-    def make_chunk(chunk_type: bytes, chunk_data: bytes) -> bytes:
-        combined: bytes = chunk_type + chunk_data
-        return (
-            struct.pack(">I", len(chunk_data))
-            + combined
-            + struct.pack(">I", zlib.crc32(combined) & 0xFFFFFFFF)
-        )
-
-    return (
-        b"\x89PNG\r\n\x1a\n"
-        + make_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
-        + make_chunk(b"IDAT", zlib.compress(bytes(rows), 6))
-        + make_chunk(b"IEND", b"")
-    )
-
-
-def _do_capture(region_str: str, width: int, height: int) -> bytes:
+def _do_capture(region_str: str, width: int, height: int) -> tuple[bytes, int, int] | None:
     captured: tuple[bytes, int, int] | None = _capture_full_screen()
     if captured is None:
-        return b""
+        return None
     bgra: bytes = captured[0]
     src_w: int = captured[1]
     src_h: int = captured[2]
@@ -457,7 +437,7 @@ def _do_capture(region_str: str, width: int, height: int) -> bytes:
             bgra = stretched
             src_w = width
             src_h = height
-    return _bgra_to_png(bgra, src_w, src_h)
+    return bgra, src_w, src_h
 
 
 def _resolve_screen_pos(norm_x: int, norm_y: int, region_str: str) -> tuple[int, int]:
@@ -799,13 +779,7 @@ def _do_select_region() -> tuple[str, int]:
     return "", _selector_exit_code
 
 
-def main() -> None:
-    args: list[str] = sys.argv[1:]
-    if not args:
-        sys.stderr.write("usage: python win32.py <command> [options]\n")
-        sys.stderr.flush()
-        raise SystemExit(1)
-
+def _run_command(args: list[str], out: BinaryIO) -> int:
     command: str = args[0]
 
     def get_arg(name: str, default: str = "") -> str:
@@ -820,9 +794,13 @@ def main() -> None:
             region_arg: str = get_arg("region", "")
             width_arg: int = int(get_arg("width", str(CONFIG.default_capture_width)))
             height_arg: int = int(get_arg("height", str(CONFIG.default_capture_height)))
-            png_bytes: bytes = _do_capture(region_arg, width_arg, height_arg)
-            sys.stdout.buffer.write(png_bytes)
-            sys.stdout.buffer.flush()
+            format_arg: str = get_arg("format", "png")
+            captured_img: tuple[bytes, int, int] | None = _do_capture(region_arg, width_arg, height_arg)
+            if captured_img is not None:
+                if format_arg == "raw":
+                    out.write(pack_raw(*captured_img))
+                else:
+                    out.write(bgra_to_png(*captured_img))
 
         case "click":
             pos_arg: str = get_arg("pos", "500,500")
@@ -872,22 +850,57 @@ def main() -> None:
         case "cursor_pos":
             region_val = get_arg("region", "")
             coords: str = _do_cursor_pos(region_val)
-            sys.stdout.write(coords + "\n")
-            sys.stdout.flush()
+            out.write((coords + "\n").encode("ascii"))
 
         case "select_region":
             region_result, code = _do_select_region()
             if code == EXIT_CANCEL:
-                raise SystemExit(EXIT_CANCEL)
+                return EXIT_CANCEL
             if region_result:
-                sys.stdout.write(region_result + "\n")
-                sys.stdout.flush()
-            raise SystemExit(EXIT_OK)
+                out.write((region_result + "\n").encode("ascii"))
 
         case _:
             sys.stderr.write(f"unknown command: {command}\n")
             sys.stderr.flush()
-            raise SystemExit(1)
+            return 1
+
+    return EXIT_OK
+
+
+def _serve() -> None:
+    requests: BinaryIO = sys.stdin.buffer
+    replies: BinaryIO = sys.stdout.buffer
+    for line in requests:
+        out: io.BytesIO = io.BytesIO()
+        try:
+            args: object = json.loads(line)
+            code: int = _run_command([str(arg) for arg in args], out) if isinstance(args, list) and args else 1
+        except Exception as exc:
+            sys.stderr.write(f"serve error: {type(exc).__name__}: {exc}\n")
+            sys.stderr.flush()
+            out = io.BytesIO()
+            code = 1
+        payload: bytes = out.getvalue()
+        replies.write(SERVE_HEADER.pack(code, len(payload)))
+        replies.write(payload)
+        replies.flush()
+
+
+def main() -> None:
+    args: list[str] = sys.argv[1:]
+    if not args:
+        sys.stderr.write("usage: python win32.py <command> [options]\n")
+        sys.stderr.flush()
+        raise SystemExit(1)
+
+    if args[0] == "serve":
+        _serve()
+        return
+
+    code: int = _run_command(args, sys.stdout.buffer)
+    sys.stdout.buffer.flush()
+    if code != EXIT_OK:
+        raise SystemExit(code)
 
 
 if __name__ == "__main__":